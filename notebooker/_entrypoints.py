@@ -6,12 +6,22 @@ import click
 
 from notebooker import notebook_templates_example
 from notebooker.version import __version__
-from notebooker.constants import DEFAULT_SERIALIZER, DEFAULT_MAILFROM_ADDRESS, DEFAULT_RUNNING_TIMEOUT
+from notebooker.constants import (
+    DEFAULT_KERNEL_MAX_RUNS,
+    DEFAULT_MAILFROM_ADDRESS,
+    DEFAULT_MEMORY_CACHE_SIZE_MB,
+    DEFAULT_RUNNING_TIMEOUT,
+    DEFAULT_SERIALIZER,
+)
 from notebooker.execute_notebook import execute_notebook_entrypoint
 from notebooker.serialization import SERIALIZER_TO_CLI_OPTIONS
 from notebooker.settings import BaseConfig, WebappConfig
 from notebooker.snapshot import snap_latest_successful_notebooks
-from notebooker.utils.cleanup import delete_old_reports
+from notebooker.utils.caching import CACHE_BACKENDS
+from notebooker.utils.cleanup import DEFAULT_CLEANUP_BATCH_SIZE, DEFAULT_CLEANUP_WORKERS, delete_old_reports
+from notebooker.utils.migrations import backfill_overrides_hash as backfill_overrides_hash_entrypoint
+from notebooker.utils.migrations import migrate_deleted_results as migrate_deleted_results_entrypoint
+from notebooker.utils.migrations import rebuild_summary as rebuild_summary_entrypoint
 from notebooker.web.app import main
 
 
@@ -130,6 +140,25 @@ def base_notebooker(
     default=filesystem_default_value("webcache"),
     help="Where the filesystem-based short-term cache stores its data.",
 )
+@click.option(
+    "--memory-cache-size-mb",
+    default=DEFAULT_MEMORY_CACHE_SIZE_MB,
+    type=int,
+    help="The size of the in-memory cache in front of the filesystem-based cache, which serves recently-used "
+    "results without reading them from disk. 0 disables it.",
+)
+@click.option(
+    "--cache-backend",
+    default="filesystem",
+    type=click.Choice(CACHE_BACKENDS),
+    help="Where the short-term cache is kept. With redis, webapp replicas which use the same --cache-redis-url "
+    "share one cache, and only one of them at a time refreshes it from storage.",
+)
+@click.option(
+    "--cache-redis-url",
+    default="",
+    help="When using --cache-backend redis, the URL of the Redis server, e.g. redis://localhost:6379/0",
+)
 @click.option(
     "--disable-scheduler",
     default=False,
@@ -156,6 +185,47 @@ def base_notebooker(
     help="This mode disables the ability to execute notebooks via REST or the webapp front-end. "
     "Useful if you only want to display results which were e.g. executed by an external application.",
 )
+@click.option(
+    "--worker-pool-size",
+    default=0,
+    type=int,
+    help="The number of long-lived worker processes, each with a pre-started kernel, which execute reports. "
+    "If 0 (the default), each report is executed in a new notebooker-cli subprocess.",
+)
+@click.option(
+    "--kernel-max-runs",
+    default=DEFAULT_KERNEL_MAX_RUNS,
+    type=int,
+    help="When using --worker-pool-size, the number of reports a kernel executes before it is recycled.",
+)
+@click.option(
+    "--pdf-pool-size",
+    default=0,
+    type=int,
+    help="When using --worker-pool-size, the number of processes which render PDFs separately from notebook "
+    "execution. Results are saved as soon as their HTML is ready and the PDF is attached once rendered. "
+    "If 0 (the default), PDFs are rendered before the result is saved.",
+)
+@click.option(
+    "--max-concurrent-jobs",
+    default=0,
+    type=int,
+    help="The maximum number of reports executing at once. Further reports are queued, with interactive requests "
+    "taking priority over scheduled runs. If 0 (the default), there is no limit.",
+)
+@click.option(
+    "--max-concurrent-jobs-per-report",
+    default=0,
+    type=int,
+    help="When using --max-concurrent-jobs, the maximum number of reports executing at once per report name.",
+)
+@click.option(
+    "--max-concurrent-jobs-per-user",
+    default=0,
+    type=int,
+    help="When using --max-concurrent-jobs, the maximum number of reports executing at once per user, "
+    "as identified by the X-Auth-Username header.",
+)
 @pass_config
 def start_webapp(
     config: BaseConfig,
@@ -163,20 +233,38 @@ def start_webapp(
     logging_level,
     debug,
     base_cache_dir,
+    memory_cache_size_mb,
+    cache_backend,
+    cache_redis_url,
     disable_scheduler,
     scheduler_mongo_database,
     scheduler_mongo_collection,
     readonly_mode,
+    worker_pool_size,
+    kernel_max_runs,
+    pdf_pool_size,
+    max_concurrent_jobs,
+    max_concurrent_jobs_per_report,
+    max_concurrent_jobs_per_user,
 ):
     web_config = WebappConfig.copy_existing(config)
     web_config.PORT = port
     web_config.LOGGING_LEVEL = logging_level
     web_config.DEBUG = debug
     web_config.CACHE_DIR = base_cache_dir
+    web_config.MEMORY_CACHE_SIZE_MB = memory_cache_size_mb
+    web_config.CACHE_BACKEND = cache_backend
+    web_config.CACHE_REDIS_URL = cache_redis_url
     web_config.DISABLE_SCHEDULER = disable_scheduler
     web_config.SCHEDULER_MONGO_DATABASE = scheduler_mongo_database
     web_config.SCHEDULER_MONGO_COLLECTION = scheduler_mongo_collection
     web_config.READONLY_MODE = readonly_mode
+    web_config.WORKER_POOL_SIZE = worker_pool_size
+    web_config.KERNEL_MAX_RUNS = kernel_max_runs
+    web_config.PDF_POOL_SIZE = pdf_pool_size
+    web_config.MAX_CONCURRENT_JOBS = max_concurrent_jobs
+    web_config.MAX_CONCURRENT_JOBS_PER_REPORT = max_concurrent_jobs_per_report
+    web_config.MAX_CONCURRENT_JOBS_PER_USER = max_concurrent_jobs_per_user
     return main(web_config)
 
 
@@ -228,6 +316,13 @@ def start_webapp(
     is_flag=True,
     help="If specified, the notebook template's output will be treated as a Reveal.js slideshow.",
 )
+@click.option(
+    "--parallelism",
+    default=1,
+    type=int,
+    help="When using --iterate-override-values-of, the number of processes across which the variants are executed. "
+    "Each variant is saved under its own job ID and a single summary email is sent. Defaults to 1 (serial).",
+)
 @pass_config
 def execute_notebook(
     config: BaseConfig,
@@ -246,6 +341,7 @@ def execute_notebook(
     scheduler_job_id,
     mailfrom,
     is_slideshow,
+    parallelism,
 ):
     if report_name is None:
         raise ValueError("Error! Please provide a --report-name.")
@@ -266,6 +362,7 @@ def execute_notebook(
         scheduler_job_id,
         mailfrom,
         is_slideshow=is_slideshow,
+        parallelism=parallelism,
     )
 
 
@@ -275,9 +372,20 @@ def execute_notebook(
     "--report-name", required=False, help="The name of the template to retrieve, relative to the template directory."
 )
 @click.option("--dry-run", is_flag=True, default=False, help="Show what would be deleted without actually deleting")
+@click.option(
+    "--batch-size",
+    default=DEFAULT_CLEANUP_BATCH_SIZE,
+    type=int,
+    help="The number of reports which are deleted together, with a few bulk queries per batch.",
+)
+@click.option("--workers", default=DEFAULT_CLEANUP_WORKERS, type=int, help="The number of batches deleted at once.")
 @pass_config
-def cleanup_old_reports(config: BaseConfig, days: int, report_name: Optional[str], dry_run: bool):
-    delete_old_reports(config, days_cutoff=days, report_name=report_name, dry_run=dry_run)
+def cleanup_old_reports(
+    config: BaseConfig, days: int, report_name: Optional[str], dry_run: bool, batch_size: int, workers: int
+):
+    delete_old_reports(
+        config, days_cutoff=days, report_name=report_name, dry_run=dry_run, batch_size=batch_size, workers=workers
+    )
 
 
 @base_notebooker.command()
@@ -289,5 +397,27 @@ def snapshot_latest_successful_notebooks(config: BaseConfig, report_name):
     snap_latest_successful_notebooks(config, report_name)
 
 
+@base_notebooker.command()
+@click.option(
+    "--batch-size", default=1000, type=int, help="The number of results which are updated in each database write."
+)
+@pass_config
+def backfill_overrides_hash(config: BaseConfig, batch_size: int):
+    backfill_overrides_hash_entrypoint(config, batch_size=batch_size)
+
+
+@base_notebooker.command()
+@pass_config
+def rebuild_summary(config: BaseConfig):
+    rebuild_summary_entrypoint(config)
+
+
+@base_notebooker.command()
+@click.option("--batch-size", default=1000, type=int, help="The number of deleted results which are moved together.")
+@pass_config
+def migrate_deleted_results(config: BaseConfig, batch_size: int):
+    migrate_deleted_results_entrypoint(config, batch_size=batch_size)
+
+
 if __name__ == "__main__":
     base_notebooker()
@@ -1,14 +1,18 @@
+import copy
 import datetime
 import logging
 import os
+from collections.abc import MutableMapping
 from enum import Enum, unique
-from typing import AnyStr, Optional
+from typing import Any, AnyStr, Optional
 
 import attr
 
 SUBMISSION_TIMEOUT = 3
 DEFAULT_RUNNING_TIMEOUT = 60
+DEFAULT_KERNEL_MAX_RUNS = 20
 DEFAULT_RESULT_LIMIT = 100
+MAX_RESULT_PAGE_SIZE = 1000
 CANCEL_MESSAGE = "The webapp shut down while this job was running. Please resubmit with the same parameters."
 TEMPLATE_DIR_SEPARATOR = "^"
 DEFAULT_SERIALIZER = "PyMongoResultSerializer"
@@ -18,6 +22,9 @@ logger = logging.getLogger(__name__)
 DEFAULT_DATABASE_NAME = "notebooker"
 DEFAULT_RESULT_COLLECTION_NAME = "NOTEBOOK_OUTPUT"
 DEFAULT_MONGO_HOST = "localhost"
+DEFAULT_GRIDFS_COMPRESSION = "none"
+DEFAULT_STDOUT_COLLECTION_SIZE_MB = 1024
+DEFAULT_MEMORY_CACHE_SIZE_MB = 64
 
 # Another candidate would be notebooker@example.com. However, using localhost means that, worst case scenario,
 # the user will end up trying to send a reply to themselves, whereas with example.com it could end up in IANA's
@@ -72,6 +79,54 @@ FORBIDDEN_INPUT_CHARS = list('"')
 FORBIDDEN_CHAR_ERR_MSG = "This report has an invalid input ({}) - it must not contain any of {}."
 
 
+class LazyPayload(object):
+    """
+    A placeholder for a heavy part of a result, e.g. its PDF, which is only fetched from storage when it is first
+    accessed. Result objects resolve these transparently, so code using a result never sees one.
+    """
+
+    def load(self) -> Any:
+        raise NotImplementedError()
+
+
+class LazyPayloadDict(MutableMapping):
+    """A dict whose values may be LazyPayloads, each of which is loaded when its key is first looked up."""
+
+    def __init__(self, data=None):
+        self._data = dict(data or {})
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        if isinstance(value, LazyPayload):
+            value = self._data[key] = value.load()
+        return value
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"LazyPayloadDict({list(self._data)})"
+
+    def __copy__(self):
+        # The copy loads its LazyPayloads, including those of nested LazyPayloadDicts, without changing this one.
+        copied = LazyPayloadDict()
+        for key, value in self._data.items():
+            copied._data[key] = copy.copy(value) if isinstance(value, LazyPayloadDict) else value
+        return copied
+
+
 @attr.s()
 class NotebookResultBase(object):
     job_id = attr.ib()
@@ -89,6 +144,37 @@ class NotebookResultBase(object):
     email_subject = attr.ib(default=None)
     is_slideshow = attr.ib(default=False)
 
+    def __attrs_post_init__(self):
+        # The payload of a result loaded from storage may be LazyPayloads. They are set aside, so that __getattr__
+        # loads each on first access, while reading any other field costs no more than usual.
+        lazy_payloads = {name: value for name, value in self.__dict__.items() if isinstance(value, LazyPayload)}
+        for name in lazy_payloads:
+            del self.__dict__[name]
+        if lazy_payloads:
+            self.__dict__["_lazy_payloads"] = lazy_payloads
+
+    def __getattr__(self, name):
+        # Only called for attributes which aren't set, such as the LazyPayloads which haven't been loaded yet.
+        lazy_payloads = self.__dict__.get("_lazy_payloads", {})
+        if name not in lazy_payloads:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        value = lazy_payloads[name].load()
+        setattr(self, name, value)
+        del lazy_payloads[name]
+        return value
+
+    def __copy__(self):
+        # A shallow copy with its own dicts, so that its payload loads lazily without changing this result, e.g. a
+        # result in the memory cache.
+        copied = object.__new__(type(self))
+        for name, value in self.__dict__.items():
+            copied.__dict__[name] = copy.copy(value) if isinstance(value, (LazyPayloadDict, dict)) else value
+        return copied
+
+    def is_loaded(self, name: str) -> bool:
+        """Whether a part of the payload has been read from storage, i.e. is not a LazyPayload which is yet to load."""
+        return name not in self.__dict__.get("_lazy_payloads", {})
+
     def saveable_output(self):
         out = attr.asdict(self)
         out["status"] = self.status.value
@@ -168,13 +254,13 @@ class NotebookResultComplete(NotebookResultBase):
     def html_resources(self):
         """We have to save the raw images using Mongo GridFS - figure out where they will go here"""
         resources = {}
-        for k, v in self.raw_html_resources.items():
+        for k in self.raw_html_resources:
             if k == "outputs":
-                resources[k] = list(v)
+                resources[k] = list(self.raw_html_resources[k])
             elif k == "inlining":
                 continue
             else:
-                resources[k] = v
+                resources[k] = self.raw_html_resources[k]
         return resources
 
     def saveable_output(self):
@@ -1,9 +1,11 @@
 from __future__ import unicode_literals
 
+import multiprocessing
 import threading
 import time
 
 import copy
+import functools
 import datetime
 import json
 import logging
@@ -11,7 +13,8 @@ import os
 import subprocess
 import traceback
 import uuid
-from typing import Any, AnyStr, Dict, List, Optional, Union
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, AnyStr, Callable, Dict, List, Optional, Union
 
 import papermill as pm
 import sys
@@ -25,9 +28,23 @@ from notebooker.constants import (
 )
 from notebooker.serialization.serialization import get_serializer_from_cls, initialize_serializer_from_config
 from notebooker.settings import BaseConfig
-from notebooker.utils.conversion import _output_ipynb_name, generate_ipynb_from_py, ipython_to_html, ipython_to_pdf
+from notebooker.utils.conversion import (
+    _output_ipynb_name,
+    generate_ipynb_from_py,
+    ipython_to_html_variants,
+    ipython_to_pdf,
+)
 from notebooker.utils.filesystem import initialise_base_dirs
-from notebooker.utils.notebook_execution import _output_dir, send_result_email
+from notebooker.utils.job_events import job_events
+from notebooker.utils.stdout_buffer import StdoutBuffer
+from notebooker.utils.notebook_execution import (
+    VariantOutcome,
+    _output_dir,
+    send_result_email,
+    send_variant_summary_email,
+)
+from notebooker.job_queue import QUEUE_HEARTBEAT_TIMEOUT_SECONDS, JobQueue, Lane, QueuedJob, get_job_queue
+from notebooker.worker_pool import get_worker_pool
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -54,6 +71,8 @@ def _run_checks(
     scheduler_job_id: Optional[str] = None,
     mailfrom: Optional[str] = None,
     is_slideshow: bool = False,
+    kernel_manager: Optional[Any] = None,
+    defer_pdf: bool = False,
 ) -> NotebookResultComplete:
     """
     This is the actual method which executes a notebook, whether running in the webapp or via the entrypoint.
@@ -93,6 +112,10 @@ def _run_checks(
         If available, this will be the email used in the From header.
     is_slideshow: bool
         Whether or not the output of this should use the equivalent of nbconvert --to slides
+    kernel_manager : `Optional[jupyter_client.KernelManager]`
+        If given, the notebook is executed on this already-running kernel, which is left running afterwards.
+    defer_pdf : `bool`
+        If True, the PDF is not rendered here; the caller is responsible for rendering it and attaching it later.
 
     Returns
     -------
@@ -121,6 +144,7 @@ def _run_checks(
         working_dir = os.path.dirname(os.path.join(py_template_dir, template_name))
         logger.info("Setting working directory for execution {}".format(working_dir))
 
+    engine_kwargs = {"km": kernel_manager} if kernel_manager is not None else {}
     pm.execute_notebook(
         ipynb_raw_path,
         ipynb_executed_path,
@@ -128,14 +152,19 @@ def _run_checks(
         log_output=True,
         prepare_only=prepare_only,
         cwd=working_dir,
+        **engine_kwargs,
     )
     with open(ipynb_executed_path, "r") as f:
         raw_executed_ipynb = f.read()
 
     logger.info("Saving output notebook as HTML from {}".format(ipynb_executed_path))
-    html, resources = ipython_to_html(ipynb_executed_path, job_id, is_slideshow=is_slideshow)
-    email_html, _ = ipython_to_html(ipynb_executed_path, job_id, hide_code=hide_code, is_slideshow=is_slideshow)
-    pdf = ipython_to_pdf(raw_executed_ipynb, report_title, hide_code=hide_code) if generate_pdf_output else ""
+    html, email_html, resources = ipython_to_html_variants(
+        raw_executed_ipynb, job_id, hide_code=hide_code, is_slideshow=is_slideshow
+    )
+    if generate_pdf_output and not defer_pdf:
+        pdf = ipython_to_pdf(raw_executed_ipynb, report_title, hide_code=hide_code)
+    else:
+        pdf = ""
 
     notebook_result = NotebookResultComplete(
         job_id=job_id,
@@ -184,6 +213,8 @@ def run_report(
     scheduler_job_id=None,
     mailfrom=None,
     is_slideshow=False,
+    kernel_manager=None,
+    defer_pdf=False,
 ):
     job_id = job_id or str(uuid.uuid4())
     stop_execution = os.getenv("NOTEBOOKER_APP_STOPPING")
@@ -222,6 +253,8 @@ def run_report(
             scheduler_job_id=scheduler_job_id,
             mailfrom=mailfrom,
             is_slideshow=is_slideshow,
+            kernel_manager=kernel_manager,
+            defer_pdf=defer_pdf,
         )
         logger.info("Successfully got result.")
         result_serializer.save_check_result(result)
@@ -253,6 +286,7 @@ def run_report(
         result_serializer.save_check_result(result)
         logger.info("Error result saved to mongo successfully.")
         if attempts_remaining > 0:
+            # The retry uses a fresh kernel, in case the failure left a pre-started kernel in a bad state.
             logger.info("Retrying report.")
             return run_report(
                 job_submit_time,
@@ -276,6 +310,7 @@ def run_report(
                 scheduler_job_id=scheduler_job_id,
                 mailfrom=mailfrom,
                 is_slideshow=is_slideshow,
+                defer_pdf=defer_pdf,
             )
         else:
             logger.info("Abandoning attempt to run report. It failed too many times.")
@@ -348,6 +383,133 @@ def _get_overrides(overrides_as_json: AnyStr, iterate_override_values_of: Option
     return all_overrides
 
 
+def _run_report_variant(
+    config: BaseConfig,
+    job_id: str,
+    start_time: datetime.datetime,
+    report_name: str,
+    overrides: Dict[AnyStr, Any],
+    n_retries: int,
+    **kwargs,
+) -> Optional[str]:
+    """
+    Runs inside a fan-out worker process and executes a single set of overrides. No email is sent for the
+    individual variant; the parent sends one summary for all of them instead.
+    Returns the error info if the report failed, otherwise None.
+    """
+    output_dir, template_dir, _ = initialise_base_dirs(output_dir=config.OUTPUT_DIR, template_dir=config.TEMPLATE_DIR)
+    result_serializer = initialize_serializer_from_config(config)
+    result = run_report(
+        start_time,
+        report_name,
+        overrides,
+        result_serializer,
+        job_id=job_id,
+        output_base_dir=output_dir,
+        template_base_dir=template_dir,
+        attempts_remaining=n_retries - 1,
+        notebooker_disable_git=config.NOTEBOOKER_DISABLE_GIT,
+        execute_at_origin=config.EXECUTE_AT_ORIGIN,
+        py_template_base_dir=config.PY_TEMPLATE_BASE_DIR,
+        py_template_subdir=config.PY_TEMPLATE_SUBDIR,
+        **kwargs,
+    )
+    if isinstance(result, NotebookResultError):
+        return result.error_info or "Notebook execution failed."
+    return None
+
+
+def _execute_variants_in_parallel(
+    config: BaseConfig,
+    start_time: datetime.datetime,
+    report_name: str,
+    all_overrides: List[Dict[AnyStr, Any]],
+    parallelism: int,
+    job_id: str,
+    mailto: str,
+    error_mailto: str,
+    email_subject: str,
+    mailfrom: Optional[str],
+    **kwargs,
+) -> List[VariantOutcome]:
+    """
+    Executes each set of overrides as its own job across a pool of processes. The first variant keeps the given
+    job_id so that a caller which is tracking it (e.g. the webapp) sees a result; the others get new job_ids.
+    A failing variant does not stop the others: failures are collected, a single summary email is sent and an
+    exception is raised once every variant has finished.
+    """
+    job_ids = [job_id] + [str(uuid.uuid4()) for _ in all_overrides[1:]]
+    # The new job_ids are saved as submitted, so that each variant can be looked up while it waits for a process.
+    result_serializer = get_serializer_from_cls(config.SERIALIZER_CLS, **config.SERIALIZER_CONFIG)
+    for variant_job_id, overrides in zip(job_ids[1:], all_overrides[1:]):
+        result_serializer.save_check_stub(
+            variant_job_id,
+            report_name,
+            report_title=kwargs.get("report_title"),
+            job_start_time=start_time,
+            status=JobStatus.SUBMITTED,
+            overrides=overrides,
+            mailto=mailto,
+            error_mailto=error_mailto,
+            generate_pdf_output=kwargs.get("generate_pdf_output", True),
+            hide_code=kwargs.get("hide_code", False),
+            scheduler_job_id=kwargs.get("scheduler_job_id"),
+            is_slideshow=kwargs.get("is_slideshow", False),
+            email_subject=email_subject,
+            mailfrom=mailfrom,
+        )
+    outcomes = []
+    n_workers = min(parallelism, len(all_overrides))
+    logger.info("Executing %d variants of %s across %d processes.", len(all_overrides), report_name, n_workers)
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {
+            executor.submit(
+                _run_report_variant,
+                config,
+                variant_job_id,
+                start_time,
+                report_name,
+                overrides,
+                mailto=mailto,
+                error_mailto=error_mailto,
+                email_subject=email_subject,
+                mailfrom=mailfrom,
+                **kwargs,
+            ): (variant_job_id, overrides)
+            for variant_job_id, overrides in zip(job_ids, all_overrides)
+        }
+        for future in as_completed(futures):
+            variant_job_id, overrides = futures[future]
+            try:
+                error_info = future.result()
+            except Exception:
+                error_info = traceback.format_exc()
+            if error_info:
+                logger.warning("Variant %s (%s) failed: %s", variant_job_id, overrides, error_info)
+            else:
+                logger.info("Variant %s (%s) completed.", variant_job_id, overrides)
+            outcomes.append(VariantOutcome(variant_job_id, overrides, error_info))
+
+    # Report the outcomes in the order in which the variants were given rather than the order in which they finished.
+    outcomes.sort(key=lambda outcome: job_ids.index(outcome.job_id))
+    send_variant_summary_email(
+        outcomes,
+        report_title=kwargs["report_title"],
+        mailto=mailto,
+        error_mailto=error_mailto,
+        email_subject=email_subject,
+        mailfrom=mailfrom or config.DEFAULT_MAILFROM,
+    )
+    failures = [outcome for outcome in outcomes if outcome.error_info]
+    if failures:
+        raise Exception(
+            "{} of {} variants failed: {}".format(
+                len(failures), len(outcomes), ", ".join(f"{o.job_id} ({o.overrides})" for o in failures)
+            )
+        )
+    return outcomes
+
+
 def execute_notebook_entrypoint(
     config: BaseConfig,
     report_name: str,
@@ -365,6 +527,7 @@ def execute_notebook_entrypoint(
     scheduler_job_id: Optional[str],
     mailfrom: Optional[str],
     is_slideshow: bool,
+    parallelism: int = 1,
 ):
     report_title = report_title or report_name
     output_dir, template_dir, _ = initialise_base_dirs(output_dir=config.OUTPUT_DIR, template_dir=config.TEMPLATE_DIR)
@@ -399,8 +562,29 @@ def execute_notebook_entrypoint(
     logger.info("py_template_subdir = %s", py_template_subdir)
     logger.info("serializer_cls = %s", config.SERIALIZER_CLS)
     logger.info("serializer_config = %s", config.SERIALIZER_CONFIG)
+    logger.info("parallelism = %s", parallelism)
 
     logger.info("Calculated overrides are: %s", str(all_overrides))
+    if parallelism > 1 and len(all_overrides) > 1:
+        return _execute_variants_in_parallel(
+            config,
+            start_time,
+            report_name,
+            all_overrides,
+            parallelism,
+            report_title=report_title,
+            job_id=job_id,
+            n_retries=n_retries,
+            mailto=mailto,
+            error_mailto=error_mailto,
+            email_subject=email_subject,
+            generate_pdf_output=pdf_output,
+            hide_code=hide_code,
+            prepare_only=prepare_notebook_only,
+            scheduler_job_id=scheduler_job_id,
+            mailfrom=mailfrom,
+            is_slideshow=is_slideshow,
+        )
     result_serializer = get_serializer_from_cls(config.SERIALIZER_CLS, **config.SERIALIZER_CONFIG)
     results = []
     for overrides in all_overrides:
@@ -466,76 +650,68 @@ def _monitor_stderr(process, job_id, serializer_cls, serializer_args):
     stderr = []
     # Unsure whether flask app contexts are thread-safe; just reinitialise the serializer here.
     result_serializer = get_serializer_from_cls(serializer_cls, **serializer_args)
-    while True:
-        line = process.stderr.readline().decode("utf-8")
-        if line != "":
-            stderr.append(line)
-            logger.info(line)  # So that we have it in the log, not just in memory.
-            result_serializer.update_stdout(job_id, new_lines=[line])
-        elif process.poll() is not None:
-            result_serializer.update_stdout(job_id, stderr, replace=True)
-            break
+    # Lines are written in batches, which between them hold the whole of stdout by the time the process exits.
+    with StdoutBuffer(result_serializer, job_id, on_flush=functools.partial(job_events.publish, job_id)) as buffer:
+        while True:
+            line = process.stderr.readline().decode("utf-8")
+            if line != "":
+                stderr.append(line)
+                logger.info(line)  # So that we have it in the log, not just in memory.
+                buffer.append(line)
+            elif process.poll() is not None:
+                break
+    # The job's final status has been saved by the time its process exits.
+    job_events.publish(job_id)
     return "".join(stderr)
 
 
-def run_report_in_subprocess(
+def _start_report_execution(
     base_config,
+    result_serializer,
+    job_id,
     report_name,
     report_title,
     mailto,
     error_mailto,
     overrides,
     *,
-    hide_code=False,
-    generate_pdf_output=False,
-    prepare_only=False,
-    scheduler_job_id=None,
-    run_synchronously=False,
-    mailfrom=None,
-    email_subject=None,
-    n_retries=3,
-    is_slideshow=False,
-) -> str:
+    hide_code,
+    generate_pdf_output,
+    prepare_only,
+    scheduler_job_id,
+    run_synchronously,
+    mailfrom,
+    email_subject,
+    n_retries,
+    is_slideshow,
+) -> Callable[[], Any]:
     """
-    Execute the Notebooker report in a subprocess.
-    Uses a subprocess to execute the report asynchronously, which is identical to the non-webapp entrypoint.
-    :param base_config: `BaseConfig` A set of configuration options which specify serialisation parameters.
-    :param report_name: `str` The report which we are executing
-    :param report_title: `str` The user-specified title of the report
-    :param mailto: `Optional[str]` Who the results will be emailed to
-    :param error_mailto: `Optional[str]` Who the errors will be emailed to
-    :param overrides: `Optional[Dict[str, Any]]` The parameters to be passed into the report
-    :param generate_pdf_output: `bool` Whether we're generating a PDF. Defaults to False.
-    :param prepare_only: `bool` Whether to do everything except execute the notebook. Useful for testing.
-    :param scheduler_job_id: `Optional[str]` if the job was triggered from the scheduler, this is the scheduler's job id
-    :param run_synchronously: `bool` If True, then we will join the stderr monitoring thread until the job has completed
-    :param mailfrom: `str` if passed, then this string will be used in the from field
-    :param email_subject: `str` if passed, then this string will be used in the email subject
-    :param n_retries: The number of retries to attempt.
-    :param is_slideshow: Whether the notebook is a reveal.js slideshow or not.
-    :return: The unique job_id.
+    Starts executing a report whose stub has already been saved, either in the worker pool or in a subprocess.
+    :return: A function which blocks until the execution has finished.
     """
-    if error_mailto is None:
-        error_mailto = ""
-    job_id = str(uuid.uuid4())
-    job_start_time = datetime.datetime.now()
-    result_serializer = initialize_serializer_from_config(base_config)
-    result_serializer.save_check_stub(
-        job_id,
-        report_name,
-        report_title=report_title,
-        job_start_time=job_start_time,
-        status=JobStatus.SUBMITTED,
-        overrides=overrides,
-        mailto=mailto,
-        error_mailto=error_mailto,
-        generate_pdf_output=generate_pdf_output,
-        hide_code=hide_code,
-        scheduler_job_id=scheduler_job_id,
-        is_slideshow=is_slideshow,
-        email_subject=email_subject,
-        mailfrom=mailfrom,
-    )
+    worker_pool = get_worker_pool()
+    if worker_pool is not None:
+        future = worker_pool.submit(
+            base_config,
+            job_id,
+            datetime.datetime.now(),
+            report_name,
+            n_retries=n_retries,
+            overrides=overrides,
+            report_title=report_title or report_name,
+            mailto=mailto,
+            error_mailto=error_mailto,
+            email_subject=email_subject,
+            generate_pdf_output=generate_pdf_output,
+            hide_code=hide_code,
+            prepare_only=prepare_only,
+            scheduler_job_id=scheduler_job_id,
+            mailfrom=mailfrom,
+            is_slideshow=is_slideshow,
+        )
+        if run_synchronously:
+            future.result()
+        return future.result
 
     command = (
         [
@@ -594,5 +770,166 @@ def run_report_in_subprocess(
         p.poll()
     if p.returncode:
         raise RuntimeError(f"The report execution failed with exit code {p.returncode}")
+    return p.wait
+
 
+def run_report_in_subprocess(
+    base_config,
+    report_name,
+    report_title,
+    mailto,
+    error_mailto,
+    overrides,
+    *,
+    hide_code=False,
+    generate_pdf_output=False,
+    prepare_only=False,
+    scheduler_job_id=None,
+    run_synchronously=False,
+    mailfrom=None,
+    email_subject=None,
+    n_retries=3,
+    is_slideshow=False,
+    submitted_by=None,
+) -> str:
+    """
+    Execute the Notebooker report in a subprocess.
+    Uses a subprocess to execute the report asynchronously, which is identical to the non-webapp entrypoint.
+    If the webapp has started a pool of warm-kernel workers, the report is dispatched to that pool instead.
+    If the webapp has started a job queue, the report waits as SUBMITTED in the queue until a slot is free.
+    :param base_config: `BaseConfig` A set of configuration options which specify serialisation parameters.
+    :param report_name: `str` The report which we are executing
+    :param report_title: `str` The user-specified title of the report
+    :param mailto: `Optional[str]` Who the results will be emailed to
+    :param error_mailto: `Optional[str]` Who the errors will be emailed to
+    :param overrides: `Optional[Dict[str, Any]]` The parameters to be passed into the report
+    :param generate_pdf_output: `bool` Whether we're generating a PDF. Defaults to False.
+    :param prepare_only: `bool` Whether to do everything except execute the notebook. Useful for testing.
+    :param scheduler_job_id: `Optional[str]` if the job was triggered from the scheduler, this is the scheduler's job id
+    :param run_synchronously: `bool` If True, then we will join the stderr monitoring thread until the job has completed
+    :param mailfrom: `str` if passed, then this string will be used in the from field
+    :param email_subject: `str` if passed, then this string will be used in the email subject
+    :param n_retries: The number of retries to attempt.
+    :param is_slideshow: Whether the notebook is a reveal.js slideshow or not.
+    :param submitted_by: `Optional[str]` The user who requested this run, used for per-user limits of the job queue.
+    :return: The unique job_id.
+    """
+    if error_mailto is None:
+        error_mailto = ""
+    job_id = str(uuid.uuid4())
+    job_start_time = datetime.datetime.now()
+    result_serializer = initialize_serializer_from_config(base_config)
+    result_serializer.save_check_stub(
+        job_id,
+        report_name,
+        report_title=report_title,
+        job_start_time=job_start_time,
+        status=JobStatus.SUBMITTED,
+        overrides=overrides,
+        mailto=mailto,
+        error_mailto=error_mailto,
+        generate_pdf_output=generate_pdf_output,
+        hide_code=hide_code,
+        scheduler_job_id=scheduler_job_id,
+        is_slideshow=is_slideshow,
+        email_subject=email_subject,
+        mailfrom=mailfrom,
+    )
+    start = functools.partial(
+        _start_report_execution,
+        base_config,
+        result_serializer,
+        job_id,
+        report_name,
+        report_title,
+        mailto,
+        error_mailto,
+        overrides,
+        hide_code=hide_code,
+        generate_pdf_output=generate_pdf_output,
+        prepare_only=prepare_only,
+        scheduler_job_id=scheduler_job_id,
+        mailfrom=mailfrom,
+        email_subject=email_subject,
+        n_retries=n_retries,
+        is_slideshow=is_slideshow,
+    )
+
+    job_queue = get_job_queue()
+    if job_queue is None:
+        start(run_synchronously=run_synchronously)
+        return job_id
+
+    lane = Lane.INTERACTIVE if scheduler_job_id is None else Lane.SCHEDULED
+    result_serializer.mark_queued(
+        job_id, job_queue.owner, lane.name, submitted_by=submitted_by, n_retries=n_retries, prepare_only=prepare_only
+    )
+    queued_job = _enqueue(result_serializer, job_queue, job_id, report_name, start, lane, submitted_by)
+    if run_synchronously:
+        queued_job.wait()
     return job_id
+
+
+def _enqueue(
+    result_serializer,
+    job_queue: JobQueue,
+    job_id: str,
+    report_name: str,
+    start: Callable[..., Callable[[], Any]],
+    lane: Lane,
+    submitted_by: Optional[str],
+) -> QueuedJob:
+    """Adds a job, which has been recorded as queued by this job queue, to the job queue."""
+
+    def _start_queued():
+        if not result_serializer.claim_queued(job_id, job_queue.owner):
+            logger.info("Not starting %s, which has been cancelled or re-enqueued by another process.", job_id)
+            return lambda: None
+        try:
+            return start(run_synchronously=False)
+        except RuntimeError as e:
+            result_serializer.update_check_status(job_id, JobStatus.ERROR, error_info=str(e))
+            raise
+
+    return job_queue.submit(job_id, report_name, _start_queued, user=submitted_by, lane=lane)
+
+
+def maintain_job_queue(base_config: BaseConfig, job_queue: JobQueue) -> None:
+    """
+    Runs periodically in the webapp, starting when the job queue starts. Records that the jobs in this job queue are
+    still waiting, and re-enqueues the jobs whose job queue has stopped, e.g. because its process was restarted.
+    """
+    result_serializer = initialize_serializer_from_config(base_config)
+    result_serializer.refresh_queued(job_queue.owner, job_queue.waiting_job_ids())
+    stale_before = datetime.datetime.now() - datetime.timedelta(seconds=QUEUE_HEARTBEAT_TIMEOUT_SECONDS)
+    for result in result_serializer.adopt_orphaned_queued(job_queue.owner, stale_before):
+        queue = result["queue"]
+        logger.info("Re-enqueueing %s, whose job queue (%s) has stopped.", result["job_id"], queue.get("owner"))
+        start = functools.partial(
+            _start_report_execution,
+            base_config,
+            result_serializer,
+            result["job_id"],
+            result["report_name"],
+            result.get("report_title", ""),
+            result.get("mailto", ""),
+            result.get("error_mailto", ""),
+            result.get("overrides", {}),
+            hide_code=result.get("hide_code", False),
+            generate_pdf_output=result.get("generate_pdf_output", True),
+            prepare_only=queue["prepare_only"],
+            scheduler_job_id=result.get("scheduler_job_id"),
+            mailfrom=result.get("mailfrom"),
+            email_subject=result.get("email_subject"),
+            n_retries=queue["n_retries"],
+            is_slideshow=result.get("is_slideshow", False),
+        )
+        _enqueue(
+            result_serializer,
+            job_queue,
+            result["job_id"],
+            result["report_name"],
+            start,
+            Lane[queue["lane"]],
+            queue.get("submitted_by"),
+        )
@@ -0,0 +1,250 @@
+"""
+An admission-controlled queue which sits between report submission (HTTP requests, rerun, the scheduler) and
+report execution. Jobs are saved to storage with a SUBMITTED status and wait in the queue until an execution slot
+is free, subject to a global concurrency limit and optional per-report and per-user limits. Interactive requests are
+dispatched ahead of scheduled runs.
+
+Each queue has an owner ID, under which its waiting jobs are recorded in storage, so that they aren't timed out while
+they wait, and so that another process re-enqueues them if this one stops. See maintain_job_queue().
+"""
+import itertools
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from enum import IntEnum
+from logging import getLogger
+from typing import Callable, Dict, List, Optional
+
+logger = getLogger(__name__)
+
+_job_queue: Optional["JobQueue"] = None
+# How often a queue records in storage that its waiting jobs are still waiting.
+QUEUE_HEARTBEAT_SECONDS = 10
+# Waiting jobs whose queue hasn't recorded them for this long are re-enqueued by another process.
+QUEUE_HEARTBEAT_TIMEOUT_SECONDS = 60
+
+
+class Lane(IntEnum):
+    """Priority lanes of the queue; lower values are dispatched first."""
+
+    INTERACTIVE = 0
+    SCHEDULED = 1
+
+
+def try_record_queue_metrics(depth_by_lane: Dict[Lane, int], n_running: int):
+    try:
+        from notebooker.web.routes.prometheus import record_queue_depth
+
+        record_queue_depth({lane.name.lower(): depth for lane, depth in depth_by_lane.items()}, n_running)
+    except ImportError:
+        pass
+
+
+def try_record_queue_wait(lane: Lane, wait_seconds: float):
+    try:
+        from notebooker.web.routes.prometheus import record_queue_wait
+
+        record_queue_wait(lane.name.lower(), wait_seconds)
+    except ImportError:
+        pass
+
+
+class QueuedJob(object):
+    def __init__(self, job_id: str, report_name: str, user: Optional[str], lane: Lane, start: Callable[[], Callable]):
+        self.job_id = job_id
+        self.report_name = report_name
+        self.user = user
+        self.lane = lane
+        self.start = start
+        self.submit_time = time.time()
+        self._finished = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the job has been dispatched and has finished executing."""
+        return self._finished.wait(timeout)
+
+
+class JobQueue(object):
+    """
+    :param max_concurrent: The maximum number of jobs executing at once.
+    :param max_per_report: The maximum number of executing jobs per report name. 0 means no limit.
+    :param max_per_user: The maximum number of executing jobs per submitting user. 0 means no limit.
+    :param on_tick: Called with the queue when it starts, and every tick_seconds after that, e.g. to record its
+                    waiting jobs in storage.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_per_report: int = 0,
+        max_per_user: int = 0,
+        on_tick: Optional[Callable[["JobQueue"], None]] = None,
+        tick_seconds: float = QUEUE_HEARTBEAT_SECONDS,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_report = max_per_report
+        self.max_per_user = max_per_user
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._condition = threading.Condition()
+        self._waiting: List = []
+        self._waiting_ids = set()
+        self._running: Dict[str, QueuedJob] = {}
+        self._sequence = itertools.count()
+        self._stopping = False
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="notebooker-job-queue")
+        self._dispatcher.daemon = True
+        self._dispatcher.start()
+        self._stopped = threading.Event()
+        if on_tick is not None:
+            ticker = threading.Thread(
+                target=self._tick_loop, args=(on_tick, tick_seconds), name="notebooker-job-queue-ticker"
+            )
+            ticker.daemon = True
+            ticker.start()
+
+    def submit(
+        self,
+        job_id: str,
+        report_name: str,
+        start: Callable[[], Callable],
+        user: Optional[str] = None,
+        lane: Lane = Lane.INTERACTIVE,
+    ) -> QueuedJob:
+        """
+        Enqueues a job whose stub has already been saved with a SUBMITTED status.
+
+        :param start: Starts executing the job, returning a function which blocks until the job has finished.
+        """
+        job = QueuedJob(job_id, report_name, user, lane, start)
+        with self._condition:
+            self._waiting.append((lane, next(self._sequence), job))
+            self._waiting_ids.add(job_id)
+            self._record_metrics()
+            self._condition.notify_all()
+        return job
+
+    def is_waiting(self, job_id: str) -> bool:
+        with self._condition:
+            return job_id in self._waiting_ids
+
+    def waiting_job_ids(self) -> List[str]:
+        with self._condition:
+            return list(self._waiting_ids)
+
+    def depth(self) -> Dict[Lane, int]:
+        with self._condition:
+            return self._depth_by_lane()
+
+    def n_running(self) -> int:
+        with self._condition:
+            return len(self._running)
+
+    def stop(self):
+        self._stopped.set()
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+
+    def _tick_loop(self, on_tick: Callable[["JobQueue"], None], tick_seconds: float):
+        while True:
+            try:
+                on_tick(self)
+            except Exception:
+                logger.exception("The job queue's periodic task failed; it will run again.")
+            if self._stopped.wait(tick_seconds):
+                return
+
+    def _depth_by_lane(self) -> Dict[Lane, int]:
+        depth = Counter({lane: 0 for lane in Lane})
+        depth.update(job.lane for _, _, job in self._waiting)
+        return dict(depth)
+
+    def _record_metrics(self):
+        try_record_queue_metrics(self._depth_by_lane(), len(self._running))
+
+    def _admissible(self, job: QueuedJob) -> bool:
+        if self.max_per_report and (
+            sum(1 for j in self._running.values() if j.report_name == job.report_name) >= self.max_per_report
+        ):
+            return False
+        if self.max_per_user and job.user is not None:
+            if sum(1 for j in self._running.values() if j.user == job.user) >= self.max_per_user:
+                return False
+        return True
+
+    def _next_job(self) -> Optional[QueuedJob]:
+        """Pops the highest-priority job which is within its limits. Jobs which are over a limit keep their place."""
+        if len(self._running) >= self.max_concurrent:
+            return None
+        for entry in sorted(self._waiting, key=lambda e: e[:2]):
+            job = entry[2]
+            if self._admissible(job):
+                self._waiting.remove(entry)
+                self._waiting_ids.discard(job.job_id)
+                return job
+        return None
+
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                job = None
+                while not self._stopping:
+                    job = self._next_job()
+                    if job is not None:
+                        break
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                self._running[job.job_id] = job
+                self._record_metrics()
+            try_record_queue_wait(job.lane, time.time() - job.submit_time)
+            runner = threading.Thread(target=self._run, args=(job,), name=f"notebooker-job-{job.job_id}")
+            runner.daemon = True
+            runner.start()
+
+    def _run(self, job: QueuedJob):
+        try:
+            logger.info("Dispatching job %s (%s) from the %s lane.", job.job_id, job.report_name, job.lane.name)
+            wait_for_completion = job.start()
+            wait_for_completion()
+        except Exception:
+            logger.exception("Queued job %s failed to execute.", job.job_id)
+        finally:
+            with self._condition:
+                self._running.pop(job.job_id, None)
+                self._record_metrics()
+                self._condition.notify_all()
+            job._finished.set()
+
+
+def get_job_queue() -> Optional[JobQueue]:
+    """Returns the job queue if the webapp has started one, otherwise None."""
+    return _job_queue
+
+
+def start_job_queue(
+    max_concurrent: int,
+    max_per_report: int = 0,
+    max_per_user: int = 0,
+    on_tick: Optional[Callable[[JobQueue], None]] = None,
+) -> JobQueue:
+    global _job_queue
+    if _job_queue is None:
+        logger.info(
+            "Starting job queue with max_concurrent=%d, max_per_report=%d, max_per_user=%d",
+            max_concurrent,
+            max_per_report,
+            max_per_user,
+        )
+        _job_queue = JobQueue(max_concurrent, max_per_report=max_per_report, max_per_user=max_per_user, on_tick=on_tick)
+    return _job_queue
+
+
+def stop_job_queue():
+    global _job_queue
+    if _job_queue is not None:
+        _job_queue.stop()
+        _job_queue = None
@@ -1,29 +1,90 @@
+import base64
 import datetime
+import gzip
+import hashlib
 import json
-from collections import defaultdict
+import re
+import zlib
+from collections import Counter, defaultdict
 from logging import getLogger
-from typing import Any, AnyStr, Dict, List, Optional, Tuple, Union, Iterator
+from typing import Any, AnyStr, Dict, List, NamedTuple, Optional, Set, Tuple, Union, Iterator
 
 import click
 import gridfs
 import pymongo
 from abc import ABC
-from gridfs import NoFile
-
-from notebooker.constants import JobStatus, NotebookResultComplete, NotebookResultError, NotebookResultPending
+from bson import json_util
+from gridfs import GridOut, NoFile
+from pymongo import ReturnDocument
+
+from notebooker.constants import (
+    DEFAULT_GRIDFS_COMPRESSION,
+    DEFAULT_STDOUT_COLLECTION_SIZE_MB,
+    JobStatus,
+    LazyPayload,
+    LazyPayloadDict,
+    NotebookResultComplete,
+    NotebookResultError,
+    NotebookResultPending,
+)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 logger = getLogger(__name__)
+GRIDFS_COMPRESSION_OPTIONS = ("gzip", "zstd", "none")
+STREAM_CHUNK_SIZE = 256 * 1024
+# $slice needs a count as well as an offset; this is the largest one MongoDB accepts.
+MAX_STDOUT_SLICE = 2**31 - 1
+
+# The serializers created in this process, by serializer_key, from which lazily-loaded payloads are read.
+_serializers_by_key: Dict[Tuple[str, str, str, str], "MongoResultSerializer"] = {}
+# The serializer_keys of the result collections whose indexes this process has ensured.
+_indexes_ensured: Set[Tuple[str, str, str, str]] = set()
+# The serializer_keys whose stdout collection this process has created, or found to exist.
+_stdout_collections_ready: Set[Tuple[str, str, str, str]] = set()
+# The serializer_keys whose result collection this process has found to hold no results deleted by older versions,
+# which marked them as deleted in place. Until then, queries of the result collection exclude deleted results.
+_no_legacy_deleted_results: Set[Tuple[str, str, str, str]] = set()
+# The serializer_keys whose result collection this process has found to hold no results without an overrides_hash,
+# i.e. which were saved by older versions and haven't been backfilled. Until then, those results are also matched
+# by their overrides.
+_overrides_hashes_backfilled: Set[Tuple[str, str, str, str]] = set()
+# The serializer_keys whose summary collection this process has found to be built.
+_summaries_built: Set[Tuple[str, str, str, str]] = set()
+# The _id of the document in a summary collection which records when it was rebuilt, and whether that has finished.
+SUMMARY_MARKER_ID = "__summary_built__"
+# The fields by which pages of results can be sorted. Every result has them, so that pages can be keyed on them.
+RESULT_PAGE_SORT_FIELDS = ("update_time", "job_start_time", "report_title", "status")
 REMOVE_ID_PROJECTION = {"_id": 0}
-REMOVE_PAYLOAD_FIELDS_PROJECTION = {"raw_html_resources": 0, "stdout": 0}
+REMOVE_PAYLOAD_FIELDS_PROJECTION = {"raw_html_resources": 0, "stdout": 0, "stdout_lines": 0}
 REMOVE_PAYLOAD_FIELDS_AND_ID_PROJECTION = dict(REMOVE_PAYLOAD_FIELDS_PROJECTION, **REMOVE_ID_PROJECTION)
+REMOVE_STDOUT_AND_ID_PROJECTION = {"stdout": 0, "stdout_lines": 0, "_id": 0}
+
+
+def overrides_hash(overrides: Optional[Dict]) -> str:
+    """
+    :return: A fingerprint of a result's overrides which doesn't depend on the order of their keys, so that results
+             can be looked up by their overrides with an index. Values which aren't JSON are hashed as their str().
+    """
+    canonical = json.dumps(overrides or {}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
 
 
-def _add_deleted_status_to_filter(base_filter):
-    if "status" in base_filter:
-        base_filter["status"].update({"$ne": JobStatus.DELETED.value})
-    else:
-        base_filter["status"] = {"$ne": JobStatus.DELETED.value}
-    return base_filter
+def _encode_cursor(values: List[Any]) -> str:
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> List[Any]:
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        values = None
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return values
 
 
 def ignore_missing_files(f):
@@ -37,9 +98,56 @@ def ignore_missing_files(f):
     return _ignore_missing_files
 
 
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(data, mtime=0)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def _decompress(data: bytes, compression: Optional[str]) -> bytes:
+    if compression == "gzip":
+        return gzip.decompress(data)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("Reading zstd-compressed results requires zstandard: pip install notebooker[zstd]")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def _read_grid_out(grid_out) -> bytes:
+    # Files written before compression was introduced have no metadata, and are read as they are.
+    return _decompress(grid_out.read(), (grid_out.metadata or {}).get("compression"))
+
+
+def iter_grid_out(grid_out: GridOut, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yields the content of a GridFS file chunk by chunk, decompressing it as it is read."""
+    compression = (grid_out.metadata or {}).get("compression")
+    decompressor = None
+    if compression == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == "zstd":
+        if zstandard is None:
+            raise ImportError("Reading zstd-compressed results requires zstandard: pip install notebooker[zstd]")
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    while True:
+        chunk = grid_out.read(chunk_size)
+        if not chunk:
+            break
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        if chunk:
+            yield chunk
+    if decompressor is not None:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
 @ignore_missing_files
 def read_file(result_data_store, path, is_json=False):
-    r = result_data_store.get_last_version(path).read()
+    r = _read_grid_out(result_data_store.get_last_version(path))
     try:
         return "" if not r else json.loads(r) if is_json else r.decode("utf8")
     except UnicodeDecodeError:
@@ -48,15 +156,21 @@ def read_file(result_data_store, path, is_json=False):
 
 @ignore_missing_files
 def read_bytes_file(result_data_store, path):
-    return result_data_store.get_last_version(path).read()
+    return _read_grid_out(result_data_store.get_last_version(path))
 
 
 def load_files_from_gridfs(result_data_store: gridfs.GridFS, result: Dict, do_read=True) -> List[str]:
+    """
+    Reads the payload of a result from GridFS into the result dict.
+    :return: The GridFS filenames which belong to this result only, i.e. excluding content-addressed blobs.
+    """
+    # Outputs and CSS inlining saved by newer versions are content-addressed blobs, which may be shared between results.
+    blob_filenames = {blob["filename"]: _blob_filename(blob["sha256"]) for blob in result.get("gridfs_blobs", [])}
     gridfs_filenames = []
     all_html_output_paths = result.get("raw_html_resources", {}).get("outputs", [])
-    gridfs_filenames.extend(all_html_output_paths)
+    gridfs_filenames.extend(path for path in all_html_output_paths if path not in blob_filenames)
     if do_read:
-        outputs = {path: read_file(result_data_store, path) for path in all_html_output_paths}
+        outputs = {path: read_file(result_data_store, blob_filenames.get(path, path)) for path in all_html_output_paths}
         result["raw_html_resources"]["outputs"] = outputs
     if result.get("generate_pdf_output"):
         pdf_filename = _pdf_filename(result["job_id"])
@@ -75,33 +189,143 @@ def load_files_from_gridfs(result_data_store: gridfs.GridFS, result: Dict, do_re
         gridfs_filenames.append(html_filename)
     if not result.get("email_html"):
         email_filename = _raw_email_html_filename(result["job_id"])
-        result["email_html"] = read_file(result_data_store, email_filename)
+        if do_read:
+            result["email_html"] = read_file(result_data_store, email_filename)
         gridfs_filenames.append(email_filename)
     if result.get("raw_html_resources") and not result.get("raw_html_resources", {}).get("inlining"):
         css_inlining_filename = _css_inlining_filename(result["job_id"])
         if do_read:
-            result["raw_html_resources"]["inlining"] = read_file(result_data_store, css_inlining_filename, is_json=True)
-        gridfs_filenames.append(css_inlining_filename)
+            result["raw_html_resources"]["inlining"] = read_file(
+                result_data_store, blob_filenames.get(css_inlining_filename, css_inlining_filename), is_json=True
+            )
+        if css_inlining_filename not in blob_filenames:
+            gridfs_filenames.append(css_inlining_filename)
     return gridfs_filenames
 
 
-class MongoResultSerializer(ABC):
-    instance = None
+class StoredResource(NamedTuple):
+    """A single stored output of a result. Its content is only read from GridFS by read(), or by streaming grid_out."""
+
+    etag: str
+    grid_out: GridOut
+
+    def read(self) -> bytes:
+        return _read_grid_out(self.grid_out)
 
-    def __new__(cls, *args, **kwargs):
-        if not isinstance(cls.instance, cls):
-            cls.instance = object.__new__(cls)
-        return cls.instance
 
+class GridFSPayload(LazyPayload):
+    """
+    Loads one GridFS file of a result on first access. Handles only hold the key of the serializer which created
+    them, not a connection or credentials, so they can be pickled into the result cache and loaded by any process
+    which has a serializer for the same database.
+    """
+
+    def __init__(self, serializer_key: Tuple[str, str, str, str], filename: str, is_json=False, as_bytes=False):
+        self.serializer_key = serializer_key
+        self.filename = filename
+        self.is_json = is_json
+        self.as_bytes = as_bytes
+
+    def load(self):
+        serializer = _serializers_by_key.get(self.serializer_key)
+        if serializer is None:
+            raise RuntimeError(
+                f"Can't load {self.filename} as there is no serializer for {self.serializer_key} in this process."
+            )
+        if self.as_bytes:
+            return read_bytes_file(serializer.result_data_store, self.filename)
+        return read_file(serializer.result_data_store, self.filename, is_json=self.is_json)
+
+    def __repr__(self):
+        return f"GridFSPayload({self.filename})"
+
+
+class StdoutPayload(LazyPayload):
+    """Loads the stdout of a result from the stdout collection on first access, like GridFSPayload."""
+
+    def __init__(self, serializer_key: Tuple[str, str, str, str], job_id: str):
+        self.serializer_key = serializer_key
+        self.job_id = job_id
+
+    def load(self):
+        serializer = _serializers_by_key.get(self.serializer_key)
+        if serializer is None:
+            raise RuntimeError(
+                f"Can't load the stdout of {self.job_id} as there is no serializer for {self.serializer_key} "
+                "in this process."
+            )
+        return serializer.get_stdout(self.job_id)[0]
+
+    def __repr__(self):
+        return f"StdoutPayload({self.job_id})"
+
+
+def attach_lazy_payload(serializer_key: Tuple[str, str, str, str], result: Dict) -> None:
+    """The lazy equivalent of load_files_from_gridfs(): sets each part of the payload to a GridFSPayload."""
+    blob_filenames = {blob["filename"]: _blob_filename(blob["sha256"]) for blob in result.get("gridfs_blobs", [])}
+    job_id = result["job_id"]
+    resources = LazyPayloadDict(result.get("raw_html_resources", {}))
+    resources["outputs"] = LazyPayloadDict(
+        {path: GridFSPayload(serializer_key, blob_filenames.get(path, path)) for path in resources.get("outputs", [])}
+    )
+    if result.get("generate_pdf_output"):
+        result["pdf"] = GridFSPayload(serializer_key, _pdf_filename(job_id), as_bytes=True)
+    if not result.get("raw_ipynb_json"):
+        result["raw_ipynb_json"] = GridFSPayload(serializer_key, _raw_json_filename(job_id), is_json=True)
+    if not result.get("raw_html"):
+        result["raw_html"] = GridFSPayload(serializer_key, _raw_html_filename(job_id))
+    if not result.get("email_html"):
+        result["email_html"] = GridFSPayload(serializer_key, _raw_email_html_filename(job_id))
+    if result.get("raw_html_resources") and "inlining" not in resources:
+        css_inlining_filename = _css_inlining_filename(job_id)
+        resources["inlining"] = GridFSPayload(
+            serializer_key, blob_filenames.get(css_inlining_filename, css_inlining_filename), is_json=True
+        )
+    result["raw_html_resources"] = resources
+
+
+class MongoResultSerializer(ABC):
     # This class is the interface between Mongo and the rest of the application
-    def __init__(self, database_name="notebooker", mongo_host="localhost", result_collection_name="NOTEBOOK_OUTPUT"):
+    def __init__(
+        self,
+        database_name="notebooker",
+        mongo_host="localhost",
+        result_collection_name="NOTEBOOK_OUTPUT",
+        gridfs_compression=DEFAULT_GRIDFS_COMPRESSION,
+        stdout_collection_size_mb=DEFAULT_STDOUT_COLLECTION_SIZE_MB,
+    ):
         self.database_name = database_name
         self.mongo_host = mongo_host
         self.result_collection_name = result_collection_name
+        if gridfs_compression not in GRIDFS_COMPRESSION_OPTIONS:
+            raise ValueError(
+                f"gridfs_compression must be one of {GRIDFS_COMPRESSION_OPTIONS}, not {gridfs_compression}"
+            )
+        if gridfs_compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression requires zstandard: pip install notebooker[zstd]")
+        self.gridfs_compression = gridfs_compression
+        self.stdout_collection_size_mb = stdout_collection_size_mb
 
         mongo_database = self.get_mongo_database()
         self.library = mongo_database[result_collection_name]
         self.result_data_store = gridfs.GridFS(mongo_database, "notebook_data")
+        # The number of results which reference each content-addressed blob in result_data_store.
+        self.blob_refs = mongo_database["notebook_data.refs"]
+        # The collections behind result_data_store, which files are deleted from in bulk.
+        self.gridfs_files = mongo_database["notebook_data.files"]
+        self.gridfs_chunks = mongo_database["notebook_data.chunks"]
+        # Each line of stdout of each job, numbered by "seq". Capped, so that the oldest lines make way for new ones.
+        self.stdout_library = mongo_database[f"{result_collection_name}_stdout"]
+        # The count, latest run and scheduled-run count of each report's results, by report name, for the index page.
+        self.summary_library = mongo_database[f"{result_collection_name}_summary"]
+        # Deleted results are moved here, so that result_collection_name only holds live results.
+        self.tombstone_library = mongo_database[f"{result_collection_name}_deleted"]
+        _serializers_by_key[self.serializer_key] = self
+        self.ensure_indexes()
+
+    @property
+    def serializer_key(self) -> Tuple[str, str, str, str]:
+        return self.get_name(), self.mongo_host, self.database_name, self.result_collection_name
 
     def __init_subclass__(cls, cli_options: click.Command = None, **kwargs):
         if cli_options is None:
@@ -133,7 +357,7 @@ class MongoResultSerializer(ABC):
                 )
             opt, value = cli_arg.opts[0], getattr(self, cli_arg.name)
             if value is not None:
-                args.extend([opt, value])
+                args.extend([opt, str(value)])
         return args
 
     @classmethod
@@ -146,30 +370,225 @@ class MongoResultSerializer(ABC):
     def get_mongo_database(self):
         raise NotImplementedError()
 
+    def ensure_indexes(self) -> None:
+        """
+        Creates the indexes of the result collection, and warns if it holds deleted results which haven't been moved to
+        the tombstone collection. This is attempted once per collection in each process.
+        """
+        if self.serializer_key in _indexes_ensured:
+            return
+        _indexes_ensured.add(self.serializer_key)
+        try:
+            self.library.create_index([("job_id", pymongo.ASCENDING)], background=True)
+            self.library.create_index([("report_name", pymongo.ASCENDING)], background=True)
+            self.library.create_index([("update_time", pymongo.DESCENDING)], background=True)
+            self.library.create_index(
+                [("status", pymongo.ASCENDING), ("update_time", pymongo.DESCENDING)], background=True
+            )
+            self.library.create_index(
+                [
+                    ("report_name", pymongo.ASCENDING),
+                    ("update_time", pymongo.DESCENDING),
+                    ("job_id", pymongo.DESCENDING),
+                ],
+                background=True,
+            )
+            self.library.create_index(
+                [
+                    ("report_name", pymongo.ASCENDING),
+                    ("overrides_hash", pymongo.ASCENDING),
+                    ("status", pymongo.ASCENDING),
+                    ("update_time", pymongo.DESCENDING),
+                ],
+                background=True,
+            )
+            self.tombstone_library.create_index([("job_id", pymongo.ASCENDING)], background=True)
+            if self.library.find_one({"overrides_hash": {"$exists": False}}, {"_id": 1}) is None:
+                _overrides_hashes_backfilled.add(self.serializer_key)
+            if self.library.find_one({"status": JobStatus.DELETED.value}, {"_id": 1}) is None:
+                _no_legacy_deleted_results.add(self.serializer_key)
+            else:
+                logger.warning(
+                    f"{self.result_collection_name} still holds results which were deleted by an older version of "
+                    "Notebooker. Move them to the tombstone collection with: notebooker-cli migrate-deleted-results"
+                )
+        except pymongo.errors.PyMongoError:
+            logger.exception(f"Could not create the indexes of {self.result_collection_name}. Continuing.")
+
     def _save_raw_to_db(self, out_data):
+        """
+        Saves a result with a single upsert by job_id. Fields which out_data doesn't have, e.g. the count of stdout
+        lines, are kept, except for the references to blobs, which belong to the version of the result they came with.
+        """
         out_data["update_time"] = datetime.datetime.now()
-        existing = self.library.find_one({"job_id": out_data["job_id"]})
+        out_data.pop("_id", None)
+        if not out_data.get("stdout"):
+            # stdout is saved by update_stdout(); an empty list here would only hide the stdout of older results.
+            out_data.pop("stdout", None)
+        if "overrides" in out_data:
+            out_data["overrides_hash"] = overrides_hash(out_data["overrides"])
+        update = {"$set": out_data}
+        if "gridfs_blobs" not in out_data:
+            update["$unset"] = {"gridfs_blobs": ""}
+        previous = self.library.find_one_and_update(
+            {"job_id": out_data["job_id"]},
+            update,
+            projection={"gridfs_blobs": 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+        if previous is None and out_data.get("status") != JobStatus.DELETED.value:
+            self._count_in_summary(
+                out_data["report_name"], 1, int(bool(out_data.get("scheduler_job_id"))), out_data.get("job_start_time")
+            )
+        if previous and previous.get("gridfs_blobs"):
+            # A new version of the result has replaced the old one, so the old one's references to blobs go with it.
+            self._release_blobs(Counter(blob["sha256"] for blob in previous["gridfs_blobs"]))
 
-        if existing:
-            self.library.replace_one({"_id": existing["_id"]}, out_data)
-        else:
-            self.library.insert_one(out_data)
-        # Ensure that the job_id index exists
-        self.library.create_index([("job_id", pymongo.ASCENDING)], background=True)
-        self.library.create_index([("report_name", pymongo.ASCENDING)], background=True)
-        self.library.create_index([("update_time", pymongo.DESCENDING)], background=True)
-        self.library.create_index([("status", pymongo.ASCENDING), ("update_time", pymongo.DESCENDING)], background=True)
+    def _count_in_summary(
+        self, report_name: str, n: int, n_scheduled: int = 0, job_start_time: Optional[datetime.datetime] = None
+    ) -> None:
+        """
+        Adds n results, of which n_scheduled were scheduled, to the summary of a report. Both are negative for results
+        which were deleted. Until the summary has been built, only the results started after its rebuild began are
+        counted, as the rebuild counts the others. Failures are only logged.
+        :param job_start_time: The latest start time of the results.
+        """
+        update = {"$inc": {"count": n, "scheduler_runs": n_scheduled}}
+        if n > 0 and job_start_time:
+            update["$max"] = {"latest_run": job_start_time}
+        try:
+            marker = self.summary_library.find_one({"_id": SUMMARY_MARKER_ID})
+            if marker is None:
+                return
+            cutoff = marker.get("cutoff")
+            started_after_rebuild = cutoff is not None and job_start_time is not None and job_start_time >= cutoff
+            if not marker.get("built") and not started_after_rebuild:
+                return
+            summary = self.summary_library.find_one_and_update(
+                {"_id": report_name}, update, upsert=n > 0, return_document=ReturnDocument.AFTER
+            )
+            if summary is None or n > 0:
+                return
+            if summary["count"] <= 0:
+                self.summary_library.delete_one({"_id": report_name, "count": {"$lte": 0}})
+            elif job_start_time and summary.get("latest_run") and summary["latest_run"] <= job_start_time:
+                # The latest run has gone, so the next latest takes its place.
+                latest = self.library.find_one(
+                    self._exclude_legacy_deleted({"report_name": report_name}),
+                    {"_id": 0, "job_start_time": 1},
+                    sort=[("job_start_time", pymongo.DESCENDING)],
+                )
+                if latest:
+                    self.summary_library.update_one(
+                        {"_id": report_name}, {"$set": {"latest_run": latest["job_start_time"]}}
+                    )
+        except pymongo.errors.PyMongoError:
+            logger.exception(f"Could not update the summary of {report_name}. Rebuild it with rebuild-summary.")
+
+    def rebuild_summary(self) -> None:
+        """
+        Recounts the summary of every report from the result collection. The results started before the recount are
+        merged into the summaries, so results saved or deleted while it runs are still counted by _count_in_summary().
+        """
+        self.summary_library.update_one(
+            {"_id": SUMMARY_MARKER_ID}, {"$set": {"cutoff": None, "built": False}}, upsert=True
+        )
+        self.summary_library.delete_many({"_id": {"$ne": SUMMARY_MARKER_ID}})
+        cutoff = datetime.datetime.now()
+        self.summary_library.update_one({"_id": SUMMARY_MARKER_ID}, {"$set": {"cutoff": cutoff}})
+        self.library.aggregate(
+            [
+                {"$match": {"status": {"$ne": JobStatus.DELETED.value}, "job_start_time": {"$not": {"$gte": cutoff}}}},
+                {
+                    "$group": {
+                        "_id": "$report_name",
+                        "count": {"$sum": 1},
+                        "latest_run": {"$max": "$job_start_time"},
+                        "scheduler_runs": {
+                            "$sum": {"$cond": [{"$gt": [{"$ifNull": ["$scheduler_job_id", ""]}, ""]}, 1, 0]}
+                        },
+                    }
+                },
+                {
+                    "$merge": {
+                        "into": self.summary_library.name,
+                        "whenMatched": [
+                            {
+                                "$set": {
+                                    "count": {"$add": ["$count", "$$new.count"]},
+                                    "scheduler_runs": {"$add": ["$scheduler_runs", "$$new.scheduler_runs"]},
+                                    "latest_run": {"$max": ["$latest_run", "$$new.latest_run"]},
+                                }
+                            }
+                        ],
+                        "whenNotMatched": "insert",
+                    }
+                },
+            ]
+        )
+        self.summary_library.update_one({"_id": SUMMARY_MARKER_ID}, {"$set": {"built": True}})
+        _summaries_built.add(self.serializer_key)
+
+    def _ensure_summary_built(self) -> None:
+        """Builds the summary collection if it has never been built. This is checked once per process."""
+        if self.serializer_key in _summaries_built:
+            return
+        marker = self.summary_library.find_one({"_id": SUMMARY_MARKER_ID})
+        if marker is None:
+            # Only the process which creates the marker builds the summary.
+            claim = self.summary_library.update_one(
+                {"_id": SUMMARY_MARKER_ID}, {"$setOnInsert": {"cutoff": None, "built": False}}, upsert=True
+            )
+            if claim.upserted_id is not None:
+                self.rebuild_summary()
+        elif marker.get("built"):
+            _summaries_built.add(self.serializer_key)
 
     def _save_to_db(self, notebook_result):
         out_data = notebook_result.saveable_output()
         self._save_raw_to_db(out_data)
 
+    def _ensure_stdout_library(self):
+        if self.serializer_key in _stdout_collections_ready:
+            return
+        try:
+            self.stdout_library.database.create_collection(
+                self.stdout_library.name, capped=True, size=self.stdout_collection_size_mb * 1024 * 1024
+            )
+        except pymongo.errors.CollectionInvalid:
+            pass  # It already exists.
+        self.stdout_library.create_index([("job_id", pymongo.ASCENDING), ("seq", pymongo.ASCENDING)], unique=True)
+        _stdout_collections_ready.add(self.serializer_key)
+
     def update_stdout(self, job_id, new_lines, replace=False):
-        if replace:
-            result = self.library.find_one_and_update({"job_id": job_id}, {"$set": {"stdout": new_lines}})
-        else:
-            result = self.library.find_one_and_update({"job_id": job_id}, {"$push": {"stdout": {"$each": new_lines}}})
+        """
+        Appends lines to the stdout of a job. Each line is inserted into the stdout collection with the next "seq",
+        which is allocated by incrementing "stdout_lines" in the result document, so the result document stays small.
 
+        :param replace: If True, new_lines is the whole of stdout so far. Lines are never rewritten, so only those
+                        which haven't been saved yet are appended.
+        """
+        if replace:
+            existing = self.library.find_one({"job_id": job_id}, {"_id": 0, "stdout_lines": 1})
+            if existing is None:
+                return None
+            new_lines = new_lines[existing.get("stdout_lines", 0) :]
+        if not new_lines:
+            return None
+        result = self.library.find_one_and_update(
+            {"job_id": job_id},
+            {"$inc": {"stdout_lines": len(new_lines)}},
+            projection={"stdout_lines": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if result is None:
+            return None
+        self._ensure_stdout_library()
+        first_seq = result["stdout_lines"] - len(new_lines)
+        self.stdout_library.insert_many(
+            [{"job_id": job_id, "seq": first_seq + i, "line": line} for i, line in enumerate(new_lines)]
+        )
         return result
 
     def update_check_status(self, job_id: str, status: JobStatus, **extra):
@@ -177,21 +596,21 @@ class MongoResultSerializer(ABC):
             raise ValueError(
                 "update_check_status() should not be called with a completed job; use save_check_result() instead."
             )
-        existing = self.library.find_one({"job_id": job_id})
-        if not existing:
+        update = {"status": status.value, "update_time": datetime.datetime.now()}
+        error_info = None
+        for k, v in extra.items():
+            if k == "error_info" and v:
+                error_info = v
+            else:
+                update[k] = v
+        if not self.library.update_one({"job_id": job_id}, {"$set": update}).matched_count:
             logger.warning(
                 "Couldn't update check status to {} for job id {} since it is not in the database.".format(
                     status, job_id
                 )
             )
-        else:
-            existing["status"] = status.value
-            for k, v in extra.items():
-                if k == "error_info" and v:
-                    self.result_data_store.put(v, filename=_error_info_filename(job_id), encoding="utf-8")
-                else:
-                    existing[k] = v
-            self._save_raw_to_db(existing)
+        elif error_info:
+            self.result_data_store.put(error_info, filename=_error_info_filename(job_id), encoding="utf-8")
 
     def save_check_stub(
         self,
@@ -231,42 +650,229 @@ class MongoResultSerializer(ABC):
         )
         self._save_to_db(pending_result)
 
+    def mark_queued(self, job_id: str, owner: str, lane: str, **job_args) -> None:
+        """
+        Records that a SUBMITTED job is waiting in the job queue with the given owner ID, along with the arguments
+        which aren't saved with the result but which are needed to re-enqueue it, e.g. its number of retries.
+        """
+        now = datetime.datetime.now()
+        queue = dict(job_args, owner=owner, lane=lane, enqueued_at=now, heartbeat=now)
+        self.library.update_one({"job_id": job_id}, {"$set": {"queue": queue}})
+
+    def refresh_queued(self, owner: str, job_ids: List[str]) -> None:
+        """Records that the given jobs are still waiting in the job queue with the given owner ID."""
+        if job_ids:
+            self.library.update_many(
+                {"job_id": {"$in": job_ids}, "queue.owner": owner},
+                {"$set": {"queue.heartbeat": datetime.datetime.now()}},
+            )
+
+    def claim_queued(self, job_id: str, owner: str) -> bool:
+        """
+        Takes a job out of the job queue with the given owner ID, so that it can start.
+
+        :return: False if the job is no longer SUBMITTED or has been re-enqueued elsewhere, so mustn't start here.
+        """
+        claimed = self.library.find_one_and_update(
+            {"job_id": job_id, "status": JobStatus.SUBMITTED.value, "queue.owner": owner},
+            {"$unset": {"queue": ""}},
+            projection={"_id": 1},
+        )
+        return claimed is not None
+
+    def adopt_orphaned_queued(self, owner: str, stale_before: datetime.datetime) -> List[Dict]:
+        """
+        Moves the SUBMITTED jobs whose job queue hasn't recorded them since stale_before, e.g. because its process
+        has stopped, to the job queue with the given owner ID. Each job is adopted by one process only.
+
+        :return: The adopted results, oldest first, without their payload.
+        """
+        adopted = []
+        while True:
+            result = self.library.find_one_and_update(
+                {"status": JobStatus.SUBMITTED.value, "queue.heartbeat": {"$lt": stale_before}},
+                {"$set": {"queue.owner": owner, "queue.heartbeat": datetime.datetime.now()}},
+                projection=REMOVE_PAYLOAD_FIELDS_AND_ID_PROJECTION,
+                sort=[("queue.enqueued_at", pymongo.ASCENDING)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if result is None:
+                return adopted
+            adopted.append(result)
+
+    def _put_file(self, data: Union[str, bytes], filename: str, compress: bool = False):
+        """Writes a file to GridFS, compressing it with gridfs_compression if compress is set."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if compress and self.gridfs_compression != "none":
+            return self.result_data_store.put(
+                _compress(data, self.gridfs_compression),
+                filename=filename,
+                metadata={"compression": self.gridfs_compression},
+            )
+        return self.result_data_store.put(data, filename=filename)
+
+    def _put_blob(self, data: Union[str, bytes], compress: bool = False) -> str:
+        """
+        Saves data to GridFS under its content hash and takes a reference to it. The bytes are only written if
+        no other result has already saved the same content.
+        :return: The sha256 of the (uncompressed) data.
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        sha256 = hashlib.sha256(data).hexdigest()
+        ref = self.blob_refs.find_one_and_update(
+            {"_id": sha256}, {"$inc": {"refcount": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        if not ref.get("file_ids"):
+            file_id = self._put_file(data, _blob_filename(sha256), compress=compress)
+            self.blob_refs.update_one({"_id": sha256}, {"$addToSet": {"file_ids": file_id}})
+        return sha256
+
+    def get_gzipped_file(self, filename: str) -> Optional[bytes]:
+        """
+        Returns the stored bytes of a GridFS file if it was saved with gzip compression, so that they can be served
+        to clients which accept gzip without being decompressed. Otherwise, returns None.
+        """
+        try:
+            grid_out = self.result_data_store.get_last_version(filename)
+        except NoFile:
+            return None
+        if (grid_out.metadata or {}).get("compression") != "gzip":
+            return None
+        return grid_out.read()
+
+    def open_result_file(self, job_id: str, filename: str) -> Optional[GridOut]:
+        """
+        Opens a GridFS file of a completed result, e.g. its PDF, so that it can be streamed without reading it all
+        into memory. Note that the file may be compressed; see iter_grid_out().
+
+        :return: The open file, or None if the result does not exist, is not complete or has no such file.
+        """
+        if self.library.find_one({"job_id": job_id, "status": JobStatus.DONE.value}, {"_id": 1}) is None:
+            return None
+        try:
+            return self.result_data_store.get_last_version(filename)
+        except NoFile:
+            return None
+
+    def get_result_resource(self, job_id: str, resource_path: str) -> Optional[StoredResource]:
+        """
+        Looks up one output of a completed result, e.g. an image, without loading the rest of the result.
+
+        :param resource_path: The path of the output as saved in raw_html_resources,
+                              e.g. "<job_id>/resources/output_1_0.png"
+        :return: The output, or None if the result does not exist, is not complete or has no such output.
+        """
+        result = self.library.find_one(
+            {"job_id": job_id, "status": JobStatus.DONE.value, "raw_html_resources.outputs": resource_path},
+            {"gridfs_blobs": 1, "_id": 0},
+        )
+        if result is None:
+            return None
+        blob_sha256s = {blob["filename"]: blob["sha256"] for blob in result.get("gridfs_blobs", [])}
+        sha256 = blob_sha256s.get(resource_path)
+        try:
+            grid_out = self.result_data_store.get_last_version(_blob_filename(sha256) if sha256 else resource_path)
+        except NoFile:
+            return None
+        # Outputs are never rewritten, so a blob's content hash, or otherwise the GridFS file's ID, identifies them.
+        return StoredResource(etag=sha256 or str(grid_out._id), grid_out=grid_out)
+
+    def _release_blobs(self, sha256_counts: Dict[str, int], dry_run: bool = False) -> List[str]:
+        """
+        Drops references to content-addressed blobs, deleting the blobs which are no longer referenced by any result.
+        :param sha256_counts: The number of references to drop, per blob.
+        :return: The GridFS filenames of the blobs which were (or, for a dry run, would be) deleted.
+        """
+        if not sha256_counts:
+            return []
+        if dry_run:
+            refcounts = {
+                ref["_id"]: ref.get("refcount", 0)
+                for ref in self.blob_refs.find({"_id": {"$in": list(sha256_counts)}}, {"refcount": 1})
+            }
+            return [_blob_filename(sha) for sha, count in sha256_counts.items() if refcounts.get(sha, 0) <= count]
+        self.blob_refs.bulk_write(
+            [pymongo.UpdateOne({"_id": sha}, {"$inc": {"refcount": -count}}) for sha, count in sha256_counts.items()],
+            ordered=False,
+        )
+        deleted_filenames = []
+        file_ids = []
+        for ref in self.blob_refs.find({"_id": {"$in": list(sha256_counts)}, "refcount": {"$lte": 0}}, {"_id": 1}):
+            # Removing the reference document is atomic, so only one caller deletes the blob. A concurrent save of the
+            # same content which lands after this creates a fresh reference document and writes the blob again.
+            claimed = self.blob_refs.find_one_and_delete({"_id": ref["_id"], "refcount": {"$lte": 0}})
+            if claimed is not None:
+                file_ids.extend(claimed.get("file_ids", []))
+                deleted_filenames.append(_blob_filename(ref["_id"]))
+        self._delete_gridfs_file_ids(file_ids)
+        return deleted_filenames
+
+    def _delete_gridfs_file_ids(self, file_ids: List[Any]) -> None:
+        if file_ids:
+            # Chunks go first, so that files which are left behind by a failure are found, and deleted, next time.
+            self.gridfs_chunks.delete_many({"files_id": {"$in": file_ids}})
+            self.gridfs_files.delete_many({"_id": {"$in": file_ids}})
+
+    def _delete_gridfs_files(self, filenames: List[str], dry_run: bool = False) -> List[str]:
+        """:return: The filenames which existed, and were (or, for a dry run, would be) deleted."""
+        if not filenames:
+            return []
+        files = list(self.gridfs_files.find({"filename": {"$in": filenames}}, {"_id": 1, "filename": 1}))
+        if not dry_run:
+            self._delete_gridfs_file_ids([f["_id"] for f in files])
+        return sorted({f["filename"] for f in files})
+
     def save_check_result(self, notebook_result: Union[NotebookResultComplete, NotebookResultError]) -> None:
-        # Save to gridfs
-        for filelike_attribute, filename_func in [
-            ("pdf", _pdf_filename),
-            ("raw_html", _raw_html_filename),
-            ("email_html", _raw_email_html_filename),
-            ("error_info", _error_info_filename),
+        # Save to gridfs. Text payloads compress well; PDFs and images are already compressed.
+        for filelike_attribute, filename_func, compress in [
+            ("pdf", _pdf_filename, False),
+            ("raw_html", _raw_html_filename, True),
+            ("email_html", _raw_email_html_filename, True),
+            ("error_info", _error_info_filename, False),
         ]:
             if getattr(notebook_result, filelike_attribute, None):
-                self.result_data_store.put(
+                self._put_file(
                     getattr(notebook_result, filelike_attribute),
-                    filename=filename_func(notebook_result.job_id),
-                    encoding="utf-8",
+                    filename_func(notebook_result.job_id),
+                    compress=compress,
                 )
         for json_attribute, filename_func in [("raw_ipynb_json", _raw_json_filename)]:
             if getattr(notebook_result, json_attribute, None):
-                self.result_data_store.put(
+                self._put_file(
                     json.dumps(getattr(notebook_result, json_attribute)),
-                    filename=filename_func(notebook_result.job_id),
-                    encoding="utf-8",
+                    filename_func(notebook_result.job_id),
+                    compress=True,
                 )
+        # Outputs and CSS inlining are mostly identical between runs of a report, so are saved as shared blobs.
+        gridfs_blobs = []
         if isinstance(notebook_result, NotebookResultComplete):
             if notebook_result.raw_html_resources:
                 if "outputs" in notebook_result.raw_html_resources:
                     for filename, binary_data in notebook_result.raw_html_resources["outputs"].items():  # type: ignore
-                        self.result_data_store.put(binary_data, filename=filename, encoding="utf-8")
+                        gridfs_blobs.append({"filename": filename, "sha256": self._put_blob(binary_data)})
                 if "inlining" in notebook_result.raw_html_resources:
-                    self.result_data_store.put(
-                        json.dumps(notebook_result.raw_html_resources["inlining"]),
-                        filename=_css_inlining_filename(notebook_result.job_id),
-                        encoding="utf-8",
+                    inlining = json.dumps(notebook_result.raw_html_resources["inlining"])
+                    gridfs_blobs.append(
+                        {
+                            "filename": _css_inlining_filename(notebook_result.job_id),
+                            "sha256": self._put_blob(inlining, compress=True),
+                        }
                     )
 
         # Save to mongo
         logger.info("Saving {}".format(notebook_result.job_id))
-        self._save_to_db(notebook_result)
+        out_data = notebook_result.saveable_output()
+        if gridfs_blobs:
+            out_data["gridfs_blobs"] = gridfs_blobs
+        self._save_raw_to_db(out_data)
+
+    def attach_pdf(self, job_id: str, pdf: bytes) -> None:
+        """Saves the PDF of a result which was saved before its PDF had been rendered."""
+        self.result_data_store.put(pdf, filename=_pdf_filename(job_id), encoding="utf-8")
+        # Touching the result makes the report hunters pick up the PDF, replacing the cached result which lacks it.
+        self.library.update_one({"job_id": job_id}, {"$set": {"update_time": datetime.datetime.now()}})
 
     def _convert_result(
         self, result: Dict, load_payload: bool = True
@@ -292,10 +898,13 @@ class MongoResultSerializer(ABC):
 
         if not load_payload:
             result.pop("stdout", None)
+        elif "stdout_lines" in result:
+            result["stdout"] = StdoutPayload(self.serializer_key, result["job_id"])
 
         if cls == NotebookResultComplete:
             if load_payload:
-                load_files_from_gridfs(self.result_data_store, result, do_read=True)
+                # Each part of the payload is only read from GridFS if and when it is used.
+                attach_lazy_payload(self.serializer_key, result)
             else:
                 result.pop("raw_html", None)
                 result.pop("raw_ipynb_json", None)
@@ -349,7 +958,7 @@ class MongoResultSerializer(ABC):
         elif cls == NotebookResultError:
             if load_payload:
                 if not result.get("error_info"):
-                    result["error_info"] = read_file(self.result_data_store, _error_info_filename(result["job_id"]))
+                    result["error_info"] = GridFSPayload(self.serializer_key, _error_info_filename(result["job_id"]))
             else:
                 result.pop("error_info", None)
             return NotebookResultError(
@@ -375,7 +984,10 @@ class MongoResultSerializer(ABC):
             raise ValueError("Could not deserialise {} into result object.".format(result))
 
     def _get_raw_check_result(self, job_id: str):
-        return self.library.find_one({"job_id": job_id}, {"_id": 0})
+        result = self.library.find_one({"job_id": job_id}, {"_id": 0})
+        if result is None:
+            result = self.tombstone_library.find_one({"job_id": job_id}, {"_id": 0})
+        return result
 
     def get_check_result(
         self, job_id: AnyStr, load_payload: bool = True
@@ -383,12 +995,69 @@ class MongoResultSerializer(ABC):
         result = self._get_raw_check_result(job_id)
         return self._convert_result(result, load_payload=load_payload)
 
+    def get_status_and_stdout(self, job_id: str, stdout_offset: int = 0) -> Optional[Tuple[JobStatus, List[str], int]]:
+        """
+        Reads only the status of a job and the lines of its stdout from stdout_offset onwards, so that a client which
+        follows a running job receives each line once rather than the whole of stdout every time.
+
+        :return: The status, the new lines of stdout and the offset to read from next, or None if the job doesn't exist.
+        """
+        result = self.library.find_one(
+            {"job_id": job_id},
+            {"_id": 0, "status": 1, "stdout_lines": 1, "stdout": {"$slice": [stdout_offset, MAX_STDOUT_SLICE]}},
+        )
+        if result is None:
+            return None
+        return (JobStatus.from_string(result["status"]),) + self._read_stdout(job_id, result, stdout_offset)
+
+    def get_stdout(self, job_id: str, offset: int = 0) -> Tuple[List[str], int]:
+        """:return: The lines of the stdout of a job from offset onwards, and the offset to read from next."""
+        result = self.library.find_one(
+            {"job_id": job_id}, {"_id": 0, "stdout_lines": 1, "stdout": {"$slice": [offset, MAX_STDOUT_SLICE]}}
+        )
+        if result is None:
+            return [], offset
+        return self._read_stdout(job_id, result, offset)
+
+    def _read_stdout(self, job_id: str, result: Dict, offset: int) -> Tuple[List[str], int]:
+        if "stdout_lines" not in result:
+            # Results saved before stdout had its own collection keep it in the result document.
+            lines = result.get("stdout", [])
+            return lines, offset + len(lines)
+        if result["stdout_lines"] <= offset:
+            return [], offset
+        lines, next_offset = [], offset
+        cursor = self.stdout_library.find({"job_id": job_id, "seq": {"$gte": offset}}, {"_id": 0, "seq": 1, "line": 1})
+        for doc in cursor.sort("seq", pymongo.ASCENDING):
+            # Stop at a gap, i.e. a line which is still being written, so that it isn't skipped. A gap before the
+            # first line is the oldest lines having been dropped from the capped collection.
+            if lines and doc["seq"] != next_offset:
+                break
+            lines.append(doc["line"])
+            next_offset = doc["seq"] + 1
+        return lines, next_offset
+
+    def _exclude_legacy_deleted(self, mongo_filter: Dict) -> Dict:
+        """
+        Excludes the results which older versions of Notebooker marked as deleted, while the result collection may
+        still hold them.
+        """
+        if self.serializer_key in _no_legacy_deleted_results:
+            return mongo_filter
+        mongo_filter = dict(mongo_filter)
+        status = mongo_filter.get("status")
+        if status is None:
+            mongo_filter["status"] = {"$ne": JobStatus.DELETED.value}
+        elif isinstance(status, dict):
+            mongo_filter["status"] = dict(status, **{"$ne": JobStatus.DELETED.value})
+        return mongo_filter
+
     def _get_raw_results(self, base_filter, projection, limit):
-        base_filter = _add_deleted_status_to_filter(base_filter)
+        base_filter = self._exclude_legacy_deleted(base_filter)
         return self.library.find(base_filter, projection).sort("update_time", -1).limit(limit)
 
     def _get_result_count(self, base_filter):
-        base_filter = _add_deleted_status_to_filter(base_filter)
+        base_filter = self._exclude_legacy_deleted(base_filter)
         try:
             return self.library.count_documents(base_filter)
         except (TypeError, AttributeError):
@@ -396,23 +1065,19 @@ class MongoResultSerializer(ABC):
             return self.library.count(base_filter)
 
     def get_count_and_latest_time_per_report(self, subfolder: Optional[str]):
-        base_filer = {} if not subfolder else {"report_name": {"$regex": subfolder + ".*"}}
-        reports = list(
-            self._get_raw_results(
-                base_filter=base_filer,
-                projection={"report_name": 1, "job_start_time": 1, "scheduler_job_id": 1, "_id": 0},
-                limit=0,
-            )
-        )
-        jobs_by_name = defaultdict(list)
-        for r in reports:
-            jobs_by_name[r["report_name"]].append(r)
-        output = {}
-        for report, all_runs in jobs_by_name.items():
-            latest_start_time = max(r["job_start_time"] for r in all_runs)
-            scheduled_runs = len([x for x in all_runs if x.get("scheduler_job_id")])
-            output[report] = {"count": len(all_runs), "latest_run": latest_start_time, "scheduler_runs": scheduled_runs}
-        return output
+        """Reads the summary of each report, which is built from the result collection if it has never been built."""
+        self._ensure_summary_built()
+        base_filter = {"_id": {"$ne": SUMMARY_MARKER_ID}}
+        if subfolder:
+            base_filter["_id"]["$regex"] = subfolder + ".*"
+        return {
+            summary["_id"]: {
+                "count": summary["count"],
+                "latest_run": summary["latest_run"],
+                "scheduler_runs": summary["scheduler_runs"],
+            }
+            for summary in self.summary_library.find(base_filter)
+        }
 
     def get_all_results(
         self,
@@ -420,13 +1085,22 @@ class MongoResultSerializer(ABC):
         limit: Optional[int] = 100,
         mongo_filter: Optional[Dict] = None,
         load_payload: bool = True,
+        load_stdout: bool = True,
     ) -> Iterator[Union[NotebookResultComplete, NotebookResultError, NotebookResultPending]]:
+        """
+        :param load_payload: Whether results come with their payload, e.g. HTML, which is read from GridFS when used.
+                             If False, results only hold metadata.
+        :param load_stdout: Whether results come with their stdout, which is read from the stdout collection when used.
+        """
         base_filter = {}
         if mongo_filter:
             base_filter.update(mongo_filter)
         if since:
             base_filter.update({"update_time": {"$gt": since}})
-        projection = REMOVE_ID_PROJECTION if load_payload else REMOVE_PAYLOAD_FIELDS_AND_ID_PROJECTION
+        if not load_payload:
+            projection = REMOVE_PAYLOAD_FIELDS_AND_ID_PROJECTION
+        else:
+            projection = REMOVE_ID_PROJECTION if load_stdout else REMOVE_STDOUT_AND_ID_PROJECTION
         results = self._get_raw_results(base_filter, projection, limit)
         for res in results:
             if res:
@@ -434,16 +1108,118 @@ class MongoResultSerializer(ABC):
                 if converted_result is not None:
                     yield converted_result
 
+    @staticmethod
+    def _result_page_filter(
+        report_name: Optional[str] = None,
+        statuses: Optional[List[JobStatus]] = None,
+        title: Optional[str] = None,
+        started_after: Optional[datetime.datetime] = None,
+        started_before: Optional[datetime.datetime] = None,
+        overrides: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        mongo_filter = {}
+        if report_name is not None:
+            mongo_filter["report_name"] = report_name
+        if statuses:
+            mongo_filter["status"] = {"$in": [status.value for status in statuses]}
+        if title:
+            mongo_filter["report_title"] = {"$regex": re.escape(title), "$options": "i"}
+        if started_after is not None or started_before is not None:
+            mongo_filter["job_start_time"] = {}
+            if started_after is not None:
+                mongo_filter["job_start_time"]["$gte"] = started_after
+            if started_before is not None:
+                mongo_filter["job_start_time"]["$lt"] = started_before
+        for key, value in (overrides or {}).items():
+            mongo_filter[f"overrides.{key}"] = value
+        return mongo_filter
+
+    def get_results_page(
+        self,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        sort_by: str = "update_time",
+        ascending: bool = False,
+        **filters,
+    ) -> Tuple[List[Union[NotebookResultComplete, NotebookResultError, NotebookResultPending]], Optional[str]]:
+        """
+        Reads a page of results, without their payload or stdout. Pages are keyed on the sort field and the job ID
+        of the last result of the previous page, rather than skipping results, so every page takes as long to read.
+
+        :param cursor: The cursor returned with the previous page, or None for the first page.
+        :param sort_by: One of RESULT_PAGE_SORT_FIELDS. Ties are broken by job ID.
+        :param filters: The keyword arguments of _result_page_filter().
+        :return: The page of results, and the cursor of the next page, which is None if this is the last page.
+        """
+        if sort_by not in RESULT_PAGE_SORT_FIELDS:
+            raise ValueError(f"Results can only be sorted by one of {RESULT_PAGE_SORT_FIELDS}, not {sort_by}")
+        mongo_filter = self._exclude_legacy_deleted(self._result_page_filter(**filters))
+        direction = pymongo.ASCENDING if ascending else pymongo.DESCENDING
+        if cursor:
+            last_value, last_job_id = _decode_cursor(cursor)
+            after = "$gt" if ascending else "$lt"
+            mongo_filter = {
+                "$and": [
+                    mongo_filter,
+                    {"$or": [{sort_by: {after: last_value}}, {sort_by: last_value, "job_id": {after: last_job_id}}]},
+                ]
+            }
+        documents = list(
+            self.library.find(mongo_filter, REMOVE_PAYLOAD_FIELDS_AND_ID_PROJECTION)
+            .sort([(sort_by, direction), ("job_id", direction)])
+            .limit(limit + 1)
+        )
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = _encode_cursor([documents[-1].get(sort_by), documents[-1]["job_id"]])
+        results = [self._convert_result(document, load_payload=False) for document in documents]
+        return [result for result in results if result is not None], next_cursor
+
+    def watch_results(self, resume_after: Optional[Dict] = None, max_await_time_ms: Optional[int] = None):
+        """
+        Opens a change stream of results which are created or change status, with each change's full document.
+        Change streams require MongoDB to run as a replica set or sharded cluster; otherwise this raises
+        pymongo.errors.OperationFailure.
+
+        :param resume_after: The resume token of the last change seen on a previous stream, to continue from there.
+        :param max_await_time_ms: How long ChangeStream.try_next() waits for a change before returning None.
+        """
+        pipeline = [
+            {
+                "$match": {
+                    "$or": [
+                        {"operationType": {"$in": ["insert", "replace"]}},
+                        {"operationType": "update", "updateDescription.updatedFields.status": {"$exists": True}},
+                    ]
+                }
+            },
+            {"$project": {"fullDocument.stdout": 0, "fullDocument.stdout_lines": 0}},
+        ]
+        return self.library.watch(
+            pipeline, full_document="updateLookup", resume_after=resume_after, max_await_time_ms=max_await_time_ms
+        )
+
+    def result_from_change(
+        self, change: Dict
+    ) -> Optional[Union[NotebookResultError, NotebookResultComplete, NotebookResultPending]]:
+        """Converts a change from watch_results() into a result. None if the result has since been deleted."""
+        document = change.get("fullDocument")
+        if not document:
+            return None
+        document.pop("_id", None)
+        return self._convert_result(document)
+
     def get_all_result_keys(self, limit: int = 0, mongo_filter: Optional[Dict] = None) -> List[Tuple[str, str]]:
         keys = []
-        base_filter = {"status": {"$ne": JobStatus.DELETED.value}}
+        base_filter = {}
         if mongo_filter:
             base_filter.update(mongo_filter)
         results = self.library.aggregate(
             [
                 stage
                 for stage in (
-                    {"$match": base_filter},
+                    {"$match": self._exclude_legacy_deleted(base_filter)},
                     {"$sort": {"update_time": -1}},
                     {"$limit": limit} if limit else {},
                     {"$project": {"report_name": 1, "job_id": 1}},
@@ -461,14 +1237,24 @@ class MongoResultSerializer(ABC):
         overrides: Optional[Dict] = None,
         status: Optional[JobStatus] = None,
         as_of: Optional[datetime.datetime] = None,
+        match_unhashed: bool = False,
     ) -> Dict[str, Any]:
+        """
+        :param match_unhashed: Whether to also match the results which have no overrides_hash yet, by their overrides.
+        """
         mongo_filter = {"report_name": report_name}
-        if overrides is not None:
-            # BSON document comparisons are order-specific but we want to compare overrides
-            # irrespective of order and so we check subparts independently.
-            # See https://stackoverflow.com/questions/14324626/pymongo-or-mongodb-is-treating-two-equal-python-dictionaries-as-different-object
-            for k, v in overrides.items():
-                mongo_filter["overrides.{}".format(k)] = v
+        if overrides:
+            # Overrides are matched exactly, and irrespective of the order of their keys, by their fingerprint.
+            # Without overrides, results are matched whatever their overrides.
+            mongo_filter["overrides_hash"] = overrides_hash(overrides)
+            if match_unhashed:
+                unhashed = {"overrides_hash": {"$exists": False}}
+                unhashed.update({"overrides.{}".format(k): v for k, v in overrides.items()})
+                # Only results with exactly these overrides, as for those matched by their fingerprint.
+                unhashed["$expr"] = {
+                    "$eq": [{"$size": {"$objectToArray": {"$ifNull": ["$overrides", {}]}}}, len(overrides)]
+                }
+                mongo_filter["$or"] = [{"overrides_hash": mongo_filter.pop("overrides_hash")}, unhashed]
         if status is not None:
             mongo_filter["status"] = status.value
         if as_of is not None:
@@ -483,7 +1269,8 @@ class MongoResultSerializer(ABC):
         as_of: Optional[datetime.datetime] = None,
         limit: int = 0,
     ) -> List[str]:
-        mongo_filter = self._mongo_filter(report_name, overrides, status, as_of)
+        match_unhashed = self.serializer_key not in _overrides_hashes_backfilled
+        mongo_filter = self._mongo_filter(report_name, overrides, status, as_of, match_unhashed=match_unhashed)
         return [x[1] for x in self.get_all_result_keys(mongo_filter=mongo_filter, limit=limit)]
 
     def get_all_job_ids_for_name_and_params(self, report_name: str, params: Optional[Dict]) -> List[str]:
@@ -507,17 +1294,47 @@ class MongoResultSerializer(ABC):
     def get_latest_successful_job_ids_for_name_all_params(self, report_name: str) -> List[str]:
         """Get the latest successful job ids for all parameter variants of a given name"""
         mongo_filter = self._mongo_filter(report_name, status=JobStatus.DONE)
+        if self.serializer_key not in _overrides_hashes_backfilled:
+            # Some results have no overrides_hash yet, so the latest result of each fingerprint is found here instead.
+            job_ids_by_hash = {}
+            results = self.library.find(mongo_filter, {"_id": 0, "job_id": 1, "overrides": 1, "overrides_hash": 1})
+            for result in results.sort("update_time", -1):
+                result_hash = result.get("overrides_hash") or overrides_hash(result.get("overrides"))
+                job_ids_by_hash.setdefault(result_hash, result["job_id"])
+            return list(job_ids_by_hash.values())
         results = self.library.aggregate(
             [
                 {"$match": mongo_filter},
                 {"$project": REMOVE_PAYLOAD_FIELDS_PROJECTION},
                 {"$sort": {"update_time": -1}},
-                {"$group": {"_id": "$overrides", "job_id": {"$first": "$job_id"}}},
+                {"$group": {"_id": "$overrides_hash", "job_id": {"$first": "$job_id"}}},
             ]
         )
-
         return [result["job_id"] for result in results]
 
+    def backfill_overrides_hash(self, batch_size: int = 1000) -> int:
+        """
+        Sets overrides_hash on the results which were saved before it existed, so that they are found by their
+        overrides. Safe to run while the webapp is up, and to run again.
+
+        :return: The number of results which were updated.
+        """
+        n_updated = 0
+        batch = []
+        for result in self.library.find({"overrides_hash": {"$exists": False}}, {"_id": 1, "overrides": 1}):
+            batch.append(
+                pymongo.UpdateOne(
+                    {"_id": result["_id"]}, {"$set": {"overrides_hash": overrides_hash(result.get("overrides"))}}
+                )
+            )
+            if len(batch) >= batch_size:
+                n_updated += self.library.bulk_write(batch, ordered=False).modified_count
+                batch = []
+        if batch:
+            n_updated += self.library.bulk_write(batch, ordered=False).modified_count
+        _overrides_hashes_backfilled.add(self.serializer_key)
+        return n_updated
+
     def n_all_results_for_report_name(self, report_name: str) -> int:
         return self._get_result_count({"report_name": report_name})
 
@@ -527,8 +1344,6 @@ class MongoResultSerializer(ABC):
         gridfs_filenames = load_files_from_gridfs(self.result_data_store, result, do_read=False)
         if status in (JobStatus.ERROR, JobStatus.TIMEOUT, JobStatus.CANCELLED):
             gridfs_filenames.append(_error_info_filename(job_id))
-        if not dry_run:
-            self.update_check_status(job_id, JobStatus.DELETED)
         deleted_gridfs_files = []
         for filename in gridfs_filenames:
             logger.debug(f"Deleting {filename}")
@@ -539,13 +1354,129 @@ class MongoResultSerializer(ABC):
                     self.result_data_store.delete(grid_out._id)
             if existed:
                 deleted_gridfs_files.append(filename)
+        if "stdout_lines" in result and not dry_run:
+            try:
+                self.stdout_library.delete_many({"job_id": job_id})
+            except pymongo.errors.OperationFailure:
+                # Servers which can't delete from capped collections leave the lines to be dropped as new ones arrive.
+                logger.debug(f"Could not delete the stdout of {job_id}; it will be dropped from the capped collection.")
+        if dry_run:
+            blob_counts = Counter(blob["sha256"] for blob in result.get("gridfs_blobs", []))
+            deleted_gridfs_files.extend(self._release_blobs(blob_counts, dry_run=True))
+            return {"deleted_result_document": result, "gridfs_filenames": deleted_gridfs_files}
+        removed = self._move_to_tombstones(list(self.library.find({"job_id": job_id}, {"stdout": 0})))
+        for document in removed:
+            # Results deleted by older versions are moved too, but were already taken out of the summary.
+            if document["status"] != JobStatus.DELETED.value:
+                self._count_in_summary(
+                    document["report_name"],
+                    -1,
+                    -int(bool(document.get("scheduler_job_id"))),
+                    document.get("job_start_time"),
+                )
+        # The blob references have gone with the documents which this call removed, so those blobs can be released.
+        # A concurrent delete of the same result removes nothing, so it releases nothing.
+        blob_counts = Counter(blob["sha256"] for document in removed for blob in document.get("gridfs_blobs", []))
+        deleted_gridfs_files.extend(self._release_blobs(blob_counts))
         return {"deleted_result_document": result, "gridfs_filenames": deleted_gridfs_files}
 
+    def _move_to_tombstones(self, documents: List[Dict]) -> List[Dict]:
+        """
+        Moves deleted result documents, without their references to blobs, to the tombstone collection. They are
+        copied before they are removed, so a move which is interrupted can be repeated.
+
+        :return: The documents which this call removed, as they were when removed. Each document is removed
+                 atomically, so when several callers move the same document, only one of them gets it back.
+        """
+        if not documents:
+            return []
+        now = datetime.datetime.now()
+        tombstones = []
+        for document in documents:
+            tombstone = dict(document, status=JobStatus.DELETED.value, update_time=now)
+            tombstone.pop("gridfs_blobs", None)
+            tombstones.append(pymongo.ReplaceOne({"_id": document["_id"]}, tombstone, upsert=True))
+        self.tombstone_library.bulk_write(tombstones, ordered=False)
+        removed = []
+        for document in documents:
+            claimed = self.library.find_one_and_delete({"_id": document["_id"]}, projection={"stdout": 0})
+            if claimed is not None:
+                removed.append(claimed)
+        return removed
+
+    def migrate_deleted_results(self, batch_size: int = 1000) -> int:
+        """
+        Moves the results which older versions of Notebooker marked as deleted to the tombstone collection, so that
+        they no longer appear alongside live results. Safe to run while the webapp is up, and to run again.
+
+        :return: The number of results which were moved.
+        """
+        n_moved = 0
+        while True:
+            documents = list(self.library.find({"status": JobStatus.DELETED.value}, {"stdout": 0}).limit(batch_size))
+            if not documents:
+                _no_legacy_deleted_results.add(self.serializer_key)
+                return n_moved
+            n_moved += len(self._move_to_tombstones(documents))
+
+    def delete_results(self, job_ids: List[str], dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Deletes a batch of results with a handful of queries for the whole batch, rather than several per result, plus
+        one atomic removal per result. Their files are deleted before the results are moved to tombstones, so a batch
+        which is interrupted is finished by deleting it again.
+
+        :return: The job IDs of the results which were (or, for a dry run, would be) deleted, and their GridFS files.
+        """
+        results = list(self.library.find({"job_id": {"$in": list(job_ids)}}, {"stdout": 0}))
+        if not results:
+            return {"deleted_job_ids": [], "gridfs_filenames": []}
+        filenames = []
+        for result in results:
+            filenames.extend(load_files_from_gridfs(self.result_data_store, result, do_read=False))
+            if JobStatus.from_string(result["status"]) in (JobStatus.ERROR, JobStatus.TIMEOUT, JobStatus.CANCELLED):
+                filenames.append(_error_info_filename(result["job_id"]))
+        deleted_gridfs_files = self._delete_gridfs_files(filenames, dry_run=dry_run)
+        if dry_run:
+            blob_counts = Counter(blob["sha256"] for result in results for blob in result.get("gridfs_blobs", []))
+            deleted_gridfs_files.extend(self._release_blobs(blob_counts, dry_run=True))
+            live_job_ids = [result["job_id"] for result in results if result["status"] != JobStatus.DELETED.value]
+            return {"deleted_job_ids": live_job_ids, "gridfs_filenames": deleted_gridfs_files}
+
+        job_ids_with_stdout = [result["job_id"] for result in results if "stdout_lines" in result]
+        if job_ids_with_stdout:
+            try:
+                self.stdout_library.delete_many({"job_id": {"$in": job_ids_with_stdout}})
+            except pymongo.errors.OperationFailure:
+                logger.debug("Could not delete stdout; it will be dropped from the capped collection.")
+        # Only the results which this call removed have their blobs released and are taken out of the summary, so that
+        # concurrent deletes of the same results don't do either twice.
+        removed = self._move_to_tombstones(results)
+        # Blobs are released once nothing refers to them, so an interruption here leaves blobs behind rather than
+        # releasing them twice.
+        blob_counts = Counter(blob["sha256"] for result in removed for blob in result.get("gridfs_blobs", []))
+        deleted_gridfs_files.extend(self._release_blobs(blob_counts))
+
+        # Results deleted by older versions are moved to tombstones too, but were already taken out of the summary.
+        live_results = [result for result in removed if result["status"] != JobStatus.DELETED.value]
+        by_report = defaultdict(list)
+        for result in live_results:
+            by_report[result["report_name"]].append(result)
+        for report_name, report_results in by_report.items():
+            start_times = [r["job_start_time"] for r in report_results if r.get("job_start_time")]
+            self._count_in_summary(
+                report_name,
+                -len(report_results),
+                -sum(1 for r in report_results if r.get("scheduler_job_id")),
+                max(start_times) if start_times else None,
+            )
+        deleted_job_ids = [result["job_id"] for result in live_results]
+        return {"deleted_job_ids": deleted_job_ids, "gridfs_filenames": deleted_gridfs_files}
+
     def get_job_ids_older_than(self, cutoff: datetime.datetime, report_name: Optional[str] = None) -> List[str]:
         query = {"job_start_time": {"$lte": cutoff}}
-        query = _add_deleted_status_to_filter(query)
         if report_name:
             query["report_name"] = report_name
+        query = self._exclude_legacy_deleted(query)
         to_delete = [d["job_id"] for d in self.library.find(query, {"_id": 0, "job_id": 1})]
         return to_delete
 
@@ -572,3 +1503,7 @@ def _css_inlining_filename(job_id: str) -> str:
 
 def _error_info_filename(job_id: str) -> str:
     return f"{job_id}.errorinfo"
+
+
+def _blob_filename(sha256: str) -> str:
+    return f"blobs/{sha256}"
@@ -0,0 +1,124 @@
+"""
+A registry of MongoClients, shared by every serializer in the process which connects with the same parameters.
+A MongoClient is thread-safe and holds a pool of connections, so creating one per serializer (e.g. per request) only
+pays for new connections and leaks the sockets of the old ones until they are garbage-collected.
+"""
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
+
+_lock = threading.Lock()
+_clients: Dict[Tuple, MongoClient] = {}
+
+
+class PoolStats(ConnectionPoolListener):
+    """Counts the checkouts of connections from the pools of the registry's clients, and how long they waited."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.checkout_wait_seconds = 0.0
+            self.checked_out = 0
+            self.connections = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checkout_wait_seconds": self.checkout_wait_seconds,
+                "checked_out": self.checked_out,
+                "connections": self.connections,
+            }
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.checkout_wait_seconds += getattr(event, "duration", 0.0) or 0.0
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            self.checkout_wait_seconds += getattr(event, "duration", 0.0) or 0.0
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+pool_stats = PoolStats()
+
+
+def get_mongo_client(
+    host: str, username: Optional[str] = None, password: Optional[str] = None, **options
+) -> MongoClient:
+    """
+    :return: The MongoClient of this process for the given parameters, which is created on first use.
+    :param options: Passed to MongoClient, e.g. maxPoolSize or serverSelectionTimeoutMS. Options which are None are
+                    left at pymongo's defaults.
+    """
+    options = {k: v for k, v in options.items() if v is not None}
+    key = (host, username, password, tuple(sorted(options.items())))
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = MongoClient(host, username=username, password=password, event_listeners=[pool_stats], **options)
+            _clients[key] = client
+        return client
+
+
+def close_all() -> None:
+    """Closes every client in the registry; clients which are asked for afterwards are created afresh."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+def _forget_clients_after_fork():
+    # MongoClients aren't fork-safe, so a forked child starts with an empty registry rather than its parent's clients.
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+    pool_stats._lock = threading.Lock()
+    pool_stats.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_clients_after_fork)
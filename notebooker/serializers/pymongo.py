@@ -1,8 +1,14 @@
 import click
-from pymongo import MongoClient
 
-from notebooker.constants import DEFAULT_DATABASE_NAME, DEFAULT_MONGO_HOST, DEFAULT_RESULT_COLLECTION_NAME
-from notebooker.serialization.mongo import MongoResultSerializer
+from notebooker.constants import (
+    DEFAULT_DATABASE_NAME,
+    DEFAULT_GRIDFS_COMPRESSION,
+    DEFAULT_MONGO_HOST,
+    DEFAULT_RESULT_COLLECTION_NAME,
+    DEFAULT_STDOUT_COLLECTION_SIZE_MB,
+)
+from notebooker.serialization.mongo import GRIDFS_COMPRESSION_OPTIONS, MongoResultSerializer
+from notebooker.serialization.mongo_clients import get_mongo_client
 
 
 @click.command()
@@ -21,6 +27,51 @@ from notebooker.serialization.mongo import MongoResultSerializer
     default=DEFAULT_RESULT_COLLECTION_NAME,
     help="The name of the collection to which we are saving notebook results.",
 )
+@click.option(
+    "--gridfs-compression",
+    default=DEFAULT_GRIDFS_COMPRESSION,
+    type=click.Choice(GRIDFS_COMPRESSION_OPTIONS),
+    help="How the HTML, .ipynb and CSS of new results are compressed in GridFS. zstd requires notebooker[zstd]. "
+    "Results are readable whichever compression they were saved with, but versions before 0.8.0 can't read "
+    "compressed results, so only enable it once every reader has been upgraded.",
+)
+@click.option(
+    "--stdout-collection-size-mb",
+    default=DEFAULT_STDOUT_COLLECTION_SIZE_MB,
+    type=int,
+    help="The size of the capped collection which holds the stdout of jobs, line by line. The oldest lines are "
+    "dropped once it is full. Only used when the collection is first created.",
+)
+@click.option(
+    "--mongo-max-pool-size",
+    default=None,
+    type=int,
+    help="The maximum number of connections to mongo which are open at once. Defaults to pymongo's default (100).",
+)
+@click.option(
+    "--mongo-min-pool-size", default=None, type=int, help="The number of connections to mongo which are kept open."
+)
+@click.option(
+    "--mongo-wait-queue-timeout-ms",
+    default=None,
+    type=int,
+    help="How long to wait for a connection when all of them are in use, before giving up. Defaults to no limit.",
+)
+@click.option(
+    "--mongo-connect-timeout-ms", default=None, type=int, help="How long to wait when opening a connection to mongo."
+)
+@click.option(
+    "--mongo-server-selection-timeout-ms",
+    default=None,
+    type=int,
+    help="How long to wait for a suitable mongo server, e.g. a primary, to be available.",
+)
+@click.option(
+    "--mongo-socket-timeout-ms",
+    default=None,
+    type=int,
+    help="How long to wait for a reply from mongo before giving up. Defaults to no limit.",
+)
 def cli_options():
     pass
 
@@ -33,14 +84,45 @@ class PyMongoResultSerializer(MongoResultSerializer, cli_options=cli_options):
         database_name=DEFAULT_DATABASE_NAME,
         mongo_host=DEFAULT_MONGO_HOST,
         result_collection_name=DEFAULT_RESULT_COLLECTION_NAME,
+        gridfs_compression=DEFAULT_GRIDFS_COMPRESSION,
+        stdout_collection_size_mb=DEFAULT_STDOUT_COLLECTION_SIZE_MB,
+        mongo_max_pool_size=None,
+        mongo_min_pool_size=None,
+        mongo_wait_queue_timeout_ms=None,
+        mongo_connect_timeout_ms=None,
+        mongo_server_selection_timeout_ms=None,
+        mongo_socket_timeout_ms=None,
         **kwargs,
     ):
         self.mongo_user = mongo_user or None
         self.mongo_password = mongo_password or None
-        super(PyMongoResultSerializer, self).__init__(database_name, mongo_host, result_collection_name)
+        self.mongo_max_pool_size = mongo_max_pool_size
+        self.mongo_min_pool_size = mongo_min_pool_size
+        self.mongo_wait_queue_timeout_ms = mongo_wait_queue_timeout_ms
+        self.mongo_connect_timeout_ms = mongo_connect_timeout_ms
+        self.mongo_server_selection_timeout_ms = mongo_server_selection_timeout_ms
+        self.mongo_socket_timeout_ms = mongo_socket_timeout_ms
+        super(PyMongoResultSerializer, self).__init__(
+            database_name,
+            mongo_host,
+            result_collection_name,
+            gridfs_compression=gridfs_compression,
+            stdout_collection_size_mb=stdout_collection_size_mb,
+        )
 
     def get_mongo_connection(self):
-        return MongoClient(self.mongo_host, username=self.mongo_user, password=self.mongo_password)
+        # Serializers with the same connection parameters share one client, and with it a pool of connections.
+        return get_mongo_client(
+            self.mongo_host,
+            username=self.mongo_user,
+            password=self.mongo_password,
+            maxPoolSize=self.mongo_max_pool_size,
+            minPoolSize=self.mongo_min_pool_size,
+            waitQueueTimeoutMS=self.mongo_wait_queue_timeout_ms,
+            connectTimeoutMS=self.mongo_connect_timeout_ms,
+            serverSelectionTimeoutMS=self.mongo_server_selection_timeout_ms,
+            socketTimeoutMS=self.mongo_socket_timeout_ms,
+        )
 
     def get_mongo_database(self):
         return self.get_mongo_connection().get_database(self.database_name)
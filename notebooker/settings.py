@@ -2,7 +2,13 @@ from typing import Dict
 
 from dataclasses import dataclass, asdict
 
-from notebooker.constants import DEFAULT_SERIALIZER, DEFAULT_MAILFROM_ADDRESS, DEFAULT_RUNNING_TIMEOUT
+from notebooker.constants import (
+    DEFAULT_KERNEL_MAX_RUNS,
+    DEFAULT_MAILFROM_ADDRESS,
+    DEFAULT_MEMORY_CACHE_SIZE_MB,
+    DEFAULT_RUNNING_TIMEOUT,
+    DEFAULT_SERIALIZER,
+)
 
 
 @dataclass
@@ -57,8 +63,33 @@ class WebappConfig(BaseConfig):
     # The temporary directory which will contain the .ipynb templates which have been converted from the .py templates.
     # Defaults to a random directory in ~/.notebooker/webcache.
     CACHE_DIR: str = ""
+    # The size of the in-memory cache which holds recently-used values of the cache in CACHE_DIR. 0 disables it.
+    MEMORY_CACHE_SIZE_MB: int = DEFAULT_MEMORY_CACHE_SIZE_MB
+    # Where the cache behind the in-memory cache is kept: "filesystem" (in CACHE_DIR) or "redis" (at CACHE_REDIS_URL).
+    # Replicas of the webapp which share a Redis server share its cache, and only one of them runs the report hunter.
+    CACHE_BACKEND: str = "filesystem"
+    CACHE_REDIS_URL: str = ""
 
     SCHEDULER_MONGO_DATABASE: str = ""
     SCHEDULER_MONGO_COLLECTION: str = ""
     DISABLE_SCHEDULER: bool = False
     READONLY_MODE: bool = False
+
+    # The number of long-lived worker processes, each holding a pre-started kernel, which execute reports.
+    # If 0, every report is executed in a brand new notebooker-cli subprocess.
+    WORKER_POOL_SIZE: int = 0
+    # The number of reports a worker's kernel executes before it is replaced with a fresh one.
+    KERNEL_MAX_RUNS: int = DEFAULT_KERNEL_MAX_RUNS
+    # When WORKER_POOL_SIZE is set, the number of processes which render PDFs as a separate stage. Results are then
+    # saved as soon as their HTML is ready, and their PDF is attached once it has been rendered. If 0, PDFs are
+    # rendered by the kernel workers before the result is saved.
+    PDF_POOL_SIZE: int = 0
+
+    # The maximum number of reports executing at once. Further reports wait as SUBMITTED in a queue, in which
+    # interactive requests take priority over scheduled runs. If 0, reports start executing as soon as they are submitted.
+    MAX_CONCURRENT_JOBS: int = 0
+    # When MAX_CONCURRENT_JOBS is set, the maximum number of executing reports per report name (0 means no limit).
+    MAX_CONCURRENT_JOBS_PER_REPORT: int = 0
+    # When MAX_CONCURRENT_JOBS is set, the maximum number of executing reports per requesting user (0 means no limit).
+    # Users are identified by the X-Auth-Username header.
+    MAX_CONCURRENT_JOBS_PER_USER: int = 0
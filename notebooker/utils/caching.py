@@ -1,9 +1,144 @@
+import copy
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
 import retrying
 from cachelib.file import FileSystemCache
+from cachelib.redis import RedisCache
 
+from notebooker.constants import DEFAULT_MEMORY_CACHE_SIZE_MB, NotebookResultBase
 from notebooker.utils.filesystem import get_cache_dir
 
+try:
+    import redis
+except ImportError:
+    redis = None
+
+CACHE_BACKENDS = ("filesystem", "redis")
+REDIS_KEY_PREFIX = "notebooker:cache:"
+
 cache = None
+# The client of the Redis server which is shared between webapp replicas, if the cache backend is "redis".
+redis_client = None
+# Values read from the file cache are kept in memory for at most this long, as their remaining timeout isn't known.
+# With a shared backend this also applies to values set by this process, as other replicas may since have replaced them.
+FILE_CACHE_HIT_TIMEOUT = 5
+# Keys which are missing from the file cache are remembered for this long, so that repeated lookups skip the disk.
+FILE_CACHE_MISS_TIMEOUT = 1
+_NOT_CACHED = object()
+
+
+class MemoryCache(object):
+    """
+    An in-process LRU cache which sits in front of the file cache, so that hot values are served without disk reads
+    or unpickling. Values are kept as they are, and callers mustn't change them. The exception is results, whose
+    payload loads lazily: they are kept and served as shallow copies, so that loading it doesn't grow the cached
+    result. It is bounded by the total pickled size of its values, measured when they are set, rather than by the
+    number of entries. Misses of the file cache are cached as None.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        """:return: The cached value, or _NOT_CACHED if there isn't one, or it has expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return _NOT_CACHED
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return _detach(entry[0])
+
+    def set(self, key: str, value: Any, timeout: float) -> None:
+        if self.max_bytes <= 0:
+            return
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        value = _detach(value)
+        expiry = time.time() + timeout if timeout else float("inf")
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, expiry)
+            self.n_bytes += size
+            while self.n_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.n_bytes,
+            }
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.n_bytes -= size
+
+
+def _detach(value: Any) -> Any:
+    """:return: The value, or a shallow copy of it, if it's a result, whose payload loads lazily without changing it."""
+    return copy.copy(value) if isinstance(value, NotebookResultBase) else value
+
+
+memory_cache = MemoryCache(DEFAULT_MEMORY_CACHE_SIZE_MB * 1024 * 1024)
+
+
+def configure_cache(cache_backend: str, memory_cache_size_mb: int, redis_url: str = "") -> None:
+    """
+    Sets up the in-memory cache and the cache behind it. The "filesystem" backend is local to this machine, whereas
+    the "redis" backend is shared between all webapp replicas which use the same Redis server.
+    """
+    global cache, memory_cache, redis_client
+    if cache_backend not in CACHE_BACKENDS:
+        raise ValueError(f"The cache backend must be one of {CACHE_BACKENDS}, not {cache_backend}")
+    if cache_backend == "redis":
+        if redis is None:
+            raise ImportError("The redis cache backend requires redis: pip install notebooker[redis]")
+        if not redis_url:
+            raise ValueError("The redis cache backend requires a Redis URL, e.g. redis://localhost:6379/0")
+    memory_cache = MemoryCache(memory_cache_size_mb * 1024 * 1024)
+    if cache_backend == "redis":
+        redis_client = redis.Redis.from_url(redis_url)
+        cache = RedisCache(host=redis_client, key_prefix=REDIS_KEY_PREFIX)
+    else:
+        redis_client = None
+        cache = None
+
+
+def get_redis_client():
+    """:return: The client of the Redis server shared between webapp replicas, or None if there isn't one."""
+    return redis_client
+
+
+def _memory_timeout(timeout):
+    if redis_client is None:
+        return timeout
+    return min(timeout, FILE_CACHE_HIT_TIMEOUT) if timeout else FILE_CACHE_HIT_TIMEOUT
 
 
 def _cache_key(report_name, job_id):
@@ -13,9 +148,14 @@ def _cache_key(report_name, job_id):
 @retrying.retry(stop_max_attempt_number=3)
 def get_cache(key, cache_dir=None):
     global cache
-    if cache is None:
-        cache = FileSystemCache(cache_dir or get_cache_dir())
-    return cache.get(str(key))
+    key = str(key)
+    value = memory_cache.get(key)
+    if value is _NOT_CACHED:
+        if cache is None:
+            cache = FileSystemCache(cache_dir or get_cache_dir())
+        value = cache.get(key)
+        memory_cache.set(key, value, FILE_CACHE_HIT_TIMEOUT if value is not None else FILE_CACHE_MISS_TIMEOUT)
+    return value
 
 
 def get_report_cache(report_name, job_id, cache_dir=None):
@@ -28,6 +168,7 @@ def set_cache(key, value, timeout=15, cache_dir=None):
     if cache is None:
         cache = FileSystemCache(cache_dir or get_cache_dir())
     cache.set(str(key), value, timeout=timeout)
+    memory_cache.set(str(key), value, _memory_timeout(timeout))
 
 
 def set_report_cache(report_name, job_id, value, timeout=15, cache_dir=None):
@@ -1,4 +1,6 @@
 import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional
 
 from tqdm import tqdm
@@ -9,16 +11,31 @@ from notebooker.settings import BaseConfig
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_CLEANUP_BATCH_SIZE = 500
+DEFAULT_CLEANUP_WORKERS = 4
 
-def delete_old_reports(config: BaseConfig, days_cutoff: int, report_name: Optional[str], dry_run: bool = True) -> None:
+
+def delete_old_reports(
+    config: BaseConfig,
+    days_cutoff: int,
+    report_name: Optional[str],
+    dry_run: bool = True,
+    batch_size: int = DEFAULT_CLEANUP_BATCH_SIZE,
+    workers: int = DEFAULT_CLEANUP_WORKERS,
+) -> None:
     """
     Delete notebooker reports older than specified days.
 
+    Reports are deleted in batches, each with a few bulk queries, by a pool of threads. A batch's reports are only
+    marked as deleted once their files are gone, so an interrupted cleanup carries on where it stopped when run again.
+
     Args:
         config: The configuration which will point to the serializer class and config.
         days_cutoff: Delete reports older than this many days
         report_name: Optionally specify which report_name we should be removing old reports for.
         dry_run: If True, only show what would be deleted without actually deleting
+        batch_size: The number of reports deleted together.
+        workers: The number of batches deleted at once.
     """
     serializer = get_serializer_from_cls(config.SERIALIZER_CLS, **config.SERIALIZER_CONFIG)
     cutoff_date = datetime.datetime.now() - datetime.timedelta(days=days_cutoff)
@@ -35,16 +52,34 @@ def delete_old_reports(config: BaseConfig, days_cutoff: int, report_name: Option
     logger.info(f"Found {num_reports} reports older than {days_cutoff} days")
 
     # Delete reports
-    logger.info("Starting deletion process...")
-    for report in tqdm(to_delete, desc="Deleting reports"):
-        try:
-            removed = serializer.delete_result(report, dry_run=dry_run)
-            logger.info(
-                f"{'Would have deleted' if dry_run else 'Deleted'}: "
-                f"Title={removed['deleted_result_document']['report_title']}, "
-                f"GridFS files={removed['gridfs_filenames']}"
-            )
-        except Exception as e:
-            logger.error(f"Failed to delete report {report}: {str(e)}")
-
-    logger.info(f"{'Would have' if dry_run else 'Successfully'} removed {num_reports} reports")
+    logger.info(f"Starting deletion process with {workers} workers, in batches of {batch_size}...")
+    batches = [to_delete[i : i + batch_size] for i in range(0, num_reports, batch_size)]
+    n_deleted = n_files = n_failed = 0
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool, tqdm(total=num_reports, desc="Deleting reports") as progress:
+        futures = {pool.submit(serializer.delete_results, batch, dry_run=dry_run): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                removed = future.result()
+            except Exception as e:
+                n_failed += len(batch)
+                logger.error(f"Failed to delete a batch of {len(batch)} reports, starting with {batch[0]}: {str(e)}")
+            else:
+                n_deleted += len(removed["deleted_job_ids"])
+                n_files += len(removed["gridfs_filenames"])
+                logger.debug(
+                    f"{'Would have deleted' if dry_run else 'Deleted'}: "
+                    f"Job IDs={removed['deleted_job_ids']}, GridFS files={removed['gridfs_filenames']}"
+                )
+            progress.update(len(batch))
+            elapsed = time.monotonic() - start
+            progress.set_postfix(reports_per_second=f"{n_deleted / elapsed:.1f}" if elapsed else "-")
+
+    elapsed = time.monotonic() - start
+    logger.info(
+        f"{'Would have' if dry_run else 'Successfully'} removed {n_deleted} reports and {n_files} GridFS files "
+        f"in {elapsed:.1f}s ({n_deleted / elapsed if elapsed else 0:.1f} reports/s)"
+    )
+    if n_failed:
+        logger.error(f"Failed to delete {n_failed} reports. Run the cleanup again to retry them.")
@@ -1,14 +1,16 @@
+import functools
 import os
 import uuid
-from typing import Any, AnyStr, Dict, Optional
+from typing import Any, AnyStr, Dict, Optional, Tuple
 
 import git
 import jupytext
 import nbconvert
 import nbformat
 import pkg_resources
-from nbconvert import HTMLExporter, PDFExporter, SlidesExporter
+from nbconvert import HTMLExporter, PDFExporter, SlidesExporter, TemplateExporter
 from nbconvert.exporters.exporter import ResourcesDict
+from nbconvert.preprocessors import ExtractOutputPreprocessor
 from packaging import version
 from traitlets.config import Config
 
@@ -21,44 +23,107 @@ def get_resources_dir(job_id):
     return "{}/resources".format(job_id)
 
 
+@functools.lru_cache(maxsize=None)
+def _nbtemplate_path(template_filename: str) -> str:
+    return pkg_resources.resource_filename(__name__, f"../nbtemplates/{template_filename}")
+
+
+def _html_template_path() -> str:
+    if version.parse(nbconvert.__version__) >= version.parse("7.0.0"):
+        return _nbtemplate_path("notebooker_html_output.tpl")
+    return _nbtemplate_path("notebooker_html_output_deprecated.tpl")
+
+
+@functools.lru_cache(maxsize=None)
+def get_exporter(
+    exporter_type: str, hide_code: bool = False, template_file: Optional[str] = None, extract_outputs: bool = False
+) -> TemplateExporter:
+    """
+    Returns a configured nbconvert exporter. Each combination of arguments is built once per process, so that
+    the template lookup and Jinja template compilation are not repeated for every conversion. Exporters do not keep
+    any per-notebook state, so the same instance is reused for every conversion.
+
+    :param exporter_type: One of "html", "slides" or "pdf".
+    :param hide_code: Whether to exclude code cells and prompts from the output.
+    :param template_file: For "html", the template to render with. Defaults to nbconvert's own template.
+    :param extract_outputs: For "html", whether to run ExtractOutputPreprocessor as part of the conversion.
+    """
+    c = Config()
+    if exporter_type == "slides":
+        c.TagRemovePreprocessor.remove_cell_tags = ("injected-parameters", "parameters")
+        c.SlidesExporter.preprocessors = ["nbconvert.preprocessors.TagRemovePreprocessor"]
+        return SlidesExporter(config=c)
+    if exporter_type == "pdf":
+        c.PDFExporter.exclude_input = hide_code
+        c.PDFExporter.exclude_input_prompt = hide_code
+        c.PDFExporter.exclude_output_prompt = hide_code
+        c.HTMLExporter.template_file = _nbtemplate_path("notebooker_pdf_output.tplx")
+        return PDFExporter(c)
+    if exporter_type == "html":
+        if extract_outputs:
+            c.HTMLExporter.preprocessors = ["nbconvert.preprocessors.ExtractOutputPreprocessor"]
+        if template_file:
+            c.HTMLExporter.template_file = template_file
+        if hide_code:
+            c.HTMLExporter.exclude_input = True
+            c.HTMLExporter.exclude_input_prompt = True
+            c.HTMLExporter.exclude_output_prompt = True
+        return HTMLExporter(config=c)
+    raise ValueError(f"Unknown exporter type: {exporter_type}")
+
+
+def _strip_callables(resources: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for (k, v) in resources.items() if not callable(v)}
+
+
 def ipython_to_html(
     ipynb_path: str, job_id: str, hide_code: bool = False, is_slideshow: bool = False
 ) -> (nbformat.NotebookNode, Dict[str, Any]):
     with open(ipynb_path, "r") as nb_file:
         nb = nbformat.reads(nb_file.read(), as_version=nbformat.v4.nbformat)
-    c = Config()
     if is_slideshow:
-        c.TagRemovePreprocessor.remove_cell_tags = ("injected-parameters", "parameters")
-        c.SlidesExporter.preprocessors = ["nbconvert.preprocessors.TagRemovePreprocessor"]
-        exporter = SlidesExporter(config=c)
-        html, resources = exporter.from_notebook_node(nb)
+        html, resources = get_exporter("slides").from_notebook_node(nb)
     else:
-        c.HTMLExporter.preprocessors = ["nbconvert.preprocessors.ExtractOutputPreprocessor"]
-        if version.parse(nbconvert.__version__) >= version.parse("7.0.0"):
-            template_filename = "notebooker_html_output.tpl"
-        else:
-            template_filename = "notebooker_html_output_deprecated.tpl"
-        c.HTMLExporter.template_file = pkg_resources.resource_filename(__name__, f"../nbtemplates/{template_filename}")
-
-        c.HTMLExporter.exclude_input = hide_code
-        c.HTMLExporter.exclude_input_prompt = hide_code
-        c.HTMLExporter.exclude_output_prompt = hide_code
-        html_exporter_with_figs = HTMLExporter(config=c)
+        html_exporter_with_figs = get_exporter(
+            "html", hide_code=hide_code, template_file=_html_template_path(), extract_outputs=True
+        )
         resources_dir = get_resources_dir(job_id)
         html, resources = html_exporter_with_figs.from_notebook_node(nb, resources={"output_files_dir": resources_dir})
-    resources = {k: v for (k, v) in resources.items() if not callable(v)}
-    return html, resources
+    return html, _strip_callables(resources)
 
 
-def ipython_to_pdf(raw_executed_ipynb: str, report_title: str, hide_code: bool = False) -> AnyStr:
-    c = Config()
-    c.PDFExporter.exclude_input = hide_code
-    c.PDFExporter.exclude_input_prompt = hide_code
-    c.PDFExporter.exclude_output_prompt = hide_code
-    c.HTMLExporter.template_file = pkg_resources.resource_filename(
-        __name__, "../nbtemplates/notebooker_pdf_output.tplx"
+def ipython_to_html_variants(
+    raw_executed_ipynb: str, job_id: str, hide_code: bool = False, is_slideshow: bool = False
+) -> Tuple[str, str, Dict[str, Any]]:
+    """
+    Renders an executed notebook to both its full HTML and its email HTML, which hides the code if hide_code is set.
+    The notebook is parsed, and its outputs extracted, only once for both renders. If hide_code is not set, or for
+    slideshows (which ignore hide_code), both variants are the same render.
+
+    :return: (html, email_html, resources)
+    """
+    nb = nbformat.reads(raw_executed_ipynb, as_version=nbformat.v4.nbformat)
+    if is_slideshow:
+        html, resources = get_exporter("slides").from_notebook_node(nb)
+        return html, html, _strip_callables(resources)
+
+    resources = {"output_files_dir": get_resources_dir(job_id), "outputs": {}}
+    nb, resources = ExtractOutputPreprocessor().preprocess(nb, resources)
+    template_file = _html_template_path()
+    html, full_resources = get_exporter("html", template_file=template_file).from_notebook_node(
+        nb, resources=dict(resources)
     )
-    pdf_exporter = PDFExporter(c)
+    if hide_code:
+        email_html, _ = get_exporter("html", hide_code=True, template_file=template_file).from_notebook_node(
+            nb, resources=dict(resources)
+        )
+    else:
+        email_html = html
+    return html, email_html, _strip_callables(full_resources)
+
+
+def ipython_to_pdf(raw_executed_ipynb: str, report_title: str, hide_code: bool = False) -> AnyStr:
+    pdf_exporter = get_exporter("pdf", hide_code=hide_code)
     resources = ResourcesDict()
     resources["metadata"] = ResourcesDict()
     resources["metadata"]["name"] = report_title
@@ -0,0 +1,35 @@
+"""
+Lets the code which writes a job's stdout or status in this process tell the webapp's live status streams that the
+job has changed, so that they read the change straight away rather than at their next poll of the database.
+"""
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# The number of jobs whose changes are remembered; older jobs are forgotten, and their streams fall back to polling.
+MAX_TRACKED_JOBS = 10000
+
+
+class JobEvents(object):
+    """
+    Counts the changes published for each job. Readers compare the count with the one they last saw, rather than
+    waiting on it, as the publishers are threads whilst the webapp's streams are greenlets.
+    """
+
+    def __init__(self, max_jobs: int = MAX_TRACKED_JOBS):
+        self.max_jobs = max_jobs
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def publish(self, job_id: str) -> None:
+        with self._lock:
+            self._versions[job_id] = self._versions.pop(job_id, 0) + 1
+            while len(self._versions) > self.max_jobs:
+                self._versions.popitem(last=False)
+
+    def version(self, job_id: str) -> Optional[int]:
+        """:return: The number of changes published for the job, or None if none have been published in this process."""
+        return self._versions.get(job_id)
+
+
+job_events = JobEvents()
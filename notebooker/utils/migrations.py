@@ -0,0 +1,49 @@
+import logging
+
+from notebooker.serialization.serialization import get_serializer_from_cls
+from notebooker.settings import BaseConfig
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_overrides_hash(config: BaseConfig, batch_size: int = 1000) -> int:
+    """
+    Sets the overrides fingerprint on results saved by older versions of Notebooker, which are otherwise not found
+    when looking up the latest result for some overrides.
+
+    Args:
+        config: The configuration which will point to the serializer class and config.
+        batch_size: The number of results updated in each write to the database.
+    """
+    serializer = get_serializer_from_cls(config.SERIALIZER_CLS, **config.SERIALIZER_CONFIG)
+    n_updated = serializer.backfill_overrides_hash(batch_size=batch_size)
+    logger.info(f"Set the overrides hash of {n_updated} results")
+    return n_updated
+
+
+def rebuild_summary(config: BaseConfig) -> None:
+    """
+    Recounts the per-report summary shown on the index page from the results, e.g. after upgrading from a version of
+    Notebooker which didn't maintain it, or if updates to it have failed.
+
+    Args:
+        config: The configuration which will point to the serializer class and config.
+    """
+    serializer = get_serializer_from_cls(config.SERIALIZER_CLS, **config.SERIALIZER_CONFIG)
+    serializer.rebuild_summary()
+    logger.info("Rebuilt the summary of each report's results")
+
+
+def migrate_deleted_results(config: BaseConfig, batch_size: int = 1000) -> int:
+    """
+    Moves the results which older versions of Notebooker marked as deleted out of the result collection and into the
+    tombstone collection, so that queries of live results don't have to skip them.
+
+    Args:
+        config: The configuration which will point to the serializer class and config.
+        batch_size: The number of results moved together.
+    """
+    serializer = get_serializer_from_cls(config.SERIALIZER_CLS, **config.SERIALIZER_CONFIG)
+    n_moved = serializer.migrate_deleted_results(batch_size=batch_size)
+    logger.info(f"Moved {n_moved} deleted results to the tombstone collection")
+    return n_moved
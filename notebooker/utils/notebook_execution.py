@@ -1,16 +1,25 @@
+import html
 import os
 import re
 import shutil
 import tempfile
 from logging import getLogger
-from typing import Union
+from typing import Any, Dict, List, NamedTuple, Optional, Union
 
-from notebooker.constants import TEMPLATE_DIR_SEPARATOR, NotebookResultComplete, NotebookResultError
+from notebooker.constants import TEMPLATE_DIR_SEPARATOR, JobStatus, NotebookResultComplete, NotebookResultError
 from notebooker.utils.mail import mail
 
 logger = getLogger(__name__)
 
 
+class VariantOutcome(NamedTuple):
+    """The outcome of one set of overrides when a report is iterated over the values of an override."""
+
+    job_id: str
+    overrides: Dict[str, Any]
+    error_info: Optional[str]
+
+
 def _output_dir(output_base_dir, report_name, job_id):
     return os.path.join(output_base_dir, report_name, job_id)
 
@@ -74,3 +83,40 @@ def send_result_email(result: Union[NotebookResultComplete, NotebookResultError]
         logger.info("Not sending email as no recipients specified")
         return
     _send_email(from_email=mailfrom, to_email=to_email, result=result)
+
+
+def send_variant_summary_email(
+    outcomes: List[VariantOutcome],
+    report_title: str,
+    mailto: str,
+    error_mailto: str,
+    email_subject: str,
+    mailfrom: str,
+) -> None:
+    """Sends a single email summarising every variant of an iterated report, rather than one email per variant."""
+    failures = [outcome for outcome in outcomes if outcome.error_info]
+    to_email = (error_mailto or mailto) if failures else mailto
+    if not to_email:
+        logger.info("Not sending summary email as no recipients specified")
+        return
+    if failures:
+        status = f"{len(failures)} of {len(outcomes)} variants failed"
+    else:
+        status = f"{len(outcomes)} variants completed"
+    subject = f"Notebooker: {report_title} report: {status}"
+    if not failures:
+        subject = email_subject or subject
+    rows = "".join(
+        "<tr><td>{}</td><td>{}</td><td>{}</td></tr>".format(
+            html.escape(outcome.job_id),
+            html.escape(str(outcome.overrides)),
+            (JobStatus.ERROR if outcome.error_info else JobStatus.DONE).value,
+        )
+        for outcome in outcomes
+    )
+    header = "<tr><th>Job ID</th><th>Overrides</th><th>Status</th></tr>"
+    body = f"<p>{html.escape(status)}.</p><table>{header}{rows}</table>"
+    for outcome in failures:
+        body += "<h4>{}</h4><pre>{}</pre>".format(html.escape(outcome.job_id), html.escape(outcome.error_info))
+    logger.info("Sending summary email for %d variants to %s", len(outcomes), to_email)
+    mail(mailfrom, to_email, subject, ["Please activate HTML emails to see the summary.", body])
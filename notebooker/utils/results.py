@@ -110,33 +110,56 @@ def get_all_result_keys(
     return all_keys
 
 
+def _result_listing_json(result: constants.NotebookResultBase, readonly_mode: bool) -> Dict:
+    output = result.saveable_output()
+    job_id = output["job_id"]
+    report_name = output["report_name"]
+    urls = {"ipynb_url": "", "pdf_url": "", "result_url": "", "rerun_url": "", "clone_url": "", "delete_url": ""}
+    if job_id:
+        new_urls = {
+            "result_url": url_for("serve_results_bp.task_results", report_name=report_name, job_id=job_id),
+            "ipynb_url": url_for("serve_results_bp.download_ipynb_result", report_name=report_name, job_id=job_id),
+            "pdf_url": url_for("serve_results_bp.download_pdf_result", report_name=report_name, job_id=job_id),
+        }
+        urls.update(new_urls)
+        if not readonly_mode:
+            urls.update(
+                {
+                    "rerun_url": url_for("run_report_bp.rerun_report", report_name=report_name, job_id=job_id),
+                    "delete_url": url_for("run_report_bp.delete_report", report_name=report_name, job_id=job_id),
+                }
+            )
+    output.update(urls)
+    return output
+
+
 def get_all_available_results_json(
     serializer: MongoResultSerializer, limit: int, report_name: str = None, readonly_mode: bool = False
 ) -> List[constants.NotebookResultBase]:
-    json_output = []
     mongo_filter = {"report_name": report_name} if report_name is not None else {}
-    for result in serializer.get_all_results(mongo_filter=mongo_filter, limit=limit, load_payload=False):
-        output = result.saveable_output()
-        job_id = output["job_id"]
-        report_name = output["report_name"]
-        urls = {"ipynb_url": "", "pdf_url": "", "result_url": "", "rerun_url": "", "clone_url": "", "delete_url": ""}
-        if job_id:
-            new_urls = {
-                "result_url": url_for("serve_results_bp.task_results", report_name=report_name, job_id=job_id),
-                "ipynb_url": url_for("serve_results_bp.download_ipynb_result", report_name=report_name, job_id=job_id),
-                "pdf_url": url_for("serve_results_bp.download_pdf_result", report_name=report_name, job_id=job_id),
-            }
-            urls.update(new_urls)
-            if not readonly_mode:
-                urls.update(
-                    {
-                        "rerun_url": url_for("run_report_bp.rerun_report", report_name=report_name, job_id=job_id),
-                        "delete_url": url_for("run_report_bp.delete_report", report_name=report_name, job_id=job_id),
-                    }
-                )
-        output.update(urls)
-        json_output.append(output)
-    return json_output
+    return [
+        _result_listing_json(result, readonly_mode)
+        for result in serializer.get_all_results(mongo_filter=mongo_filter, limit=limit, load_payload=False)
+    ]
+
+
+def get_results_page_json(
+    serializer: MongoResultSerializer,
+    limit: int,
+    cursor: Optional[str] = None,
+    sort_by: str = "update_time",
+    ascending: bool = False,
+    readonly_mode: bool = False,
+    **filters,
+) -> Dict:
+    """
+    :param filters: Filters of the results, as taken by MongoResultSerializer.get_results_page().
+    :return: A page of results as shown in the result listing, and the cursor of the next page, if there is one.
+    """
+    results, next_cursor = serializer.get_results_page(
+        limit=limit, cursor=cursor, sort_by=sort_by, ascending=ascending, **filters
+    )
+    return {"results": [_result_listing_json(result, readonly_mode) for result in results], "next_cursor": next_cursor}
 
 
 def get_count_and_latest_time_per_report(serializer: MongoResultSerializer, subfolder: Optional[str] = None):
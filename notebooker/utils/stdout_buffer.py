@@ -0,0 +1,79 @@
+"""
+Buffers the stdout of a running job, so that it is written to the database in batches rather than with one round trip
+per line. A batch is written once it reaches a number of lines, and a background thread writes whatever has been
+buffered at a regular interval, so that lines are never held back for long when a job logs slowly.
+"""
+import threading
+from logging import getLogger
+from typing import Callable, List, Optional
+
+logger = getLogger(__name__)
+
+STDOUT_FLUSH_INTERVAL_SECONDS = 0.25
+STDOUT_FLUSH_LINES = 500
+
+
+class StdoutBuffer(object):
+    """
+    :param result_serializer: The serializer whose update_stdout() writes each batch.
+    :param job_id: The job whose stdout is buffered.
+    :param on_flush: Called after each batch has been written.
+    """
+
+    def __init__(
+        self,
+        result_serializer,
+        job_id: str,
+        flush_interval: float = STDOUT_FLUSH_INTERVAL_SECONDS,
+        max_lines: int = STDOUT_FLUSH_LINES,
+        on_flush: Optional[Callable[[], None]] = None,
+    ):
+        self.result_serializer = result_serializer
+        self.job_id = job_id
+        self.flush_interval = flush_interval
+        self.max_lines = max_lines
+        self.on_flush = on_flush
+        self._lines: List[str] = []
+        self._lock = threading.Lock()
+        # Held while a batch is written, so that batches are written in the order in which they were taken.
+        self._write_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, name=f"stdout-{job_id}", daemon=True)
+        self._flusher.start()
+
+    def append(self, line: str) -> None:
+        with self._lock:
+            self._lines.append(line)
+            is_full = len(self._lines) >= self.max_lines
+        if is_full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._write_lock:
+            with self._lock:
+                lines, self._lines = self._lines, []
+            if not lines:
+                return
+            self.result_serializer.update_stdout(self.job_id, new_lines=lines)
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def close(self) -> None:
+        """Stops the background flushes and writes the lines which are still buffered."""
+        self._closed.set()
+        self._flusher.join()
+        self.flush()
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                # The lines of a failed batch are lost, but the job carries on and later batches are still written.
+                logger.exception("Failed to write the stdout of job %s.", self.job_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
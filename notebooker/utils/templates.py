@@ -3,11 +3,9 @@ from typing import Optional
 
 import nbformat
 import pkg_resources
-from nbconvert import HTMLExporter
-from traitlets.config import Config
 
 from notebooker.utils.caching import get_cache, set_cache
-from notebooker.utils.conversion import generate_ipynb_from_py
+from notebooker.utils.conversion import generate_ipynb_from_py, get_exporter
 from notebooker.utils.filesystem import get_template_dir
 
 logger = getLogger(__name__)
@@ -52,13 +50,11 @@ def _get_preview(
         template_name, notebooker_disable_git, py_template_dir, warn_on_local=warn_on_local
     )
     parameters_idx = _get_parameters_cell_idx(nb)
-    conf = Config()
+    template_file = None
     if parameters_idx is not None:
         # Use this template to highlight the cell with parameters
-        conf.HTMLExporter.template_file = pkg_resources.resource_filename(
-            __name__, "../nbtemplates/notebook_preview.tpl"
-        )
-    exporter = HTMLExporter(config=conf)
+        template_file = pkg_resources.resource_filename(__name__, "../nbtemplates/notebook_preview.tpl")
+    exporter = get_exporter("html", template_file=template_file)
     html, _ = exporter.from_notebook_node(nb) if nb["cells"] else ("", "")
     set_cache(("preview", template_name), html, timeout=30)
     return html
@@ -1,4 +1,5 @@
 import atexit
+import functools
 import logging
 import os
 import threading
@@ -12,11 +13,14 @@ from flask import Flask
 from gevent.pywsgi import WSGIServer
 
 from notebooker.constants import CANCEL_MESSAGE, JobStatus
+from notebooker.execute_notebook import maintain_job_queue
 from notebooker.serialization.mongo import MongoResultSerializer
 from notebooker.serialization.serialization import initialize_serializer_from_config, get_serializer_from_cls
 from notebooker.settings import WebappConfig
+from notebooker.utils.caching import configure_cache
 from notebooker.utils.filesystem import _cleanup_dirs, initialise_base_dirs
 from notebooker.web.converters import DateConverter
+from notebooker.job_queue import start_job_queue, stop_job_queue
 from notebooker.web.report_hunter import _report_hunter
 from notebooker.web.routes.core import core_bp
 from notebooker.web.routes.index import index_bp
@@ -25,6 +29,7 @@ from notebooker.web.routes.report_execution import run_report_bp
 from notebooker.web.routes.scheduling import scheduling_bp
 from notebooker.web.routes.serve_results import serve_results_bp
 from notebooker.web.routes.templates import templates_bp
+from notebooker.worker_pool import start_pdf_pool, start_worker_pool, stop_pdf_pool, stop_worker_pool
 
 logger = logging.getLogger(__name__)
 all_report_refresher: Optional[threading.Thread] = None
@@ -46,6 +51,9 @@ def _cleanup_on_exit():
     if "pytest" in sys.modules or not all_report_refresher:
         return
     os.environ["NOTEBOOKER_APP_STOPPING"] = "1"
+    stop_job_queue()
+    stop_worker_pool(wait=False)
+    stop_pdf_pool(wait=False)
     _cancel_all_jobs()
     _cleanup_dirs(GLOBAL_CONFIG)
     if all_report_refresher:
@@ -63,6 +71,18 @@ def start_app(webapp_config: WebappConfig):
     all_report_refresher = threading.Thread(target=_report_hunter, args=(webapp_config,))
     all_report_refresher.daemon = True
     all_report_refresher.start()
+    if webapp_config.WORKER_POOL_SIZE > 0:
+        start_worker_pool(webapp_config.WORKER_POOL_SIZE, webapp_config.KERNEL_MAX_RUNS)
+        if webapp_config.PDF_POOL_SIZE > 0:
+            start_pdf_pool(webapp_config.PDF_POOL_SIZE)
+    if webapp_config.MAX_CONCURRENT_JOBS > 0:
+        start_job_queue(
+            webapp_config.MAX_CONCURRENT_JOBS,
+            max_per_report=webapp_config.MAX_CONCURRENT_JOBS_PER_REPORT,
+            max_per_user=webapp_config.MAX_CONCURRENT_JOBS_PER_USER,
+            # Also re-enqueues, from the start, the jobs which were waiting in a queue whose process has stopped.
+            on_tick=functools.partial(maintain_job_queue, webapp_config),
+        )
 
 
 def create_app(webapp_config=None):
@@ -121,6 +141,7 @@ def setup_scheduler(flask_app, web_config):
 def setup_app(flask_app: Flask, web_config: WebappConfig):
     # Setup environment
     initialise_base_dirs(web_config)
+    configure_cache(web_config.CACHE_BACKEND, web_config.MEMORY_CACHE_SIZE_MB, redis_url=web_config.CACHE_REDIS_URL)
     logging.basicConfig(level=logging.getLevelName(web_config.LOGGING_LEVEL))
     flask_app.config.from_object(web_config)
     flask_app.config.update(
@@ -0,0 +1,62 @@
+"""
+Elects a single leader among webapp replicas which share a Redis server, so that work such as the report hunter's
+refresh is done once rather than by every replica. The leader holds a lease in Redis which it renews while it is
+alive; if it stops renewing it, the lease expires and another replica takes over.
+"""
+import os
+import socket
+import uuid
+from logging import getLogger
+
+try:
+    from redis.exceptions import WatchError
+except ImportError:
+    WatchError = None
+
+logger = getLogger(__name__)
+
+
+class LeaderElection(object):
+    """
+    :param redis_client: The client of the Redis server shared by the replicas.
+    :param name: The name of the task which the leader performs.
+    :param lease_ms: How long the lease lasts without being renewed. is_leader() must be called more often than this.
+    """
+
+    def __init__(self, redis_client, name: str, lease_ms: int):
+        self.redis_client = redis_client
+        self.key = f"notebooker:leader:{name}"
+        self.lease_ms = lease_ms
+        self.identity = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4()}"
+        self._was_leader = False
+
+    def is_leader(self) -> bool:
+        """Acquires the lease if nobody holds it, or renews it if we do. Returns whether we are the leader."""
+        is_leader = bool(self.redis_client.set(self.key, self.identity, nx=True, px=self.lease_ms)) or self._renew()
+        if is_leader != self._was_leader:
+            logger.info("%s %s leader of %s.", self.identity, "became" if is_leader else "is no longer", self.key)
+            self._was_leader = is_leader
+        return is_leader
+
+    def release(self) -> None:
+        """Gives up the lease if we hold it, so that another replica can take over straight away."""
+        self._if_holder(lambda pipe: pipe.delete(self.key))
+        self._was_leader = False
+
+    def _renew(self) -> bool:
+        return self._if_holder(lambda pipe: pipe.pexpire(self.key, self.lease_ms))
+
+    def _if_holder(self, command) -> bool:
+        # Check-and-set, so that we never touch a lease which another replica acquired after ours expired.
+        with self.redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(self.key)
+                if pipe.get(self.key) != self.identity.encode():
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                command(pipe)
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
@@ -2,10 +2,15 @@ import datetime
 import os
 import time
 from logging import getLogger
+from typing import Callable
+
+from pymongo.errors import OperationFailure
 
 from notebooker.constants import SUBMISSION_TIMEOUT, JobStatus
 from notebooker.serialization.serialization import initialize_serializer_from_config
-from notebooker.utils.caching import get_report_cache, set_report_cache
+from notebooker.utils.caching import get_redis_client, get_report_cache, set_report_cache
+from notebooker.utils.job_events import job_events
+from notebooker.web.leader_election import LeaderElection
 from notebooker.settings import WebappConfig
 
 logger = getLogger(__name__)
@@ -61,77 +66,172 @@ class LRUSet(object):
         return len(self._linked_list_members)
 
 
+class ReportHunter(object):
+    """
+    Keeps the webapp's cache and prometheus counters up to date with the results in storage, and times out jobs
+    which have been submitted or running for too long.
+
+    :param cache_timeout: The time in seconds for which results are cached.
+    :param refresh_period_seconds: How often stale jobs are timed out, and updates are polled for when change
+                                   streams aren't available.
+    """
+
+    def __init__(self, webapp_config: WebappConfig, serializer, cache_timeout: int, refresh_period_seconds: int):
+        self.webapp_config = webapp_config
+        self.serializer = serializer
+        self.cache_timeout = cache_timeout
+        self.refresh_period_seconds = refresh_period_seconds
+        self.last_query = None
+        self.resume_token = None
+        self.recent_failed_job_ids = LRUSet(1000)
+        self.recent_successful_job_ids = LRUSet(1000)
+
+    def time_out_stale_jobs(self):
+        now = datetime.datetime.now()
+        cutoff = {
+            JobStatus.SUBMITTED: now - datetime.timedelta(minutes=SUBMISSION_TIMEOUT),
+            JobStatus.PENDING: now - datetime.timedelta(minutes=self.webapp_config.RUNNING_TIMEOUT),
+        }
+        all_pending = self.serializer.get_all_results(
+            mongo_filter={
+                "status": {"$in": [JobStatus.SUBMITTED.value, JobStatus.PENDING.value]},
+                # Jobs which are waiting in a job queue, in any process, for an execution slot have not failed to
+                # submit. They only time out if no queue has recorded them as waiting for as long as the timeout.
+                "queue.heartbeat": {"$not": {"$gte": cutoff[JobStatus.SUBMITTED]}},
+            },
+            load_payload=False,
+        )
+        cutoff.update({k.value: v for (k, v) in cutoff.items()})  # Add value to dict for backwards compat
+        for result in all_pending:
+            this_cutoff = cutoff.get(result.status)
+            if result.job_start_time <= this_cutoff:
+                delta_seconds = (now - this_cutoff).total_seconds()
+                self.serializer.update_check_status(
+                    result.job_id,
+                    JobStatus.TIMEOUT,
+                    error_info="This request timed out while being submitted to run. "
+                    "Please try again! Timed out after {:.0f} minutes "
+                    "{:.0f} seconds.".format(delta_seconds / 60, delta_seconds % 60),
+                )
+
+    def poll_updates(self):
+        """Processes the results which have been updated since the last poll, with a small buffer."""
+        _last_query = datetime.datetime.now() - datetime.timedelta(seconds=self.refresh_period_seconds)
+        ct = 0
+        # Results' payloads are only read from GridFS if a user requests them from the cache, and nobody reads their
+        # stdout from the cache.
+        for result in self.serializer.get_all_results(since=self.last_query, load_stdout=False):
+            ct += 1
+            self.process_update(result)
+        logger.debug("Found {} updates since {}.".format(ct, self.last_query))
+        self.last_query = _last_query
+
+    def process_update(self, result):
+        # Prometheus logging
+        if result.status == JobStatus.DONE and result.job_id not in self.recent_successful_job_ids:
+            try_register_success_prometheus(result.report_name, result.report_title)
+            self.recent_successful_job_ids.add(result.job_id)
+        if result.status == JobStatus.ERROR and result.job_id not in self.recent_failed_job_ids:
+            try_register_fail_prometheus(result.report_name, result.report_title)
+            self.recent_failed_job_ids.add(result.job_id)
+
+        # Cache population
+        cache_dir = self.webapp_config.CACHE_DIR
+        existing = get_report_cache(result.report_name, result.job_id, cache_dir=cache_dir)
+        if not existing or result.status != existing.status:  # Only update the cache when the status changes
+            set_report_cache(result.report_name, result.job_id, result, timeout=self.cache_timeout, cache_dir=cache_dir)
+            job_events.publish(result.job_id)
+            logger.info(
+                "Report-hunter found a change for {} (status: {}->{})".format(
+                    result.job_id, existing.status if existing else None, result.status
+                )
+            )
+
+    def follow_changes(self, should_stop: Callable[[], bool]) -> bool:
+        """
+        Processes results from a change stream as soon as they change, timing out stale jobs every refresh period,
+        until should_stop() returns True at the end of a refresh period.
+
+        :return: False if change streams aren't available, in which case updates must be polled for instead.
+        """
+        try:
+            stream = self.serializer.watch_results(
+                resume_after=self.resume_token, max_await_time_ms=self.refresh_period_seconds * 1000
+            )
+        except OperationFailure as e:
+            if self.resume_token is None:
+                logger.info("Change streams are not available (%s), so polling for updates instead.", e)
+                return False
+            # The stream can't be resumed, e.g. because the change has left the oplog. Catch up by polling instead.
+            logger.warning("Could not resume the change stream (%s), so starting a new one.", e)
+            self.resume_token = None
+            return self.follow_changes(should_stop)
+        with stream:
+            # Catch up on anything which changed before the stream was opened.
+            self.poll_updates()
+            next_refresh = time.time() + self.refresh_period_seconds
+            while True:
+                change = stream.try_next()
+                if change is not None:
+                    result = self.serializer.result_from_change(change)
+                    if result is not None:
+                        self.process_update(result)
+                self.resume_token = stream.resume_token
+                if time.time() >= next_refresh:
+                    if should_stop():
+                        return True
+                    self.time_out_stale_jobs()
+                    # Changes up to now have been seen on the stream, so a catch-up poll needn't go back any further.
+                    self.last_query = datetime.datetime.now() - datetime.timedelta(seconds=self.refresh_period_seconds)
+                    next_refresh = time.time() + self.refresh_period_seconds
+
+
 def _report_hunter(webapp_config: WebappConfig, run_once: bool = False, timeout: int = 120):
     """
     This is a function designed to run in a thread alongside the webapp. It updates the cache which the
-    web app reads from and performs some admin on pending/running jobs. The function terminates either when
+    web app reads from and performs some admin on pending/running jobs. Updates are followed on a change stream
+    where MongoDB supports them, and otherwise polled for. The function terminates either when
     run_once is set to True, or the "NOTEBOOKER_APP_STOPPING" environment variable is set.
     :param serializer_cls:
         The name of the serialiser (as acquired from Serializer.SERIALIZERNAME.value)
     :param run_once:
-        Whether to infinitely run this function or not.
+        Whether to infinitely run this function or not. If True, updates are polled for once.
     :param timeout:
         The time in seconds that we cache results. Defaults to 120s.
     :param serializer_kwargs:
         Any kwargs which are required for a Serializer to be initialised successfully.
     """
     serializer = initialize_serializer_from_config(webapp_config)
-    last_query = None
     refresh_period_seconds = 10
-    recent_failed_job_ids = LRUSet(1000)
-    recent_successful_job_ids = LRUSet(1000)
+    hunter = ReportHunter(webapp_config, serializer, timeout, refresh_period_seconds)
+    use_change_streams = not run_once
+    # Replicas which share a cache elect one of them to keep it up to date.
+    redis_client = get_redis_client()
+    election = None
+    if redis_client is not None:
+        election = LeaderElection(redis_client, "report_hunter", lease_ms=3 * refresh_period_seconds * 1000)
+
+    def should_stop():
+        return bool(os.getenv("NOTEBOOKER_APP_STOPPING")) or (election is not None and not election.is_leader())
 
     while not os.getenv("NOTEBOOKER_APP_STOPPING"):
+        if election is not None and not election.is_leader():
+            # Catch up on everything which changed while another replica was the leader when we take over.
+            hunter.last_query = None
+            hunter.resume_token = None
+            if run_once:
+                break
+            time.sleep(refresh_period_seconds)
+            continue
         try:
-            ct = 0
             # Now, get all pending requests and check they haven't timed out...
-            all_pending = serializer.get_all_results(
-                mongo_filter={"status": {"$in": [JobStatus.SUBMITTED.value, JobStatus.PENDING.value]}}
-            )
-            now = datetime.datetime.now()
-            cutoff = {
-                JobStatus.SUBMITTED: now - datetime.timedelta(minutes=SUBMISSION_TIMEOUT),
-                JobStatus.PENDING: now - datetime.timedelta(minutes=webapp_config.RUNNING_TIMEOUT),
-            }
-            cutoff.update({k.value: v for (k, v) in cutoff.items()})  # Add value to dict for backwards compat
-            for result in all_pending:
-                this_cutoff = cutoff.get(result.status)
-                if result.job_start_time <= this_cutoff:
-                    delta_seconds = (now - this_cutoff).total_seconds()
-                    serializer.update_check_status(
-                        result.job_id,
-                        JobStatus.TIMEOUT,
-                        error_info="This request timed out while being submitted to run. "
-                        "Please try again! Timed out after {:.0f} minutes "
-                        "{:.0f} seconds.".format(delta_seconds / 60, delta_seconds % 60),
-                    )
-            # Finally, check we have the latest updates with a small buffer
-            _last_query = datetime.datetime.now() - datetime.timedelta(seconds=refresh_period_seconds)
-            query_results = serializer.get_all_results(since=last_query)
-            for result in query_results:
-                ct += 1
-
-                # Prometheus logging
-                if result.status == JobStatus.DONE and result.job_id not in recent_successful_job_ids:
-                    try_register_success_prometheus(result.report_name, result.report_title)
-                    recent_successful_job_ids.add(result.job_id)
-                if result.status == JobStatus.ERROR and result.job_id not in recent_failed_job_ids:
-                    try_register_fail_prometheus(result.report_name, result.report_title)
-                    recent_failed_job_ids.add(result.job_id)
-
-                # Cache population
-                existing = get_report_cache(result.report_name, result.job_id, cache_dir=webapp_config.CACHE_DIR)
-                if not existing or result.status != existing.status:  # Only update the cache when the status changes
-                    set_report_cache(
-                        result.report_name, result.job_id, result, timeout=timeout, cache_dir=webapp_config.CACHE_DIR
-                    )
-                    logger.info(
-                        "Report-hunter found a change for {} (status: {}->{})".format(
-                            result.job_id, existing.status if existing else None, result.status
-                        )
-                    )
-            logger.debug("Found {} updates since {}.".format(ct, last_query))
-            last_query = _last_query
+            hunter.time_out_stale_jobs()
+            if use_change_streams:
+                use_change_streams = hunter.follow_changes(should_stop)
+                if use_change_streams:
+                    continue
+            # Finally, check we have the latest updates
+            hunter.poll_updates()
         except Exception as e:
             if run_once:
                 raise
@@ -139,4 +239,6 @@ def _report_hunter(webapp_config: WebappConfig, run_once: bool = False, timeout:
         if run_once:
             break
         time.sleep(refresh_period_seconds)
+    if election is not None:
+        election.release()
     logger.info("Report-hunting thread successfully killed.")
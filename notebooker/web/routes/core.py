@@ -1,8 +1,11 @@
+import datetime
+import json
+
 from flask import Blueprint, jsonify, request, current_app
 
 import notebooker.version
-from notebooker.constants import DEFAULT_RESULT_LIMIT
-from notebooker.utils.results import get_all_available_results_json
+from notebooker.constants import DEFAULT_RESULT_LIMIT, MAX_RESULT_PAGE_SIZE, JobStatus
+from notebooker.utils.results import get_all_available_results_json, get_results_page_json
 from notebooker.web.utils import get_serializer
 
 core_bp = Blueprint("core_bp", __name__)
@@ -40,6 +43,63 @@ def all_available_results():
         )
 
 
+def _parse_override_value(value: str):
+    # Overrides are matched as JSON values where they parse as one, so that e.g. "?override.n=5" matches n=5.
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+@core_bp.route("/core/get_results_page")
+def results_page():
+    """
+    Returns a page of results, filtered and sorted in the database, for the result listing to fetch page by page.
+
+    Query arguments, all optional:
+    - limit: The number of results in the page, up to MAX_RESULT_PAGE_SIZE. Defaults to DEFAULT_RESULT_LIMIT.
+    - cursor: The next_cursor returned with the previous page.
+    - sort: One of update_time (the default), job_start_time, report_title or status. order: "asc" or "desc".
+    - report_name, title (a case-insensitive substring of the report title), status (a JobStatus name, e.g. DONE;
+      may be repeated), started_after and started_before (ISO 8601 datetimes).
+    - override.<name>: Only results with this value for the override. Values are read as JSON where possible.
+
+    :returns: A JSON of the page's results as in /core/get_all_available_results, and the cursor of the next page \
+    (null if this is the last page).
+    """
+    try:
+        limit = min(int(request.args.get("limit") or DEFAULT_RESULT_LIMIT), MAX_RESULT_PAGE_SIZE)
+        statuses = [JobStatus[status] for status in request.args.getlist("status") if status]
+        started_after, started_before = (
+            datetime.datetime.fromisoformat(request.args[arg]) if request.args.get(arg) else None
+            for arg in ("started_after", "started_before")
+        )
+        overrides = {
+            key[len("override.") :]: _parse_override_value(value)
+            for key, value in request.args.items()
+            if key.startswith("override.")
+        }
+        with current_app.app_context():
+            return jsonify(
+                get_results_page_json(
+                    get_serializer(),
+                    limit,
+                    cursor=request.args.get("cursor") or None,
+                    sort_by=request.args.get("sort") or "update_time",
+                    ascending=request.args.get("order") == "asc",
+                    readonly_mode=current_app.config["READONLY_MODE"],
+                    report_name=request.args.get("report_name") or None,
+                    statuses=statuses,
+                    title=request.args.get("title") or None,
+                    started_after=started_after,
+                    started_before=started_before,
+                    overrides=overrides,
+                )
+            )
+    except (KeyError, ValueError) as e:
+        return jsonify({"status": "error", "error": f"Invalid query: {e}"}), 400
+
+
 @core_bp.route("/core/version")
 def get_version_no():
     """
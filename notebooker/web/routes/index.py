@@ -5,7 +5,7 @@ import inflection
 from flask import Blueprint, current_app, request, render_template, url_for, jsonify
 from notebooker.constants import JobStatus, DEFAULT_RESULT_LIMIT
 from notebooker.utils.results import get_all_result_keys
-from notebooker.web.utils import get_serializer, get_all_possible_templates
+from notebooker.web.utils import get_all_possible_templates
 
 index_bp = Blueprint("index_bp", __name__)
 
@@ -33,7 +33,7 @@ def index(subfolder: Optional[str] = None):
 @index_bp.route("/result_listing/<path:report_name>", methods=["GET"])
 def result_listing(report_name):
     """
-    The index page which returns a blank table which is async populated by /core/all_available_results.
+    The index page which returns a blank table which is async populated, page by page, by /core/get_results_page.
     Async populating the table from a different URL means that we can lock down the "core" blueprint to
     only users with correct privileges.
     """
@@ -48,7 +48,7 @@ def result_listing(report_name):
             username=username,
             report_name=report_name,
             result_limit=result_limit,
-            n_results_available=get_serializer().n_all_results_for_report_name(report_name),
+            job_statuses=[status for status in JobStatus if status != JobStatus.DELETED],
             titleised_report_name=inflection.titleize(report_name),
             readonly_mode=current_app.config["READONLY_MODE"],
             scheduler_disabled=current_app.config["DISABLE_SCHEDULER"],
@@ -1,11 +1,26 @@
-from flask import render_template, url_for, jsonify, Blueprint, request
+import json
+import time
+from typing import Iterator, Optional
+
+import gevent
+from flask import render_template, url_for, jsonify, Blueprint, request, Response
 
 from notebooker.constants import JobStatus
+from notebooker.serialization.mongo import MongoResultSerializer
+from notebooker.utils.job_events import job_events
 from notebooker.utils.results import _get_job_results, get_latest_job_results
 from notebooker.web.utils import get_serializer, _params_from_request_args
 
 pending_results_bp = Blueprint("pending_results_bp", __name__)
 
+FINISHED_STATUSES = (JobStatus.DONE, JobStatus.ERROR, JobStatus.TIMEOUT, JobStatus.CANCELLED)
+# How often a status stream checks whether this process has published a change to its job.
+STREAM_CHECK_SECONDS = 0.25
+# How often a status stream reads its job from the database regardless, for changes made by other processes.
+STREAM_POLL_SECONDS = 1.5
+# How often a status stream sends a comment when nothing has changed, so that proxies keep the connection open.
+STREAM_HEARTBEAT_SECONDS = 15
+
 
 def task_loading(report_name, job_id):
     """Loaded once, when the user queries /results/<report_name>/<job_id> and it is pending."""
@@ -13,23 +28,34 @@ def task_loading(report_name, job_id):
         "loading.html",
         job_id=job_id,
         location=url_for("pending_results_bp.task_status", report_name=report_name, job_id=job_id),
+        stream_location=url_for("pending_results_bp.task_status_stream", report_name=report_name, job_id=job_id),
     )
 
 
-def _get_job_status(job_id, report_name):
+def _get_job_status(job_id, report_name, stdout_offset=None):
     """
     Continuously polled for updates by the user client, until the notebook has completed execution (or errored).
+    If stdout_offset is given, only the lines of stdout from there onwards are returned, in "new_lines", along with
+    the offset to poll from next, in "stdout_offset".
     """
-    job_result = _get_job_results(job_id, report_name, get_serializer(), ignore_cache=True)
-    if job_result is None:
+    if stdout_offset is None:
+        job_result = _get_job_results(job_id, report_name, get_serializer(), ignore_cache=True)
+        status = job_result.status if job_result else None
+    else:
+        status_and_stdout = get_serializer().get_status_and_stdout(job_id, stdout_offset=stdout_offset)
+        status = status_and_stdout[0] if status_and_stdout else None
+    if status is None:
         return {"status": "Job not found. Did you use an old job ID?"}
-    if job_result.status in (JobStatus.DONE, JobStatus.ERROR, JobStatus.TIMEOUT, JobStatus.CANCELLED):
+    if status in FINISHED_STATUSES:
         response = {
-            "status": job_result.status.value,
+            "status": status.value,
             "results_url": url_for("serve_results_bp.task_results", report_name=report_name, job_id=job_id),
         }
+    elif stdout_offset is None:
+        response = {"status": status.value, "run_output": "\n".join(job_result.stdout)}
     else:
-        response = {"status": job_result.status.value, "run_output": "\n".join(job_result.stdout)}
+        _, new_lines, stdout_offset = status_and_stdout
+        response = {"status": status.value, "new_lines": new_lines, "stdout_offset": stdout_offset}
     return response
 
 
@@ -41,10 +67,80 @@ def task_status(report_name, job_id):
 
     :param report_name: The name of the report which we are running.
     :param job_id: The UUID of the job which we ran.
+    :param offset: (Optional, URL arg) Only return the lines of stdout from this offset onwards.
 
     :return: A JSON which contains "status" and either stdout in "run_output" or a URL to results in "results_url".
+             With an offset, stdout is in "new_lines" and the offset to poll from next is in "stdout_offset".
+    """
+    return jsonify(_get_job_status(job_id, report_name, stdout_offset=request.args.get("offset", type=int)))
+
+
+def _sse_event(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    lines = [f"event: {event}"] + ([f"id: {event_id}"] if event_id is not None else [])
+    return "\n".join(lines + [f"data: {json.dumps(data)}"]) + "\n\n"
+
+
+def _job_status_events(
+    serializer: MongoResultSerializer, job_id: str, results_url: str, stdout_offset: int = 0
+) -> Iterator[str]:
+    """
+    Yields server-sent events for a job until it finishes: "stdout" events with the lines which are new since the last
+    one, "status" events when the status changes, and a final "end" event. The id of each "stdout" event is the offset
+    of the next line, which EventSource sends back in Last-Event-ID when it reconnects.
     """
-    return jsonify(_get_job_status(job_id, report_name))
+    last_status = None
+    last_version = job_events.version(job_id)
+    last_read = last_sent = 0.0
+    while True:
+        now = time.monotonic()
+        version = job_events.version(job_id)
+        if last_status is None or version != last_version or now - last_read >= STREAM_POLL_SECONDS:
+            last_version, last_read = version, now
+            status_and_stdout = serializer.get_status_and_stdout(job_id, stdout_offset=stdout_offset)
+            if status_and_stdout is None:
+                yield _sse_event("status", {"status": "Job not found. Did you use an old job ID?"})
+                yield _sse_event("end", {})
+                return
+            status, new_lines, stdout_offset = status_and_stdout
+            if new_lines:
+                yield _sse_event("stdout", {"lines": new_lines}, event_id=stdout_offset)
+                last_sent = now
+            if status in FINISHED_STATUSES:
+                yield _sse_event("status", {"status": status.value, "results_url": results_url})
+                yield _sse_event("end", {})
+                return
+            if status != last_status:
+                yield _sse_event("status", {"status": status.value})
+                last_status, last_sent = status, now
+        if now - last_sent >= STREAM_HEARTBEAT_SECONDS:
+            yield ": heartbeat\n\n"
+            last_sent = now
+        # A cooperative sleep, as each stream is a greenlet of the webapp's gevent server.
+        gevent.sleep(STREAM_CHECK_SECONDS)
+
+
+@pending_results_bp.route("/status_stream/<path:report_name>/<job_id>")
+def task_status_stream(report_name, job_id):
+    """
+    Streams the status and stdout of a given report as server-sent events, sending each line of stdout once rather
+    than the whole of stdout on every poll of /status/<report_name>/<job_id>.
+
+    :param report_name: The name of the report which we are running.
+    :param job_id: The UUID of the job which we ran.
+
+    :return: A text/event-stream of "stdout", "status" and "end" events.
+    """
+    results_url = url_for("serve_results_bp.task_results", report_name=report_name, job_id=job_id)
+    try:
+        stdout_offset = max(int(request.headers.get("Last-Event-ID", 0)), 0)
+    except ValueError:
+        stdout_offset = 0
+    events = _job_status_events(get_serializer(), job_id, results_url, stdout_offset=stdout_offset)
+    response = Response(events, mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream.
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 
 @pending_results_bp.route("/status/<path:report_name>/latest")
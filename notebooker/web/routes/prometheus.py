@@ -2,8 +2,11 @@ import socket
 import time
 
 from flask import Blueprint, make_response, request
-from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, SummaryMetricFamily
 
+from notebooker.serialization import mongo_clients
+from notebooker.utils import caching
 from notebooker.utils.caching import get_cache
 
 REQUEST_LATENCY = Histogram(
@@ -30,6 +33,74 @@ N_FAILED_REPORTS = Counter(
     registry=REGISTRY,
     labelnames=["report_name", "report_title"],
 )
+QUEUE_DEPTH = Gauge(
+    "notebooker_queue_depth",
+    "Number of submitted jobs waiting for an execution slot",
+    registry=REGISTRY,
+    labelnames=["lane"],
+)
+QUEUE_RUNNING = Gauge(
+    "notebooker_queue_running_jobs",
+    "Number of jobs which the job queue has dispatched and which are still executing",
+    registry=REGISTRY,
+)
+QUEUE_WAIT = Histogram(
+    "notebooker_queue_wait_seconds",
+    "Time between a job being submitted and it being dispatched for execution",
+    registry=REGISTRY,
+    labelnames=["lane"],
+    buckets=(0.1, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, float("inf")),
+)
+
+
+class MemoryCacheCollector(object):
+    """Reports the counters of the in-memory cache when scraped, so that cache lookups don't update any metrics."""
+
+    def collect(self):
+        stats = caching.memory_cache.stats()
+        lookups = CounterMetricFamily(
+            "notebooker_memory_cache_lookups", "Lookups of the in-memory cache", labels=["outcome"]
+        )
+        lookups.add_metric(["hit"], stats["hits"])
+        lookups.add_metric(["miss"], stats["misses"])
+        yield lookups
+        yield CounterMetricFamily(
+            "notebooker_memory_cache_evictions", "Entries evicted from the in-memory cache", value=stats["evictions"]
+        )
+        yield GaugeMetricFamily("notebooker_memory_cache_bytes", "Size of the in-memory cache", value=stats["bytes"])
+        yield GaugeMetricFamily(
+            "notebooker_memory_cache_entries", "Number of entries in the in-memory cache", value=stats["entries"]
+        )
+
+
+REGISTRY.register(MemoryCacheCollector())
+
+
+class MongoPoolCollector(object):
+    """Reports the usage of the connection pools of the shared MongoClients when scraped."""
+
+    def collect(self):
+        stats = mongo_clients.pool_stats.stats()
+        checkouts = CounterMetricFamily(
+            "notebooker_mongo_pool_checkouts", "Checkouts of connections from the mongo pools", labels=["outcome"]
+        )
+        checkouts.add_metric(["success"], stats["checkouts"])
+        checkouts.add_metric(["failure"], stats["checkout_failures"])
+        yield checkouts
+        wait = SummaryMetricFamily(
+            "notebooker_mongo_pool_checkout_wait_seconds", "Time spent waiting to check out a connection to mongo"
+        )
+        wait.add_metric([], stats["checkouts"] + stats["checkout_failures"], stats["checkout_wait_seconds"])
+        yield wait
+        yield GaugeMetricFamily(
+            "notebooker_mongo_pool_checked_out", "Connections to mongo which are in use", value=stats["checked_out"]
+        )
+        yield GaugeMetricFamily(
+            "notebooker_mongo_pool_connections", "Open connections to mongo", value=stats["connections"]
+        )
+
+
+REGISTRY.register(MongoPoolCollector())
 
 prometheus_bp = Blueprint("prometheus", __name__)
 
@@ -66,6 +137,16 @@ def record_failed_report(report_name, report_title):
     N_SUCCESSFUL_REPORTS.labels(report_name, report_title).inc(0)
 
 
+def record_queue_depth(depth_by_lane, n_running):
+    for lane, depth in depth_by_lane.items():
+        QUEUE_DEPTH.labels(lane).set(depth)
+    QUEUE_RUNNING.set(n_running)
+
+
+def record_queue_wait(lane, wait_seconds):
+    QUEUE_WAIT.labels(lane).observe(wait_seconds)
+
+
 def setup_metrics(app):
     app.before_request(start_timer)
     # The order here matters since we want stop_timer
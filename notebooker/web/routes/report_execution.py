@@ -196,6 +196,7 @@ def _handle_run_report(
                 mailfrom=params.mailfrom,
                 email_subject=params.email_subject,
                 is_slideshow=params.is_slideshow,
+                submitted_by=request.headers.get("X-Auth-Username"),
             )
             return (
                 jsonify({"id": job_id}),
@@ -238,7 +239,7 @@ def run_checks_http(report_name):
     return _handle_run_report(report_name, overrides_dict, issues)
 
 
-def _rerun_report(job_id, prepare_only=False, run_synchronously=False):
+def _rerun_report(job_id, prepare_only=False, run_synchronously=False, submitted_by=None):
     result = get_serializer().get_check_result(job_id)
     if not result:
         abort(404)
@@ -262,6 +263,7 @@ def _rerun_report(job_id, prepare_only=False, run_synchronously=False):
         is_slideshow=result.is_slideshow,
         email_subject=result.email_subject,
         mailfrom=result.mailfrom,
+        submitted_by=submitted_by,
     )
     return new_job_id
 
@@ -277,7 +279,7 @@ def rerun_report(job_id, report_name):
 
     :returns: 202-redirects to the "task_status" interface.
     """
-    new_job_id = _rerun_report(job_id)
+    new_job_id = _rerun_report(job_id, submitted_by=request.headers.get("X-Auth-Username"))
     return jsonify(
         {"results_url": url_for("serve_results_bp.task_results", report_name=report_name, job_id=new_job_id)}
     )
@@ -286,8 +288,8 @@ def rerun_report(job_id, report_name):
 @run_report_bp.route("/delete_report/<job_id>", methods=["POST"])
 def delete_report(job_id):
     """
-    Deletes a report from the underlying storage. Only marks as "status=deleted" so the report is retrievable \
-    at a later date.
+    Deletes a report from the underlying storage. Its metadata is moved to the tombstone collection, so the report \
+    is retrievable at a later date.
 
     :param job_id: The UUID of the report to delete.
 
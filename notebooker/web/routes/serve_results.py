@@ -1,9 +1,12 @@
 import json
+import mimetypes
 import os
 from logging import getLogger
-from typing import Any, Union
+from typing import Any, Dict, Optional, Union
 
 from flask import Blueprint, Response, abort, render_template, request, url_for, jsonify, current_app
+from gridfs import GridOut
+from werkzeug.wsgi import wrap_file
 
 from notebooker.constants import (
     JobStatus,
@@ -12,7 +15,13 @@ from notebooker.constants import (
     NotebookResultError,
     NotebookResultPending,
 )
-from notebooker.serialization.mongo import _pdf_filename
+from notebooker.serialization.mongo import (
+    STREAM_CHUNK_SIZE,
+    _pdf_filename,
+    _raw_html_filename,
+    _raw_json_filename,
+    iter_grid_out,
+)
 from notebooker.web.routes.pending_results import task_loading
 from notebooker.web.utils import get_serializer, _params_from_request_args, get_all_possible_templates
 from notebooker.utils.conversion import get_resources_dir
@@ -21,6 +30,7 @@ from notebooker.utils.web import convert_report_name_path_to_url, convert_report
 
 serve_results_bp = Blueprint("serve_results_bp", __name__)
 logger = getLogger(__name__)
+RESOURCE_MAX_AGE_SECONDS = 365 * 24 * 60 * 60
 
 
 # ------------------- Serving results -------------------- #
@@ -103,8 +113,27 @@ def task_results_latest(report_name):
     return _render_results(job_id, report_name, result)
 
 
+def _gzipped_raw_html_response(result: NotebookResultComplete) -> Optional[Response]:
+    """
+    If the client accepts gzip and the HTML was stored gzipped, serve the stored bytes without decompressing them.
+    HTML which has already been read is served as it is, rather than being read again.
+    """
+    if request.accept_encodings["gzip"] <= 0 or result.is_loaded("raw_html"):
+        return None
+    serializer = get_serializer()
+    if serializer.gridfs_compression != "gzip":
+        # Results are only likely to be stored gzipped if new results are.
+        return None
+    gzipped = serializer.get_gzipped_file(_raw_html_filename(result.job_id))
+    if gzipped is None:
+        return None
+    return Response(gzipped, mimetype="text/html", headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+
+
 def _process_result_or_abort(result: NotebookResultBase) -> Union[str, Any]:
-    if isinstance(result, (NotebookResultError, NotebookResultComplete)):
+    if isinstance(result, NotebookResultComplete):
+        return _gzipped_raw_html_response(result) or result.raw_html
+    if isinstance(result, NotebookResultError):
         return result.raw_html
     if isinstance(result, NotebookResultPending):
         return task_loading(result.report_name, result.job_id)
@@ -262,13 +291,66 @@ def task_result_resources_html(job_id, resource, report_name):
 
     :return: A download of the data as requested. 404s if not found.
     """
-    result = _get_job_results(job_id, report_name, get_serializer())
-    if isinstance(result, NotebookResultComplete):
-        html_resources = result.raw_html_resources
-        resource_path = os.path.join(get_resources_dir(job_id), resource)
-        if resource_path in html_resources.get("outputs", {}):
-            return html_resources["outputs"][resource_path]
-    abort(404)
+    resource_path = os.path.join(get_resources_dir(job_id), resource)
+    stored = get_serializer().get_result_resource(job_id, resource_path)
+    if stored is None:
+        abort(404)
+    mimetype = mimetypes.guess_type(resource)[0] or "application/octet-stream"
+    if request.if_none_match.contains(stored.etag):
+        response = Response(mimetype=mimetype, status=304)
+    else:
+        response = _grid_out_response(stored.grid_out, mimetype)
+    # Outputs never change once saved, so they can be cached indefinitely by browsers and proxies.
+    response.set_etag(stored.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = RESOURCE_MAX_AGE_SECONDS
+    response.cache_control.immutable = True
+    return response
+
+
+def _stream_result_file(job_id: str, filename: str, mimetype: str, download_name: str) -> Optional[Response]:
+    """
+    Streams a GridFS file of a result to the client in chunks, so that large files are never held in memory.
+    Uncompressed files support Range requests. Returns None if the file is not in GridFS.
+    """
+    grid_out = get_serializer().open_result_file(job_id, filename)
+    if grid_out is None:
+        return None
+    headers = {"Content-Disposition": "attachment;filename={}".format(download_name)}
+    response = _grid_out_response(grid_out, mimetype, headers)
+    if (grid_out.metadata or {}).get("compression") is not None:
+        return response
+    response.set_etag(str(grid_out._id))
+    response.last_modified = grid_out.upload_date
+    return response.make_conditional(request, accept_ranges=True, complete_length=grid_out.length)
+
+
+def _grid_out_response(grid_out: GridOut, mimetype: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Streams a GridFS file to the client in chunks, so that it is never held in memory. Gzipped files are passed
+    through to clients which accept gzip, and otherwise decompressed as they are streamed.
+    """
+    headers = dict(headers or {})
+    compression = (grid_out.metadata or {}).get("compression")
+    if compression is None:
+        response = Response(
+            wrap_file(request.environ, grid_out, STREAM_CHUNK_SIZE),
+            mimetype=mimetype,
+            headers=headers,
+            direct_passthrough=True,
+        )
+        response.content_length = grid_out.length
+        return response
+    if compression == "gzip" and request.accept_encodings["gzip"] > 0:
+        headers.update({"Content-Encoding": "gzip", "Vary": "Accept-Encoding", "Content-Length": str(grid_out.length)})
+        return Response(
+            wrap_file(request.environ, grid_out, STREAM_CHUNK_SIZE),
+            mimetype=mimetype,
+            headers=headers,
+            direct_passthrough=True,
+        )
+    # The decompressed length isn't known until the whole file has been read, so this is sent without ranges.
+    return Response(iter_grid_out(grid_out), mimetype=mimetype, headers=headers)
 
 
 @serve_results_bp.route("/result_download_ipynb/<path:report_name>/<job_id>")
@@ -281,6 +363,12 @@ def download_ipynb_result(job_id, report_name):
 
     :return: A download of the .ipynb as requested. 404s if not found.
     """
+    response = _stream_result_file(
+        job_id, _raw_json_filename(job_id), "application/vnd.jupyter", "{}.ipynb".format(job_id)
+    )
+    if response is not None:
+        return response
+    # Results saved by older versions may hold the notebook in the result document rather than in GridFS.
     result = _get_job_results(job_id, report_name, get_serializer())
     if isinstance(result, NotebookResultComplete):
         return Response(
@@ -302,7 +390,13 @@ def download_pdf_result(job_id, report_name):
 
     :return: A download of the PDF as requested. 404s if not found.
     """
+    response = _stream_result_file(job_id, _pdf_filename(job_id), "application/pdf", _pdf_filename(job_id))
+    if response is not None:
+        return response
     result = _get_job_results(job_id, report_name, get_serializer())
+    if isinstance(result, NotebookResultComplete) and result.generate_pdf_output and not result.pdf:
+        # The PDF may have been attached after this result was cached.
+        result = _get_job_results(job_id, report_name, get_serializer(), ignore_cache=True)
     if isinstance(result, NotebookResultComplete):
         return Response(
             result.pdf,
@@ -320,12 +414,13 @@ def view_stdout(job_id, report_name):
 
     :param report_name: The name of the report.
     :param job_id: The UUID of the report.
+    :param offset: (Optional, URL arg) Only return the lines of stdout from this offset onwards.
 
     :return: The stdout for the job. 404s if not found.
     """
-    result = _get_job_results(job_id, report_name, get_serializer(), ignore_cache=True)
-
-    if isinstance(result, NotebookResultComplete):
-        return jsonify(result.stdout)
-    else:
+    # Only the status and stdout are read, rather than the whole result.
+    status_and_stdout = get_serializer().get_status_and_stdout(job_id, request.args.get("offset", 0, type=int))
+    if status_and_stdout is None or status_and_stdout[0] != JobStatus.DONE:
         abort(404)
+    _, lines, _ = status_and_stdout
+    return jsonify(lines)
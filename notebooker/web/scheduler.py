@@ -7,6 +7,7 @@ from logging import getLogger
 
 from notebooker.execute_notebook import run_report_in_subprocess
 from notebooker.web.app import GLOBAL_CONFIG
+from notebooker.job_queue import get_job_queue
 
 logger = getLogger(__name__)
 
@@ -41,7 +42,8 @@ def run_report(
             generate_pdf_output=generate_pdf,
             prepare_only=False,
             scheduler_job_id=scheduler_job_id,
-            run_synchronously=True,
+            # If the job queue is in use, it bounds concurrency so there is no need to block a scheduler thread.
+            run_synchronously=get_job_queue() is None,
             mailfrom=mailfrom,
             n_retries=0,
             is_slideshow=is_slideshow,
@@ -1,22 +1,35 @@
-$(document).ready(() => {
-    let results_url = "";
+const resizeParentIframe = function () {
+    const i = $("#resultsIframe", window.parent.document);
+    if (i.length) {
+        // Add 40 pixels to make sure we actually get the whole iframe contents...
+        i.css("height", `${i[0].contentWindow.document.body.scrollHeight + 40}px`);
+    }
+};
+
+// Polls for the status and only the lines of stdout which are new since the last poll.
+const pollStatus = function (statusUrl) {
+    const runOutput = [];
+    let stdoutOffset = 0;
     let last_data;
+    let intervalId;
     const load_status = function () {
         if (typeof last_data !== "undefined" && typeof last_data.results_url !== "undefined") {
             clearInterval(intervalId);
             top.window.location.href = last_data.results_url;
         }
         $.ajax({
-            url: loc, // We get this from loading.html, which comes from flask
+            url: statusUrl,
+            data: { offset: stdoutOffset },
             dataType: "json",
             success(data, status, request) {
-                results_url = data.results_url;
                 $("#loadingStatus").text(data.status);
-                $("#run_output").text(data.run_output);
+                if (typeof data.new_lines !== "undefined" && data.new_lines.length) {
+                    runOutput.push(...data.new_lines);
+                    stdoutOffset = data.stdout_offset;
+                    $("#run_output").text(runOutput.join("\n"));
+                }
                 last_data = data;
-                const i = $("#resultsIframe", window.parent.document);
-                // Add 40 pixels to make sure we actually get the whole iframe contents...
-                i.css("height", `${i[0].contentWindow.document.body.scrollHeight + 40}px`);
+                resizeParentIframe();
             },
             error(xhr, error) {
                 $("h2").text(xhr.responseJSON.status);
@@ -26,7 +39,49 @@ $(document).ready(() => {
         });
     };
     load_status();
-    let intervalId = window.setInterval(() => {
+    intervalId = window.setInterval(() => {
         load_status();
     }, 1500);
+};
+
+// Receives the status and only the new lines of stdout as they are written, rather than polling for all of stdout.
+const streamStatus = function (streamUrl) {
+    const runOutput = [];
+    const source = new EventSource(streamUrl);
+    source.addEventListener("stdout", (event) => {
+        runOutput.push(...JSON.parse(event.data).lines);
+        $("#run_output").text(runOutput.join("\n"));
+        resizeParentIframe();
+    });
+    source.addEventListener("status", (event) => {
+        const data = JSON.parse(event.data);
+        $("#loadingStatus").text(data.status);
+        if (typeof data.results_url !== "undefined") {
+            source.close();
+            top.window.location.href = data.results_url;
+        }
+    });
+    source.addEventListener("end", () => {
+        source.close();
+        $(".loader").hide();
+    });
+    return source;
+};
+
+$(document).ready(() => {
+    // We get these from loading.html, which comes from flask
+    if (typeof window.EventSource !== "undefined" && typeof streamLoc !== "undefined") {
+        streamStatus(streamLoc);
+    } else {
+        pollStatus(loc);
+    }
 });
+
+try {
+    module.exports = {
+        pollStatus,
+        streamStatus,
+    };
+} catch (e) {
+    // do nothing
+}
@@ -25,7 +25,45 @@ deleteReport = (delete_url) => {
         .modal("show");
 };
 
-create_datatable = (result, readonly_mode) => {
+// The result fields which the server can sort by, by the name of their column.
+const SORTABLE_COLUMNS = { title: "report_title", status: "status", job_start_time: "job_start_time" };
+
+getFilters = (report_name) => {
+    const filters = new URLSearchParams();
+    filters.set("report_name", report_name);
+    for (const [key, value] of new URLSearchParams(window.location.search)) {
+        if (key.startsWith("override.")) {
+            filters.append(key, value);
+        }
+    }
+    const status = $("#statusFilter").val();
+    if (status) {
+        filters.set("status", status);
+    }
+    for (const name of ["started_after", "started_before"]) {
+        const value = $(`#${name}`).val();
+        if (value) {
+            filters.set(name, value);
+        }
+    }
+    return filters;
+};
+
+fetchPage = (filters, limit, cursor, success, error) => {
+    const query = new URLSearchParams(filters);
+    query.set("limit", limit);
+    if (cursor) {
+        query.set("cursor", cursor);
+    }
+    $.ajax({
+        url: `/core/get_results_page?${query.toString()}`,
+        dataType: "json",
+        success: success,
+        error: error,
+    });
+};
+
+create_datatable = (firstPage, limit, report_name, readonly_mode) => {
     let columns = [
         {
             title: "Title",
@@ -35,8 +73,8 @@ create_datatable = (result, readonly_mode) => {
     ];
 
     let override_keys = new Set();
-    for (let i = 0; i < result.length; i++) {
-        for (let key in result[i].overrides) {
+    for (let i = 0; i < firstPage.results.length; i++) {
+        for (let key in firstPage.results[i].overrides) {
             override_keys.add(key);
         }
     }
@@ -55,7 +93,6 @@ create_datatable = (result, readonly_mode) => {
             },
         ]);
     }
-
     columns = columns.concat([
         {
             title: "Status",
@@ -154,34 +191,75 @@ create_datatable = (result, readonly_mode) => {
             },
         ]);
     }
-    let startTimeColumnIndex = 1 + override_keys.size + 1;
+    for (let column of columns) {
+        column.orderable = column.name in SORTABLE_COLUMNS;
+    }
+    // Pages are fetched with the cursor returned with the previous one, so the cursor of each page seen so far is kept.
+    // They start again from the first page whenever the sort order or filters change.
+    let cursors = [null];
+    let pagesKey = null;
+    let prefetched = firstPage;
     const $resultsTable = $("#resultsTable");
     table = $resultsTable.DataTable({
         columns: columns,
-        order: [[startTimeColumnIndex, "desc"]],
+        order: [],
+        serverSide: true,
+        pageLength: limit,
+        lengthChange: false,
+        pagingType: "simple",
+        info: false,
+        searchDelay: 400,
+        language: { search: "Title:" },
+        ajax: (data, callback) => {
+            const filters = getFilters(report_name);
+            if (data.order.length) {
+                filters.set("sort", SORTABLE_COLUMNS[columns[data.order[0].column].name]);
+                filters.set("order", data.order[0].dir);
+            }
+            if (data.search.value) {
+                filters.set("title", data.search.value);
+            }
+            const key = filters.toString();
+            if (key !== pagesKey) {
+                cursors = [null];
+                pagesKey = key;
+            }
+            const page = Math.floor(data.start / data.length);
+            const draw = (result) => {
+                cursors[page + 1] = result.next_cursor;
+                // Keyset pages have no total, so there is one more result than shown if there is a next page.
+                const nSeen = data.start + result.results.length + (result.next_cursor ? 1 : 0);
+                callback({ draw: data.draw, data: result.results, recordsTotal: nSeen, recordsFiltered: nSeen });
+            };
+            if (prefetched !== null) {
+                draw(prefetched);
+                prefetched = null;
+            } else {
+                fetchPage(filters, limit, cursors[page], draw, () => $("#failedLoad").fadeIn());
+            }
+        },
         initComplete: function (settings, json) {
             $("#resultsTable_wrapper").wrap("<div class='scrolledTable'></div>");
         },
     });
-    table.clear();
-    table.rows.add(result);
-    table.draw();
+    $(".resultFilter").on("change", () => table.draw());
     $("#indexTableContainer").fadeIn();
 };
 
 load_data = (limit, report_name, readonly_mode) => {
-    $.ajax({
-        url: `/core/get_all_available_results?limit=${limit}&report_name=${report_name}`,
-        dataType: "json",
-        success: (result) => {
-            create_datatable(result, readonly_mode);
+    fetchPage(
+        getFilters(report_name),
+        limit,
+        null,
+        (result) => {
+            create_datatable(result, limit, report_name, readonly_mode);
         },
-        error: (jqXHR, textStatus, errorThrown) => {
+        (jqXHR, textStatus, errorThrown) => {
             $("#failedLoad").fadeIn();
-        },
-    });
+        }
+    );
 };
 
 $(document).ready(() => {
-    load_data(LIMIT, REPORT_NAME, READONLY_MODE);
+    load_data(parseInt(LIMIT, 10), REPORT_NAME, READONLY_MODE);
 });
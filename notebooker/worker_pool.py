@@ -0,0 +1,366 @@
+"""
+A pool of long-lived worker processes which execute notebooks against pre-started ("warm") Jupyter kernels.
+
+Running a report via notebooker-cli pays for interpreter startup, importing papermill/nbconvert and starting a
+kernel on every single run. Workers in this pool pay those costs once, and keep a kernel running in between jobs.
+A kernel is recycled once it has executed a configurable number of notebooks, or as soon as a run using it fails.
+In between runs, the user namespace of the kernel is reset with %reset; note that modules imported by a notebook
+stay imported until the kernel is recycled.
+
+PDF rendering (xelatex) can optionally run as a separate stage in its own pool of processes. A kernel worker then
+saves the result as soon as its HTML is ready and hands the executed notebook over to that stage, so that it can
+start executing the next notebook straight away. The PDF is attached to the saved result once it has been rendered,
+after which the result email is sent.
+"""
+import atexit
+import functools
+import logging
+import os
+import multiprocessing
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple, Optional
+
+from notebooker.constants import NotebookResultComplete, NotebookResultError, kernel_spec
+from notebooker.settings import BaseConfig
+from notebooker.utils.stdout_buffer import StdoutBuffer
+
+logger = logging.getLogger(__name__)
+
+_worker_pool: Optional["WarmKernelPool"] = None
+_pdf_pool: Optional["PdfRenderingPool"] = None
+
+# State which is local to each worker process.
+_kernel_manager = None
+_kernel_runs = 0
+_max_runs_per_kernel = 1
+
+
+class PdfJob(NamedTuple):
+    """An executed notebook which has been saved without its PDF, as handed from a kernel worker to the PDF stage."""
+
+    job_id: str
+    ipynb_path: str
+    report_title: str
+    hide_code: bool
+
+
+class _StdoutHandler(logging.Handler):
+    """Pushes the log output of a job into its stdout in batches, as _monitor_stderr() does for subprocess runs."""
+
+    def __init__(self, result_serializer, job_id):
+        super().__init__()
+        self.buffer = StdoutBuffer(result_serializer, job_id)
+        self.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    def emit(self, record):
+        try:
+            self.buffer.append(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        try:
+            self.buffer.close()
+        finally:
+            super().close()
+
+
+def _start_kernel():
+    from jupyter_client import KernelManager
+
+    km = KernelManager(kernel_name=kernel_spec()["name"])
+    km.start_kernel()
+    return km
+
+
+def _shutdown_kernel():
+    global _kernel_manager
+    if _kernel_manager is not None:
+        try:
+            _kernel_manager.shutdown_kernel(now=True)
+        except Exception:
+            logger.exception("Failed to shut down kernel.")
+        _kernel_manager = None
+
+
+def _recycle_kernel():
+    global _kernel_runs, _kernel_manager
+    _shutdown_kernel()
+    _kernel_runs = 0
+    # Start the replacement straight away so that the next job doesn't have to wait for it.
+    _kernel_manager = _start_kernel()
+
+
+def _reset_kernel_namespace(km):
+    kc = km.client()
+    kc.start_channels()
+    try:
+        kc.wait_for_ready(timeout=60)
+        kc.execute_interactive("%reset -f", timeout=60)
+    finally:
+        kc.stop_channels()
+
+
+def _checkout_kernel():
+    if _kernel_manager is None or not _kernel_manager.is_alive():
+        _recycle_kernel()
+    return _kernel_manager
+
+
+def _checkin_kernel(failed: bool):
+    global _kernel_runs
+    _kernel_runs += 1
+    if failed or _kernel_runs >= _max_runs_per_kernel:
+        logger.info("Recycling kernel after %d run(s) (failed=%s).", _kernel_runs, failed)
+        _recycle_kernel()
+        return
+    try:
+        _reset_kernel_namespace(_kernel_manager)
+    except Exception:
+        logger.exception("Could not reset the kernel namespace; recycling the kernel instead.")
+        _recycle_kernel()
+
+
+def _init_worker(max_runs_per_kernel: int):
+    global _max_runs_per_kernel, _kernel_manager
+    # Pay the import costs once per worker rather than once per report.
+    import nbconvert  # noqa
+    import papermill  # noqa
+
+    _max_runs_per_kernel = max(max_runs_per_kernel, 1)
+    _kernel_manager = _start_kernel()
+    atexit.register(_shutdown_kernel)
+
+
+def _noop():
+    return None
+
+
+def _execute_job(
+    base_config: BaseConfig,
+    job_id: str,
+    job_submit_time,
+    report_name: str,
+    n_retries: int,
+    defer_pdf: bool = False,
+    **kwargs,
+) -> Optional[PdfJob]:
+    """
+    Runs inside a worker process; the equivalent of execute_notebook_entrypoint() for a single set of overrides.
+    :return: If defer_pdf is set and the report succeeded, the job for the PDF stage. It then sends the email.
+    """
+    from notebooker.execute_notebook import run_report
+    from notebooker.serialization.serialization import initialize_serializer_from_config
+    from notebooker.utils.conversion import _output_ipynb_name
+    from notebooker.utils.filesystem import initialise_base_dirs
+    from notebooker.utils.notebook_execution import _output_dir, send_result_email
+
+    output_dir, template_dir, _ = initialise_base_dirs(
+        output_dir=base_config.OUTPUT_DIR, template_dir=base_config.TEMPLATE_DIR
+    )
+    result_serializer = initialize_serializer_from_config(base_config)
+    # Executing with a pre-started kernel would ignore the working directory, so use a fresh kernel in that case.
+    km = None if base_config.EXECUTE_AT_ORIGIN else _checkout_kernel()
+    run = functools.partial(
+        run_report,
+        job_submit_time,
+        report_name,
+        result_serializer=result_serializer,
+        job_id=job_id,
+        output_base_dir=output_dir,
+        template_base_dir=template_dir,
+        notebooker_disable_git=base_config.NOTEBOOKER_DISABLE_GIT,
+        execute_at_origin=base_config.EXECUTE_AT_ORIGIN,
+        py_template_base_dir=base_config.PY_TEMPLATE_BASE_DIR,
+        py_template_subdir=base_config.PY_TEMPLATE_SUBDIR,
+        defer_pdf=defer_pdf,
+        **kwargs,
+    )
+    handler = _StdoutHandler(result_serializer, job_id)
+    logging.getLogger().addHandler(handler)
+    result = None
+    try:
+        if km is None:
+            result = run(attempts_remaining=n_retries - 1)
+        else:
+            # The attempt on the warm kernel is made on its own, so that the kernel is recycled if it fails, even if
+            # a retry (on a fresh kernel) then succeeds.
+            try:
+                result = run(attempts_remaining=0, kernel_manager=km)
+            finally:
+                _checkin_kernel(failed=result is None or isinstance(result, NotebookResultError) or not km.is_alive())
+            if isinstance(result, NotebookResultError) and n_retries > 1:
+                result = run(attempts_remaining=n_retries - 2)
+    finally:
+        logging.getLogger().removeHandler(handler)
+        handler.close()
+    if result is None:
+        return None
+    if defer_pdf and isinstance(result, NotebookResultComplete) and result.generate_pdf_output:
+        ipynb_path = os.path.join(_output_dir(output_dir, report_name, job_id), _output_ipynb_name(report_name))
+        return PdfJob(job_id, ipynb_path, result.report_title, result.hide_code)
+    send_result_email(result, base_config.DEFAULT_MAILFROM)
+    return None
+
+
+def _init_pdf_worker():
+    import nbconvert  # noqa
+
+
+def _render_pdf(base_config: BaseConfig, pdf_job: PdfJob):
+    """Runs inside a PDF worker process. Renders and attaches the PDF of a saved result, then sends its email."""
+    from notebooker.serialization.serialization import initialize_serializer_from_config
+    from notebooker.utils.conversion import ipython_to_pdf
+    from notebooker.utils.notebook_execution import send_result_email
+
+    result_serializer = initialize_serializer_from_config(base_config)
+    try:
+        with open(pdf_job.ipynb_path, "r") as f:
+            raw_executed_ipynb = f.read()
+        pdf = ipython_to_pdf(raw_executed_ipynb, pdf_job.report_title, hide_code=pdf_job.hide_code)
+        result_serializer.attach_pdf(pdf_job.job_id, pdf)
+        logger.info("Attached PDF to job %s.", pdf_job.job_id)
+    except Exception:
+        logger.exception("Failed to render the PDF of job %s. The result is available without it.", pdf_job.job_id)
+    result = result_serializer.get_check_result(pdf_job.job_id)
+    if result is not None:
+        send_result_email(result, base_config.DEFAULT_MAILFROM)
+
+
+class WarmKernelPool(object):
+    """
+    Dispatches notebook executions to a fixed number of worker processes, each of which holds a warm kernel.
+
+    :param n_workers: The number of worker processes, i.e. the maximum number of notebooks executing at once.
+    :param max_runs_per_kernel: The number of notebooks a kernel executes before it is replaced with a fresh one.
+    """
+
+    def __init__(self, n_workers: int, max_runs_per_kernel: int):
+        self.n_workers = n_workers
+        self.max_runs_per_kernel = max_runs_per_kernel
+        self._executor = self._create_executor()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # Use spawn so that workers do not inherit the webapp's threads, sockets or gevent state.
+        executor = ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.max_runs_per_kernel,),
+        )
+        for _ in range(self.n_workers):
+            executor.submit(_noop)
+        return executor
+
+    def submit(self, base_config: BaseConfig, job_id: str, job_submit_time, report_name: str, **kwargs) -> Future:
+        """
+        :return: A future which completes once the notebook has been executed and saved. If the PDF stage is
+            running, the PDF may still be rendering at that point.
+        """
+        defer_pdf = get_pdf_pool() is not None
+        try:
+            future = self._executor.submit(
+                _execute_job, base_config, job_id, job_submit_time, report_name, defer_pdf=defer_pdf, **kwargs
+            )
+        except BrokenProcessPool:
+            logger.exception("The worker pool is broken, most likely because a worker died. Restarting it.")
+            self._executor = self._create_executor()
+            future = self._executor.submit(
+                _execute_job, base_config, job_id, job_submit_time, report_name, defer_pdf=defer_pdf, **kwargs
+            )
+        if defer_pdf:
+            future.add_done_callback(functools.partial(_hand_off_pdf_job, base_config))
+        return future
+
+    def shutdown(self, wait: bool = True):
+        if sys.version_info >= (3, 9):
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+        else:
+            self._executor.shutdown(wait=wait)
+
+
+class PdfRenderingPool(object):
+    """
+    Renders the PDFs of executed notebooks in a separate pool of processes, so that kernel workers don't sit idle
+    while LaTeX runs.
+
+    :param n_workers: The number of PDF worker processes.
+    """
+
+    def __init__(self, n_workers: int):
+        self.n_workers = n_workers
+        self._executor = self._create_executor()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.n_workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_pdf_worker
+        )
+
+    def submit(self, base_config: BaseConfig, pdf_job: PdfJob) -> Future:
+        try:
+            return self._executor.submit(_render_pdf, base_config, pdf_job)
+        except BrokenProcessPool:
+            logger.exception("The PDF pool is broken, most likely because a worker died. Restarting it.")
+            self._executor = self._create_executor()
+            return self._executor.submit(_render_pdf, base_config, pdf_job)
+
+    def shutdown(self, wait: bool = True):
+        if sys.version_info >= (3, 9):
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+        else:
+            self._executor.shutdown(wait=wait)
+
+
+def _hand_off_pdf_job(base_config: BaseConfig, future: Future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    pdf_job = future.result()
+    if pdf_job is None:
+        return
+    pdf_pool = get_pdf_pool()
+    if pdf_pool is None:
+        logger.warning("The PDF pool has been stopped; job %s will not have a PDF.", pdf_job.job_id)
+        return
+    pdf_pool.submit(base_config, pdf_job)
+
+
+def get_worker_pool() -> Optional[WarmKernelPool]:
+    """Returns the worker pool if the webapp has started one, otherwise None."""
+    return _worker_pool
+
+
+def start_worker_pool(n_workers: int, max_runs_per_kernel: int) -> WarmKernelPool:
+    global _worker_pool
+    if _worker_pool is None:
+        logger.info("Starting %d notebook workers (kernels recycled every %d runs).", n_workers, max_runs_per_kernel)
+        _worker_pool = WarmKernelPool(n_workers, max_runs_per_kernel)
+    return _worker_pool
+
+
+def stop_worker_pool(wait: bool = True):
+    global _worker_pool
+    if _worker_pool is not None:
+        _worker_pool.shutdown(wait=wait)
+        _worker_pool = None
+
+
+def get_pdf_pool() -> Optional[PdfRenderingPool]:
+    """Returns the PDF rendering pool if the webapp has started one, otherwise None."""
+    return _pdf_pool
+
+
+def start_pdf_pool(n_workers: int) -> PdfRenderingPool:
+    global _pdf_pool
+    if _pdf_pool is None:
+        logger.info("Starting %d PDF rendering workers.", n_workers)
+        _pdf_pool = PdfRenderingPool(n_workers)
+    return _pdf_pool
+
+
+def stop_pdf_pool(wait: bool = True):
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(wait=wait)
+        _pdf_pool = None
@@ -90,6 +90,7 @@ def py_template_dir(workspace):
 
 
 def safe_cache_clear():
+    caching.memory_cache.clear()
     if caching.cache is not None:
         try:
             caching.cache.clear()
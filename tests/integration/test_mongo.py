@@ -115,3 +115,63 @@ def test_delete_error(bson_library, webapp_config, job_status):
     for filename in deleted_stuff["gridfs_filenames"]:
         assert serializer.result_data_store.exists(filename=filename) is False
     assert serializer.get_check_result(job_id) is None
+
+
+def test_identical_outputs_are_stored_once(bson_library, webapp_config):
+    initialise_base_dirs(webapp_config=webapp_config)
+    serializer = initialize_serializer_from_config(webapp_config)
+
+    report_name = str(uuid.uuid4())
+    job_ids = [str(uuid.uuid4()) for _ in range(2)]
+    for job_id in job_ids:
+        serializer.save_check_result(
+            NotebookResultComplete(
+                job_id=job_id,
+                report_name=report_name,
+                report_title=report_name,
+                status=JobStatus.DONE,
+                job_start_time=datetime.datetime(2018, 1, 12, 2, 30),
+                job_finish_time=datetime.datetime(2018, 1, 12, 2, 58),
+                raw_html="<html></html>",
+                generate_pdf_output=False,
+                raw_html_resources={
+                    "outputs": {f"{job_id}/resources/logo.png": b"logo", f"{job_id}/resources/plot.png": job_id},
+                    "inlining": {"css": ["body {}"]},
+                },
+            )
+        )
+    # The logo and the CSS inlining are shared between both results; the plots are not.
+    assert len([f for f in serializer.result_data_store.list() if f.startswith("blobs/")]) == 4
+    result = serializer.get_check_result(job_ids[1])
+    assert result.raw_html_resources["outputs"][f"{job_ids[1]}/resources/logo.png"] == "logo"
+    assert result.raw_html_resources["inlining"] == {"css": ["body {}"]}
+
+    serializer.delete_result(job_ids[0])
+    assert len([f for f in serializer.result_data_store.list() if f.startswith("blobs/")]) == 3
+    result = serializer.get_check_result(job_ids[1])
+    assert result.raw_html_resources["outputs"][f"{job_ids[1]}/resources/logo.png"] == "logo"
+
+    serializer.delete_result(job_ids[1])
+    assert [r for r in serializer.result_data_store.list()] == []
+    assert serializer.blob_refs.count_documents({}) == 0
+
+
+def test_deleted_results_are_moved_to_tombstones(bson_library, webapp_config):
+    initialise_base_dirs(webapp_config=webapp_config)
+    serializer = initialize_serializer_from_config(webapp_config)
+
+    job_id = str(uuid.uuid4())
+    report_name = str(uuid.uuid4())
+    serializer.save_check_stub(job_id, report_name, status=JobStatus.ERROR)
+    serializer.delete_result(job_id)
+
+    assert bson_library.find_one({"job_id": job_id}) is None
+    assert serializer.tombstone_library.find_one({"job_id": job_id})["status"] == JobStatus.DELETED.value
+    assert serializer.n_all_results_for_report_name(report_name) == 0
+
+    # Results deleted by older versions of Notebooker stay in the result collection until they are migrated.
+    old_job_id = str(uuid.uuid4())
+    bson_library.insert_one({"job_id": old_job_id, "report_name": report_name, "status": JobStatus.DELETED.value})
+    assert serializer.migrate_deleted_results() == 1
+    assert bson_library.find_one({"job_id": old_job_id}) is None
+    assert serializer.tombstone_library.count_documents({"report_name": report_name}) == 2
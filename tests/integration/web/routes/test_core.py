@@ -215,3 +215,42 @@ def test_get_all_templates_with_results_then_delete(flask_app, setup_workspace):
                         "time_diff": "1 month",
                     }
                 }
+
+
+def test_get_results_page(flask_app, setup_workspace):
+    results = [
+        NotebookResultError(
+            job_id=f"job{i}",
+            report_name="report_name",
+            report_title="Odd" if i % 2 else "Even",
+            job_start_time=datetime.datetime(2021, 1, 1 + i),
+            status=JobStatus.ERROR,
+            overrides={"n": i % 3},
+        )
+        for i in range(10)
+    ]
+    insert_fake_results(flask_app, results)
+    with flask_app.test_client() as client:
+        with flask_app.app_context():
+            job_ids, cursor = [], ""
+            while cursor is not None:
+                rv = client.get(f"/core/get_results_page?report_name=report_name&limit=3&cursor={cursor}")
+                assert rv.status_code == 200, rv.data
+                data = json.loads(rv.data)
+                assert len(data["results"]) <= 3
+                job_ids.extend(result["job_id"] for result in data["results"])
+                cursor = data["next_cursor"]
+            assert job_ids == [f"job{i}" for i in reversed(range(10))]
+
+            rv = client.get(
+                "/core/get_results_page?report_name=report_name&title=odd&override.n=0"
+                "&sort=job_start_time&order=asc&started_after=2021-01-02"
+            )
+            assert rv.status_code == 200, rv.data
+            assert [result["job_id"] for result in json.loads(rv.data)["results"]] == ["job3", "job9"]
+
+            rv = client.get("/core/get_results_page?report_name=report_name&status=DONE")
+            assert json.loads(rv.data) == {"results": [], "next_cursor": None}
+
+            rv = client.get("/core/get_results_page?sort=overrides")
+            assert rv.status_code == 400
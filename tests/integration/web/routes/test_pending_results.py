@@ -0,0 +1,52 @@
+import datetime
+
+from notebooker.constants import NotebookResultPending, JobStatus
+from notebooker.web.utils import get_serializer
+from .helpers import insert_fake_results
+
+
+def test_status_stream_sends_stdout_then_resumes_from_last_event_id(flask_app, setup_workspace):
+    insert_fake_results(
+        flask_app,
+        [
+            NotebookResultPending(
+                job_id="job1",
+                report_name="report_name",
+                job_start_time=datetime.datetime(2020, 1, 1),
+                stdout=["line 1", "line 2", "line 3"],
+                status=JobStatus.CANCELLED,
+            )
+        ],
+    )
+    with flask_app.test_client() as client:
+        rv = client.get("/status_stream/report_name/job1")
+        assert rv.status_code == 200
+        assert rv.mimetype == "text/event-stream"
+        body = rv.get_data(as_text=True)
+        assert 'id: 3\ndata: {"lines": ["line 1", "line 2", "line 3"]}' in body
+        assert '"results_url": "/results/report_name/job1"' in body
+        assert body.endswith("event: end\ndata: {}\n\n")
+
+        body = client.get("/status_stream/report_name/job1", headers={"Last-Event-ID": "2"}).get_data(as_text=True)
+        assert 'data: {"lines": ["line 3"]}' in body
+
+
+def test_status_returns_stdout_after_offset(flask_app, setup_workspace):
+    insert_fake_results(
+        flask_app,
+        [
+            NotebookResultPending(
+                job_id="job1", report_name="report_name", job_start_time=datetime.datetime(2020, 1, 1)
+            )
+        ],
+    )
+    with flask_app.app_context():
+        serializer = get_serializer()
+        serializer.update_stdout("job1", new_lines=["line 1\n", "line 2\n"])
+        serializer.update_stdout("job1", new_lines=["line 3\n"])
+    with flask_app.test_client() as client:
+        data = client.get("/status/report_name/job1?offset=1").json
+        assert data["new_lines"] == ["line 2\n", "line 3\n"]
+        assert data["stdout_offset"] == 3
+        assert client.get("/status/report_name/job1?offset=3").json["new_lines"] == []
+        assert client.get("/status/report_name/job1").json["run_output"] == "line 1\n\nline 2\n\nline 3\n"
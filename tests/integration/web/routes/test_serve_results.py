@@ -0,0 +1,64 @@
+import datetime
+
+from notebooker.constants import NotebookResultComplete, JobStatus
+from .helpers import insert_fake_results
+
+
+def test_result_resource_is_served_with_immutable_caching(flask_app, setup_workspace):
+    png = b"\x89PNG\r\n\x1a\nfake"
+    insert_fake_results(
+        flask_app,
+        [
+            NotebookResultComplete(
+                job_id="job1",
+                report_name="report_name",
+                job_start_time=datetime.datetime(2020, 1, 1),
+                job_finish_time=datetime.datetime(2020, 1, 1, 1),
+                raw_html_resources={"outputs": {"job1/resources/output_0.png": png}},
+                status=JobStatus.DONE,
+            )
+        ],
+    )
+    url = "/result_html_render/report_name/job1/resources/output_0.png"
+    with flask_app.test_client() as client:
+        rv = client.get(url)
+        assert rv.status_code == 200
+        assert rv.data == png
+        assert rv.mimetype == "image/png"
+        assert rv.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+        etag = rv.headers["ETag"]
+
+        rv = client.get(url, headers={"If-None-Match": etag})
+        assert rv.status_code == 304
+        assert rv.headers["ETag"] == etag
+
+        assert client.get("/result_html_render/report_name/job1/resources/missing.png").status_code == 404
+
+
+def test_pdf_download_supports_range_requests(flask_app, setup_workspace):
+    pdf = bytes(range(256)) * 4000
+    insert_fake_results(
+        flask_app,
+        [
+            NotebookResultComplete(
+                job_id="job1",
+                report_name="report_name",
+                job_start_time=datetime.datetime(2020, 1, 1),
+                job_finish_time=datetime.datetime(2020, 1, 1, 1),
+                pdf=pdf,
+                generate_pdf_output=True,
+                status=JobStatus.DONE,
+            )
+        ],
+    )
+    with flask_app.test_client() as client:
+        rv = client.get("/result_download_pdf/report_name/job1")
+        assert rv.status_code == 200
+        assert rv.headers["Content-Length"] == str(len(pdf))
+        assert rv.headers["Accept-Ranges"] == "bytes"
+        assert rv.data == pdf
+
+        rv = client.get("/result_download_pdf/report_name/job1", headers={"Range": "bytes=300000-300009"})
+        assert rv.status_code == 206
+        assert rv.headers["Content-Range"] == "bytes 300000-300009/{}".format(len(pdf))
+        assert rv.data == pdf[300000:300010]
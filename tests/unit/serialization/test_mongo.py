@@ -1,8 +1,21 @@
+import datetime
+import gzip
+import io
+import pickle
 from unittest.mock import Mock, MagicMock
 
+import pytest
 from mock import patch
 
-from notebooker.serialization.mongo import JobStatus, MongoResultSerializer
+from notebooker.constants import NotebookResultComplete
+from notebooker.serialization.mongo import (
+    SUMMARY_MARKER_ID,
+    JobStatus,
+    MongoResultSerializer,
+    iter_grid_out,
+    overrides_hash,
+    read_file,
+)
 
 
 def test_mongo_filter():
@@ -12,7 +25,40 @@ def test_mongo_filter():
 
 def test_mongo_filter_overrides():
     mongo_filter = MongoResultSerializer._mongo_filter("report", overrides={"b": 1, "a": 2})
-    assert mongo_filter == {"report_name": "report", "overrides.a": 2, "overrides.b": 1}
+    assert mongo_filter == {"report_name": "report", "overrides_hash": overrides_hash({"a": 2, "b": 1})}
+
+
+def test_mongo_filter_overrides_matches_unhashed_results_by_their_overrides():
+    mongo_filter = MongoResultSerializer._mongo_filter("report", overrides={"b": 1, "a": 2}, match_unhashed=True)
+    hashed, unhashed = mongo_filter.pop("$or")
+    assert mongo_filter == {"report_name": "report"}
+    assert hashed == {"overrides_hash": overrides_hash({"a": 2, "b": 1})}
+    assert unhashed["overrides_hash"] == {"$exists": False}
+    assert (unhashed["overrides.a"], unhashed["overrides.b"]) == (2, 1)
+    assert unhashed["$expr"]["$eq"][1] == 2
+
+
+def test_overrides_hash_is_independent_of_key_order():
+    assert overrides_hash({"a": 1, "b": {"c": 2, "d": 3}}) == overrides_hash({"b": {"d": 3, "c": 2}, "a": 1})
+    assert overrides_hash({"a": 1}) != overrides_hash({"a": 1, "b": 2})
+    assert overrides_hash(None) == overrides_hash({})
+
+
+def test_result_page_filter():
+    mongo_filter = MongoResultSerializer._result_page_filter(
+        report_name="report",
+        statuses=[JobStatus.DONE, JobStatus.ERROR],
+        title="a.b",
+        started_after=datetime.datetime(2021, 1, 1),
+        overrides={"n": 5},
+    )
+    assert mongo_filter == {
+        "report_name": "report",
+        "status": {"$in": [JobStatus.DONE.value, JobStatus.ERROR.value]},
+        "report_title": {"$regex": r"a\.b", "$options": "i"},
+        "job_start_time": {"$gte": datetime.datetime(2021, 1, 1)},
+        "overrides.n": 5,
+    }
 
 
 def test_mongo_filter_status():
@@ -38,7 +84,7 @@ def test__get_all_job_ids(conn, db, gridfs):
     serializer._get_all_job_ids("report_name", None, limit=1)
     serializer.library.aggregate.assert_called_once_with(
         [
-            {"$match": {"status": {"$ne": JobStatus.DELETED.value}, "report_name": "report_name"}},
+            {"$match": {"report_name": "report_name", "status": {"$ne": JobStatus.DELETED.value}}},
             {"$sort": {"update_time": -1}},
             {"$limit": 1},
             {"$project": {"report_name": 1, "job_id": 1}},
@@ -74,3 +120,688 @@ def test_delete_result_dry_run(mock_conn, mock_db, mock_gridfs):
     # But verify the result contains what would be deleted
     assert result["deleted_result_document"] == mock_result
     assert len(result["gridfs_filenames"]) > 0
+
+
+class _FakeGridOut(object):
+    def __init__(self, data, metadata=None):
+        self.data = io.BytesIO(data)
+        self.metadata = metadata
+
+    def read(self, size=-1):
+        return self.data.read(size)
+
+
+@pytest.mark.parametrize("compression", ["gzip", "none"])
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_put_file_compresses_and_read_file_decompresses(mock_conn, mock_db, mock_gridfs, compression):
+    serializer = MongoResultSerializer(gridfs_compression=compression)
+    serializer._put_file("<html>" * 1000, "job.rawhtml", compress=True)
+    (data,), kwargs = serializer.result_data_store.put.call_args
+    assert kwargs["filename"] == "job.rawhtml"
+    if compression == "gzip":
+        assert len(data) < 1000
+        assert kwargs["metadata"] == {"compression": "gzip"}
+    else:
+        assert data == b"<html>" * 1000
+        assert "metadata" not in kwargs
+
+    serializer.result_data_store.get_last_version.side_effect = lambda _: _FakeGridOut(data, kwargs.get("metadata"))
+    assert read_file(serializer.result_data_store, "job.rawhtml") == "<html>" * 1000
+    assert (serializer.get_gzipped_file("job.rawhtml") == data) is (compression == "gzip")
+
+
+def test_read_file_without_compression_metadata():
+    store = MagicMock()
+    store.get_last_version.return_value = _FakeGridOut(b'{"a": 1}')
+    assert read_file(store, "job.inline.css", is_json=True) == {"a": 1}
+
+
+def test_unknown_compression_is_rejected():
+    with pytest.raises(ValueError, match="gridfs_compression must be one of"):
+        MongoResultSerializer(gridfs_compression="lz4")
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_result_payload_is_loaded_lazily(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    files = {
+        "job.rawhtml": _FakeGridOut(b"<html/>"),
+        "job.emailhtml": _FakeGridOut(b"<email/>"),
+        "job.ipynb.json": _FakeGridOut(b'{"cells": []}'),
+        "job.pdf": _FakeGridOut(b"%PDF"),
+        "job.inline.css": _FakeGridOut(b'{"big": "css"}'),
+        "out/job/a.png": _FakeGridOut(b"png"),
+    }
+    serializer.result_data_store.get_last_version.side_effect = files.__getitem__
+    now = datetime.datetime.now()
+    serializer._get_raw_check_result = Mock(
+        return_value={
+            "job_id": "job",
+            "report_name": "report",
+            "status": JobStatus.DONE.value,
+            "job_start_time": now,
+            "job_finish_time": now,
+            "update_time": now,
+            "generate_pdf_output": True,
+            "raw_html_resources": {"outputs": ["out/job/a.png"]},
+        }
+    )
+
+    result = serializer.get_check_result("job")
+    assert isinstance(result, NotebookResultComplete)
+    assert not serializer.result_data_store.get_last_version.called
+
+    # Handles survive the result cache, which pickles results.
+    result = pickle.loads(pickle.dumps(result))
+    assert "out/job/a.png" in result.raw_html_resources["outputs"]
+    assert result.html_resources() == {"outputs": ["out/job/a.png"]}
+    assert not serializer.result_data_store.get_last_version.called
+
+    assert not result.is_loaded("raw_html")
+    assert result.raw_html == "<html/>"
+    assert result.is_loaded("raw_html")
+    serializer.result_data_store.get_last_version.assert_called_once_with("job.rawhtml")
+    assert result.raw_html_resources["outputs"]["out/job/a.png"] == "png"
+    assert result.pdf == b"%PDF"
+    assert result.raw_ipynb_json == {"cells": []}
+    assert result.raw_html_resources["inlining"] == {"big": "css"}
+    read_filenames = [args[0] for args, _ in serializer.result_data_store.get_last_version.call_args_list]
+    assert "job.emailhtml" not in read_filenames
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_get_result_resource_reads_only_that_output(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library.find_one.return_value = {
+        "gridfs_blobs": [{"filename": "job/resources/a.png", "sha256": "abc123"}]
+    }
+    serializer.result_data_store.get_last_version.return_value = _FakeGridOut(b"png")
+
+    resource = serializer.get_result_resource("job", "job/resources/a.png")
+
+    serializer.library.find_one.assert_called_once_with(
+        {"job_id": "job", "status": JobStatus.DONE.value, "raw_html_resources.outputs": "job/resources/a.png"},
+        {"gridfs_blobs": 1, "_id": 0},
+    )
+    serializer.result_data_store.get_last_version.assert_called_once_with("blobs/abc123")
+    assert resource.etag == "abc123"
+    assert resource.read() == b"png"
+
+    serializer.library.find_one.return_value = None
+    assert serializer.get_result_resource("job", "job/resources/missing.png") is None
+
+
+@pytest.mark.parametrize("metadata", [None, {"compression": "gzip"}])
+def test_iter_grid_out_streams_in_chunks(metadata):
+    data = b"".join(b"line %d\n" % i for i in range(10000))
+    stored = gzip.compress(data) if metadata else data
+    chunks = list(iter_grid_out(_FakeGridOut(stored, metadata), chunk_size=1024))
+    assert len(chunks) > 1
+    assert b"".join(chunks) == data
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_get_all_results_without_stdout_reads_nothing_from_gridfs(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    now = datetime.datetime.now()
+    cursor = serializer.library.find.return_value.sort.return_value.limit.return_value
+    cursor.__iter__.return_value = iter(
+        [
+            {
+                "job_id": "job",
+                "report_name": "report",
+                "status": JobStatus.ERROR.value,
+                "job_start_time": now,
+                "update_time": now,
+                "error_info": "",
+            }
+        ]
+    )
+    serializer.result_data_store.get_last_version.return_value = _FakeGridOut(b"Traceback")
+
+    (result,) = serializer.get_all_results(load_stdout=False)
+
+    assert serializer.library.find.call_args[0][1] == {"stdout": 0, "stdout_lines": 0, "_id": 0}
+    assert not serializer.result_data_store.get_last_version.called
+    assert result.error_info == "Traceback"
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_get_status_and_stdout_reads_only_new_lines(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library.find_one.return_value = {"status": JobStatus.PENDING.value, "stdout_lines": 4}
+    serializer.stdout_library.find.return_value.sort.return_value = [
+        {"seq": 2, "line": "c"},
+        {"seq": 3, "line": "d"},
+    ]
+
+    assert serializer.get_status_and_stdout("job", stdout_offset=2) == (JobStatus.PENDING, ["c", "d"], 4)
+    serializer.stdout_library.find.assert_called_once_with(
+        {"job_id": "job", "seq": {"$gte": 2}}, {"_id": 0, "seq": 1, "line": 1}
+    )
+
+    serializer.stdout_library.find.reset_mock()
+    assert serializer.get_status_and_stdout("job", stdout_offset=4) == (JobStatus.PENDING, [], 4)
+    assert not serializer.stdout_library.find.called
+
+    serializer.library.find_one.return_value = None
+    assert serializer.get_status_and_stdout("missing") is None
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_get_stdout_of_results_saved_before_the_stdout_collection(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library.find_one.return_value = {"stdout": ["c", "d"]}
+
+    assert serializer.get_stdout("job", offset=2) == (["c", "d"], 4)
+    serializer.library.find_one.assert_called_once_with(
+        {"job_id": "job"}, {"_id": 0, "stdout_lines": 1, "stdout": {"$slice": [2, 2**31 - 1]}}
+    )
+    assert not serializer.stdout_library.find.called
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_get_stdout_stops_at_lines_which_are_still_being_written(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library.find_one.return_value = {"stdout_lines": 10}
+    # Lines 0-2 have been dropped from the capped collection, and line 6 hasn't been inserted yet.
+    serializer.stdout_library.find.return_value.sort.return_value = [
+        {"seq": 3, "line": "d"},
+        {"seq": 4, "line": "e"},
+        {"seq": 5, "line": "f"},
+        {"seq": 7, "line": "h"},
+    ]
+
+    assert serializer.get_stdout("job") == (["d", "e", "f"], 6)
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_update_stdout_numbers_lines_from_the_result_count(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library.find_one_and_update.return_value = {"stdout_lines": 5}
+
+    serializer.update_stdout("job", new_lines=["d\n", "e\n"])
+
+    assert serializer.library.find_one_and_update.call_args[0] == ({"job_id": "job"}, {"$inc": {"stdout_lines": 2}})
+    serializer.stdout_library.insert_many.assert_called_once_with(
+        [{"job_id": "job", "seq": 3, "line": "d\n"}, {"job_id": "job", "seq": 4, "line": "e\n"}]
+    )
+
+    serializer.library.find_one.return_value = {"stdout_lines": 5}
+    serializer.stdout_library.insert_many.reset_mock()
+    serializer.library.find_one_and_update.return_value = {"stdout_lines": 6}
+    serializer.update_stdout("job", ["a", "b", "c", "d", "e", "f"], replace=True)
+
+    serializer.stdout_library.insert_many.assert_called_once_with([{"job_id": "job", "seq": 5, "line": "f"}])
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_result_stdout_is_read_from_the_stdout_collection_when_used(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    now = datetime.datetime.now()
+    serializer._get_raw_check_result = Mock(
+        return_value={
+            "job_id": "job",
+            "report_name": "report",
+            "status": JobStatus.PENDING.value,
+            "job_start_time": now,
+            "update_time": now,
+            "stdout": [],
+            "stdout_lines": 1,
+        }
+    )
+    result = serializer.get_check_result("job")
+    assert not serializer.stdout_library.find.called
+
+    serializer.library.find_one.return_value = {"stdout_lines": 1}
+    serializer.stdout_library.find.return_value.sort.return_value = [{"seq": 0, "line": "a"}]
+    assert result.stdout == ["a"]
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_save_is_a_single_upsert(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library.find_one_and_update.return_value = None
+    serializer.library.create_index.reset_mock()
+    serializer.summary_library = MagicMock()
+    serializer.summary_library.find_one.return_value = {"_id": SUMMARY_MARKER_ID, "cutoff": None, "built": True}
+
+    serializer.save_check_stub("job", "report")
+
+    assert not serializer.library.find_one.called
+    assert not serializer.library.replace_one.called
+    assert not serializer.library.create_index.called
+    (query, update), kwargs = serializer.library.find_one_and_update.call_args
+    assert query == {"job_id": "job"}
+    assert update["$set"]["status"] == JobStatus.PENDING.value
+    assert "stdout" not in update["$set"]
+    assert update["$unset"] == {"gridfs_blobs": ""}
+    assert update["$set"]["overrides_hash"] == overrides_hash({})
+    assert kwargs["upsert"] is True
+    (query, update), kwargs = serializer.summary_library.find_one_and_update.call_args
+    assert query == {"_id": "report"}
+    assert update["$inc"] == {"count": 1, "scheduler_runs": 0}
+    assert kwargs["upsert"] is True
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_saving_an_existing_result_leaves_the_summary_alone(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library.find_one_and_update.return_value = {"_id": "id"}
+    serializer.summary_library = MagicMock()
+
+    serializer.save_check_stub("job", "report")
+
+    assert not serializer.summary_library.find_one_and_update.called
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_only_results_started_after_a_rebuild_are_counted_until_it_is_built(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.summary_library = MagicMock()
+    cutoff = datetime.datetime(2021, 1, 2)
+    serializer.summary_library.find_one.return_value = {"_id": SUMMARY_MARKER_ID, "cutoff": cutoff, "built": False}
+
+    serializer._count_in_summary("report", 1, 0, datetime.datetime(2021, 1, 1))
+    assert not serializer.summary_library.find_one_and_update.called
+
+    serializer._count_in_summary("report", 1, 0, datetime.datetime(2021, 1, 3))
+    assert serializer.summary_library.find_one_and_update.called
+
+    serializer.summary_library.reset_mock()
+    serializer.summary_library.find_one.return_value = None
+    serializer._count_in_summary("report", 1, 0, datetime.datetime(2021, 1, 3))
+    assert not serializer.summary_library.find_one_and_update.called
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_summary_is_built_once_by_the_process_which_claims_it(mock_conn, mock_db, mock_gridfs):
+    with patch("notebooker.serialization.mongo._summaries_built", set()):
+        serializer = MongoResultSerializer()
+        serializer.summary_library = MagicMock()
+        serializer.summary_library.find_one.return_value = None
+        serializer.rebuild_summary = Mock()
+
+        serializer.summary_library.update_one.return_value.upserted_id = None
+        serializer.get_count_and_latest_time_per_report(None)
+        assert not serializer.rebuild_summary.called
+
+        serializer.summary_library.update_one.return_value.upserted_id = SUMMARY_MARKER_ID
+        serializer.get_count_and_latest_time_per_report("sub")
+        serializer.rebuild_summary.assert_called_once_with()
+        serializer.summary_library.find.assert_called_with({"_id": {"$ne": SUMMARY_MARKER_ID, "$regex": "sub.*"}})
+
+        serializer.summary_library.find_one.return_value = {"_id": SUMMARY_MARKER_ID, "built": True}
+        serializer.get_count_and_latest_time_per_report(None)
+        serializer.summary_library.find_one.reset_mock()
+        serializer.get_count_and_latest_time_per_report(None)
+        assert not serializer.summary_library.find_one.called
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_deleting_the_latest_result_updates_the_summary(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    start_time = datetime.datetime(2021, 1, 2)
+    result = {
+        "_id": 1,
+        "job_id": "job",
+        "report_name": "report",
+        "status": JobStatus.DONE.value,
+        "job_start_time": start_time,
+        "scheduler_job_id": "schedule",
+    }
+    serializer._get_raw_check_result = Mock(return_value=result)
+    serializer.result_data_store.find.return_value = []
+    serializer.library.find.return_value = [result]
+    serializer.library.find_one_and_delete.return_value = result
+    serializer.library.find_one.return_value = {"job_start_time": datetime.datetime(2020, 1, 1)}
+    serializer.summary_library = MagicMock()
+    serializer.summary_library.find_one.return_value = {"_id": SUMMARY_MARKER_ID, "cutoff": None, "built": True}
+    summary = {"_id": "report", "count": 1, "latest_run": start_time}
+    serializer.summary_library.find_one_and_update.return_value = summary
+
+    serializer.delete_result("job")
+
+    (query, update), _ = serializer.summary_library.find_one_and_update.call_args
+    assert update == {"$inc": {"count": -1, "scheduler_runs": -1}}
+    serializer.summary_library.update_one.assert_called_once_with(
+        {"_id": "report"}, {"$set": {"latest_run": datetime.datetime(2020, 1, 1)}}
+    )
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_update_check_status_sets_only_the_changed_fields(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library.update_one.return_value.matched_count = 1
+
+    serializer.update_check_status("job", JobStatus.ERROR, error_info="Traceback", job_finish_time="now")
+
+    assert not serializer.library.find_one.called
+    (query, update), _ = serializer.library.update_one.call_args
+    assert query == {"job_id": "job"}
+    assert set(update["$set"]) == {"status", "update_time", "job_finish_time"}
+    assert update["$set"]["status"] == JobStatus.ERROR.value
+    serializer.result_data_store.put.assert_called_once_with("Traceback", filename="job.errorinfo", encoding="utf-8")
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_indexes_are_ensured_once_per_collection(mock_conn, mock_db, mock_gridfs):
+    with patch("notebooker.serialization.mongo._indexes_ensured", set()):
+        MongoResultSerializer(result_collection_name="indexed")
+        MongoResultSerializer(result_collection_name="indexed")
+    assert mock_db.return_value["indexed"].create_index.call_count == 7
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_backfill_overrides_hash(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library.find.return_value = [
+        {"_id": 1, "overrides": {"a": 1}},
+        {"_id": 2},
+        {"_id": 3, "overrides": {"b": 2}},
+    ]
+    serializer.library.bulk_write.return_value.modified_count = 2
+
+    assert serializer.backfill_overrides_hash(batch_size=2) == 4
+
+    serializer.library.find.assert_called_once_with({"overrides_hash": {"$exists": False}}, {"_id": 1, "overrides": 1})
+    first_batch, last_batch = [c[0][0] for c in serializer.library.bulk_write.call_args_list]
+    assert [op._doc["$set"]["overrides_hash"] for op in first_batch] == [overrides_hash({"a": 1}), overrides_hash({})]
+    assert [op._filter for op in last_batch] == [{"_id": 3}]
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_latest_results_of_all_params_group_unhashed_results_by_their_fingerprint(mock_conn, mock_db, mock_gridfs):
+    with patch("notebooker.serialization.mongo._overrides_hashes_backfilled", set()):
+        serializer = MongoResultSerializer()
+        serializer.library = MagicMock()
+        serializer.library.find.return_value.sort.return_value = [
+            {"job_id": "unhashed", "overrides": {"b": 1, "a": 2}},
+            {"job_id": "hashed", "overrides": {"a": 2, "b": 1}, "overrides_hash": overrides_hash({"a": 2, "b": 1})},
+            {"job_id": "other", "overrides": {"a": 3}},
+        ]
+
+        assert serializer.get_latest_successful_job_ids_for_name_all_params("report") == ["unhashed", "other"]
+        assert not serializer.library.aggregate.called
+
+        serializer.library.bulk_write.return_value.modified_count = 0
+        serializer.library.find.return_value = []
+        serializer.backfill_overrides_hash()
+        serializer.get_latest_successful_job_ids_for_name_all_params("report")
+        assert serializer.library.aggregate.called
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_get_results_page_continues_after_the_cursor(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    update_times = [datetime.datetime(2021, 1, 3), datetime.datetime(2021, 1, 2), datetime.datetime(2021, 1, 2)]
+    documents = [
+        {
+            "job_id": f"job{i}",
+            "report_name": "report",
+            "status": JobStatus.PENDING.value,
+            "job_start_time": update_time,
+            "update_time": update_time,
+        }
+        for i, update_time in enumerate(update_times)
+    ]
+    find = serializer.library.find
+    find.return_value.sort.return_value.limit.return_value = documents
+
+    results, cursor = serializer.get_results_page(limit=2, report_name="report")
+
+    assert [result.job_id for result in results] == ["job0", "job1"]
+    find.return_value.sort.assert_called_with([("update_time", -1), ("job_id", -1)])
+    find.return_value.sort.return_value.limit.assert_called_with(3)
+
+    find.return_value.sort.return_value.limit.return_value = documents[2:]
+    results, next_cursor = serializer.get_results_page(limit=2, cursor=cursor, report_name="report")
+
+    assert [result.job_id for result in results] == ["job2"]
+    assert next_cursor is None
+    (mongo_filter, _), _ = find.call_args
+    assert mongo_filter["$and"][1] == {
+        "$or": [
+            {"update_time": {"$lt": datetime.datetime(2021, 1, 2)}},
+            {"update_time": datetime.datetime(2021, 1, 2), "job_id": {"$lt": "job1"}},
+        ]
+    }
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_get_results_page_rejects_bad_arguments(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    with pytest.raises(ValueError):
+        serializer.get_results_page(sort_by="overrides")
+    with pytest.raises(ValueError):
+        serializer.get_results_page(cursor="not a cursor")
+
+
+def _find_one_and_delete(documents):
+    """Removes documents by _id, like the result collection, so that each is returned to only one caller."""
+    by_id = {document["_id"]: document for document in documents}
+    return lambda query, **kwargs: by_id.pop(query["_id"], None)
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_delete_results_deletes_a_batch_in_bulk(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library = MagicMock()
+    serializer.gridfs_files = MagicMock()
+    serializer.gridfs_chunks = MagicMock()
+    serializer.stdout_library = MagicMock()
+    serializer.summary_library = MagicMock()
+    serializer.summary_library.find_one_and_update.return_value = None
+    serializer.tombstone_library = MagicMock()
+    serializer.library.find.return_value = [
+        {"_id": 1, "job_id": "job1", "report_name": "report", "status": JobStatus.ERROR.value, "raw_html": "x"},
+        {"_id": 2, "job_id": "job2", "report_name": "report", "status": JobStatus.DONE.value, "stdout_lines": 3},
+    ]
+    serializer.library.find_one_and_delete.side_effect = _find_one_and_delete(serializer.library.find.return_value)
+    serializer.gridfs_files.find.return_value = [{"_id": 1, "filename": "job1.errorinfo"}, {"_id": 2, "filename": "x"}]
+
+    removed = serializer.delete_results(["job1", "job2", "job3"])
+
+    assert removed == {"deleted_job_ids": ["job1", "job2"], "gridfs_filenames": ["job1.errorinfo", "x"]}
+    assert serializer.gridfs_files.find.call_count == 1
+    serializer.gridfs_chunks.delete_many.assert_called_once_with({"files_id": {"$in": [1, 2]}})
+    serializer.gridfs_files.delete_many.assert_called_once_with({"_id": {"$in": [1, 2]}})
+    serializer.stdout_library.delete_many.assert_called_once_with({"job_id": {"$in": ["job2"]}})
+    (tombstones,), _ = serializer.tombstone_library.bulk_write.call_args
+    assert [tombstone._doc["status"] for tombstone in tombstones] == [JobStatus.DELETED.value] * 2
+    assert [query for (query,), _ in serializer.library.find_one_and_delete.call_args_list] == [{"_id": 1}, {"_id": 2}]
+    (_, update), _ = serializer.summary_library.find_one_and_update.call_args
+    assert update == {"$inc": {"count": -2, "scheduler_runs": 0}}
+    assert not mock_gridfs.GridFS.return_value.find.called
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_deleted_results_are_read_from_the_tombstones(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library = MagicMock()
+    serializer.tombstone_library = MagicMock()
+    serializer.library.find_one.return_value = None
+    serializer.tombstone_library.find_one.return_value = {"job_id": "job", "status": JobStatus.DELETED.value}
+
+    assert serializer._get_raw_check_result("job")["status"] == JobStatus.DELETED.value
+    assert serializer.get_check_result("job") is None
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_migrate_deleted_results(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library = MagicMock()
+    serializer.tombstone_library = MagicMock()
+    batches = [[{"_id": 1, "gridfs_blobs": []}, {"_id": 2}], [{"_id": 3}], []]
+    serializer.library.find.return_value.limit.side_effect = batches
+    serializer.library.find_one_and_delete.side_effect = _find_one_and_delete(batches[0] + batches[1])
+
+    assert serializer.migrate_deleted_results(batch_size=2) == 3
+
+    serializer.library.find.assert_called_with({"status": JobStatus.DELETED.value}, {"stdout": 0})
+    assert serializer.tombstone_library.bulk_write.call_count == 2
+    assert "gridfs_blobs" not in serializer.tombstone_library.bulk_write.call_args_list[0][0][0][0]._doc
+    serializer.library.find_one_and_delete.assert_called_with({"_id": 3}, projection={"stdout": 0})
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_legacy_deleted_results_are_excluded_until_migrated(mock_conn, mock_db, mock_gridfs):
+    with patch("notebooker.serialization.mongo._no_legacy_deleted_results", set()):
+        serializer = MongoResultSerializer()
+        serializer.library = MagicMock()
+        serializer.tombstone_library = MagicMock()
+        assert serializer._exclude_legacy_deleted({"status": {"$in": ["x"]}}) == {
+            "status": {"$in": ["x"], "$ne": JobStatus.DELETED.value}
+        }
+        assert serializer._exclude_legacy_deleted({"status": "x"}) == {"status": "x"}
+
+        serializer.library.find.return_value.limit.side_effect = [[]]
+        serializer.migrate_deleted_results()
+
+        assert serializer._exclude_legacy_deleted({"report_name": "x"}) == {"report_name": "x"}
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_delete_results_moves_legacy_deleted_results_without_recounting_them(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library = MagicMock()
+    serializer.gridfs_files = MagicMock()
+    serializer.summary_library = MagicMock()
+    serializer.summary_library.find_one_and_update.return_value = None
+    serializer.tombstone_library = MagicMock()
+    serializer.library.find.return_value = [
+        {"_id": 1, "job_id": "job1", "report_name": "report", "status": JobStatus.DELETED.value},
+        {"_id": 2, "job_id": "job2", "report_name": "report", "status": JobStatus.DONE.value},
+    ]
+    serializer.library.find_one_and_delete.side_effect = _find_one_and_delete(serializer.library.find.return_value)
+    serializer.gridfs_files.find.return_value = []
+
+    removed = serializer.delete_results(["job1", "job2"])
+
+    assert removed["deleted_job_ids"] == ["job2"]
+    assert serializer.library.find_one_and_delete.call_count == 2
+    (_, update), _ = serializer.summary_library.find_one_and_update.call_args
+    assert update == {"$inc": {"count": -1, "scheduler_runs": 0}}
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_only_the_owner_of_a_queued_job_can_claim_it(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library.find_one_and_update.side_effect = [{"_id": 1}, None]
+
+    assert serializer.claim_queued("job", "host:1:abc") is True
+    assert serializer.claim_queued("job", "host:1:abc") is False
+    (query, update), _ = serializer.library.find_one_and_update.call_args
+    assert query == {"job_id": "job", "status": JobStatus.SUBMITTED.value, "queue.owner": "host:1:abc"}
+    assert update == {"$unset": {"queue": ""}}
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_adopt_orphaned_queued_jobs(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    orphan = {"job_id": "job", "queue": {"owner": "new", "lane": "INTERACTIVE"}}
+    serializer.library.find_one_and_update.side_effect = [orphan, None]
+    stale_before = datetime.datetime(2026, 1, 1)
+
+    assert serializer.adopt_orphaned_queued("new", stale_before) == [orphan]
+    (query, update), _ = serializer.library.find_one_and_update.call_args
+    assert query == {"status": JobStatus.SUBMITTED.value, "queue.heartbeat": {"$lt": stale_before}}
+    assert update["$set"]["queue.owner"] == "new"
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_overlapping_deletes_release_blobs_and_update_the_summary_once(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library = MagicMock()
+    serializer.gridfs_files = MagicMock()
+    serializer.blob_refs = MagicMock()
+    serializer.summary_library = MagicMock()
+    serializer.summary_library.find_one_and_update.return_value = None
+    serializer.tombstone_library = MagicMock()
+    blob = {"filename": "job.pdf", "sha256": "a"}
+    results = [
+        {"_id": 1, "job_id": "job1", "report_name": "report", "status": "Done", "gridfs_blobs": [blob]},
+        {"_id": 2, "job_id": "job2", "report_name": "report", "status": "Done", "gridfs_blobs": [blob]},
+    ]
+    serializer.library.find.return_value = results
+    # Both deletes read both results, but the other delete removes job1 first.
+    serializer.library.find_one_and_delete.side_effect = _find_one_and_delete(results[1:])
+    serializer.gridfs_files.find.return_value = []
+    serializer.blob_refs.find.return_value = []
+
+    removed = serializer.delete_results(["job1", "job2"])
+
+    assert removed["deleted_job_ids"] == ["job2"]
+    (updates,), _ = serializer.blob_refs.bulk_write.call_args
+    assert [update._doc for update in updates] == [{"$inc": {"refcount": -1}}]
+    (_, update), _ = serializer.summary_library.find_one_and_update.call_args
+    assert update == {"$inc": {"count": -1, "scheduler_runs": 0}}
+
+
+@patch("notebooker.serialization.mongo.gridfs")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_database")
+@patch("notebooker.serialization.mongo.MongoResultSerializer.get_mongo_connection")
+def test_attaching_a_pdf_touches_the_result(mock_conn, mock_db, mock_gridfs):
+    serializer = MongoResultSerializer()
+    serializer.library = MagicMock()
+
+    serializer.attach_pdf("job", b"%PDF")
+
+    serializer.result_data_store.put.assert_called_once_with(b"%PDF", filename="job.pdf", encoding="utf-8")
+    (query, update), _ = serializer.library.update_one.call_args
+    assert query == {"job_id": "job"}
+    assert list(update["$set"]) == ["update_time"]
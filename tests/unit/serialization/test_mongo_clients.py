@@ -0,0 +1,53 @@
+import mock
+import pytest
+
+from notebooker.serialization import mongo_clients
+from notebooker.serializers.pymongo import PyMongoResultSerializer
+
+
+@pytest.fixture
+def registry():
+    with mock.patch.object(mongo_clients, "_clients", {}), mock.patch.object(mongo_clients, "MongoClient") as client:
+        client.side_effect = lambda *args, **kwargs: mock.MagicMock(name="MongoClient")
+        yield client
+
+
+def test_clients_are_shared_by_connection_parameters(registry):
+    client = mongo_clients.get_mongo_client("host", username="user", maxPoolSize=10, socketTimeoutMS=None)
+    assert mongo_clients.get_mongo_client("host", username="user", maxPoolSize=10) is client
+    assert mongo_clients.get_mongo_client("host", username="user", maxPoolSize=20) is not client
+    assert mongo_clients.get_mongo_client("other", username="user", maxPoolSize=10) is not client
+    assert registry.call_count == 3
+    registry.assert_any_call(
+        "host", username="user", password=None, event_listeners=[mongo_clients.pool_stats], maxPoolSize=10
+    )
+
+    mongo_clients.close_all()
+    client.close.assert_called_once_with()
+    assert mongo_clients.get_mongo_client("host", username="user", maxPoolSize=10) is not client
+
+
+@mock.patch("notebooker.serialization.mongo.gridfs")
+def test_serializers_share_a_client(gridfs, registry):
+    first = PyMongoResultSerializer(mongo_host="host", mongo_max_pool_size=5)
+    second = PyMongoResultSerializer(mongo_host="host", mongo_max_pool_size=5)
+    assert first is not second
+    assert first.get_mongo_connection() is second.get_mongo_connection()
+    assert registry.call_args[1]["maxPoolSize"] == 5
+    assert "--mongo-max-pool-size" in first.serializer_args_to_cmdline_args()
+
+
+def test_pool_stats():
+    stats = mongo_clients.PoolStats()
+    stats.connection_created(mock.Mock())
+    stats.connection_checked_out(mock.Mock(duration=0.5))
+    stats.connection_checked_out(mock.Mock(duration=0.25))
+    stats.connection_checked_in(mock.Mock())
+    stats.connection_check_out_failed(mock.Mock(duration=1.0))
+    assert stats.stats() == {
+        "checkouts": 2,
+        "checkout_failures": 1,
+        "checkout_wait_seconds": 1.75,
+        "checked_out": 1,
+        "connections": 1,
+    }
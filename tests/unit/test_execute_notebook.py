@@ -1,9 +1,21 @@
 from __future__ import unicode_literals
 
-from mock import patch
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from mock import MagicMock, patch
 import pytest
 
-from notebooker.execute_notebook import _get_overrides, docker_compose_entrypoint
+from notebooker.constants import DEFAULT_SERIALIZER, JobStatus
+from notebooker.execute_notebook import (
+    _get_overrides,
+    docker_compose_entrypoint,
+    execute_notebook_entrypoint,
+    maintain_job_queue,
+)
+from notebooker.job_queue import Lane
+from notebooker.settings import BaseConfig
 
 
 @pytest.mark.parametrize(
@@ -55,3 +67,83 @@ def test_docker_compose_entrypoint_propagates_exit_code():
         assert docker_compose_entrypoint() == 0
     with patch("notebooker.execute_notebook.sys.argv", ["", "--invalid-arg"]):
         assert docker_compose_entrypoint() != 0
+
+
+def _fake_variant(config, job_id, start_time, report_name, overrides, n_retries, **kwargs):
+    if overrides["ticker"] == "bad":
+        raise ValueError("boom")
+    return "variant failed" if overrides["ticker"] == "error" else None
+
+
+def test_parallel_variants_aggregate_failures_and_send_one_email():
+    config = BaseConfig(SERIALIZER_CLS=DEFAULT_SERIALIZER, SERIALIZER_CONFIG={})
+    with ExitStack() as stack:
+        stack.enter_context(
+            patch(
+                "notebooker.execute_notebook.ProcessPoolExecutor",
+                lambda max_workers, mp_context: ThreadPoolExecutor(max_workers),
+            )
+        )
+        stack.enter_context(patch("notebooker.execute_notebook._run_report_variant", _fake_variant))
+        stack.enter_context(
+            patch("notebooker.execute_notebook.initialise_base_dirs", return_value=("out", "templates", None))
+        )
+        mail = stack.enter_context(patch("notebooker.utils.notebook_execution.mail"))
+        get_serializer = stack.enter_context(patch("notebooker.execute_notebook.get_serializer_from_cls"))
+        with pytest.raises(Exception, match="2 of 4 variants failed"):
+            execute_notebook_entrypoint(
+                config,
+                "report",
+                json.dumps({"ticker": ["a", "bad", "b", "error"]}),
+                "ticker",
+                "",
+                1,
+                "first_job",
+                "to@example.com",
+                "errors@example.com",
+                "",
+                False,
+                False,
+                False,
+                None,
+                None,
+                is_slideshow=False,
+                parallelism=2,
+            )
+    assert mail.call_count == 1
+    _, to_email, subject, _ = mail.call_args[0]
+    assert to_email == "errors@example.com"
+    assert "2 of 4 variants failed" in subject
+    stubs = get_serializer.return_value.save_check_stub.call_args_list
+    assert [kwargs["overrides"] for _, kwargs in stubs] == [{"ticker": "bad"}, {"ticker": "b"}, {"ticker": "error"}]
+    assert {kwargs["status"] for _, kwargs in stubs} == {JobStatus.SUBMITTED}
+    assert "first_job" not in [job_id for (job_id, _), _ in stubs]
+
+
+def test_maintain_job_queue_re_enqueues_orphaned_jobs():
+    config = BaseConfig(SERIALIZER_CLS=DEFAULT_SERIALIZER, SERIALIZER_CONFIG={})
+    job_queue = MagicMock(owner="host:2:new")
+    job_queue.waiting_job_ids.return_value = ["waiting"]
+    orphan = {
+        "job_id": "orphan",
+        "report_name": "report",
+        "overrides": {"a": 1},
+        "queue": {"owner": "host:2:new", "lane": "SCHEDULED", "n_retries": 2, "prepare_only": False},
+    }
+    with patch("notebooker.execute_notebook.initialize_serializer_from_config") as init_serializer, patch(
+        "notebooker.execute_notebook._start_report_execution"
+    ) as start_report_execution:
+        serializer = init_serializer.return_value
+        serializer.adopt_orphaned_queued.return_value = [orphan]
+        maintain_job_queue(config, job_queue)
+
+        serializer.refresh_queued.assert_called_once_with("host:2:new", ["waiting"])
+        (job_id, report_name, start), kwargs = job_queue.submit.call_args
+        assert (job_id, report_name, kwargs["lane"]) == ("orphan", "report", Lane.SCHEDULED)
+        serializer.claim_queued.return_value = True
+        start()
+    serializer.claim_queued.assert_called_once_with("orphan", "host:2:new")
+    args, kwargs = start_report_execution.call_args
+    assert args[2:4] == ("orphan", "report")
+    assert kwargs["n_retries"] == 2
+    assert kwargs["run_synchronously"] is False
@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+from notebooker.job_queue import JobQueue, Lane
+
+
+class _FakeJob(object):
+    """A job which records when it started and runs until it is released."""
+
+    def __init__(self, name, started):
+        self.name = name
+        self.started = started
+        self.release = threading.Event()
+
+    def start(self):
+        self.started.append(self.name)
+        return self.release.wait
+
+
+@pytest.fixture
+def queue():
+    queues = []
+
+    def _make(*args, **kwargs):
+        q = JobQueue(*args, **kwargs)
+        queues.append(q)
+        return q
+
+    yield _make
+    for q in queues:
+        q.stop()
+
+
+def _wait_until(predicate, timeout=5):
+    event = threading.Event()
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        event.wait(0.01)
+    raise AssertionError("Timed out waiting for condition")
+
+
+def test_max_concurrent_jobs(queue):
+    q = queue(1)
+    started = []
+    first, second = _FakeJob("first", started), _FakeJob("second", started)
+    queued_first = q.submit("first", "report", first.start)
+    queued_second = q.submit("second", "report", second.start)
+    _wait_until(lambda: started == ["first"])
+    assert q.is_waiting("second")
+    assert q.depth()[Lane.INTERACTIVE] == 1
+
+    first.release.set()
+    assert queued_first.wait(5)
+    _wait_until(lambda: started == ["first", "second"])
+    assert not q.is_waiting("second")
+    second.release.set()
+    assert queued_second.wait(5)
+    assert q.n_running() == 0
+
+
+def test_interactive_lane_before_scheduled(queue):
+    q = queue(1)
+    started = []
+    blocker = _FakeJob("blocker", started)
+    q.submit("blocker", "report", blocker.start)
+    _wait_until(lambda: started == ["blocker"])
+
+    scheduled, interactive = _FakeJob("scheduled", started), _FakeJob("interactive", started)
+    q.submit("scheduled", "report", scheduled.start, lane=Lane.SCHEDULED)
+    q.submit("interactive", "report", interactive.start, lane=Lane.INTERACTIVE)
+    blocker.release.set()
+    _wait_until(lambda: len(started) == 2)
+    assert started[1] == "interactive"
+    interactive.release.set()
+    _wait_until(lambda: len(started) == 3)
+    scheduled.release.set()
+
+
+def test_per_report_limit_does_not_block_other_reports(queue):
+    q = queue(3, max_per_report=1)
+    started = []
+    jobs = [_FakeJob(name, started) for name in ("a1", "a2", "b1")]
+    q.submit("a1", "report_a", jobs[0].start)
+    q.submit("a2", "report_a", jobs[1].start)
+    q.submit("b1", "report_b", jobs[2].start)
+    _wait_until(lambda: sorted(started) == ["a1", "b1"])
+    assert q.is_waiting("a2")
+
+    jobs[0].release.set()
+    _wait_until(lambda: "a2" in started)
+    for job in jobs:
+        job.release.set()
+
+
+def test_per_user_limit(queue):
+    q = queue(3, max_per_user=1)
+    started = []
+    jobs = [_FakeJob(name, started) for name in ("u1", "u2", "other")]
+    q.submit("u1", "report_a", jobs[0].start, user="user")
+    q.submit("u2", "report_b", jobs[1].start, user="user")
+    q.submit("other", "report_c", jobs[2].start, user="someone_else")
+    _wait_until(lambda: sorted(started) == ["other", "u1"])
+    assert q.is_waiting("u2")
+    for job in jobs:
+        job.release.set()
+
+
+def test_on_tick_sees_waiting_jobs(queue):
+    ticks = []
+    q = queue(1, on_tick=lambda q: ticks.append(sorted(q.waiting_job_ids())), tick_seconds=0.01)
+    started = []
+    first, second = _FakeJob("first", started), _FakeJob("second", started)
+    q.submit("first", "report", first.start)
+    q.submit("second", "report", second.start)
+    _wait_until(lambda: ["second"] in ticks)
+    first.release.set()
+    second.release.set()
@@ -0,0 +1,48 @@
+import mock
+import pytest
+
+from notebooker.settings import WebappConfig
+from notebooker.web.leader_election import LeaderElection
+from notebooker.web.report_hunter import _report_hunter
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+def test_only_one_replica_is_leader(redis_server):
+    first = LeaderElection(fakeredis.FakeRedis(server=redis_server), "task", lease_ms=10000)
+    second = LeaderElection(fakeredis.FakeRedis(server=redis_server), "task", lease_ms=10000)
+    assert first.is_leader()
+    assert not second.is_leader()
+    assert first.is_leader()
+
+    first.release()
+    assert second.is_leader()
+    assert not first.is_leader()
+
+
+def test_leadership_passes_on_when_lease_expires(redis_server):
+    client = fakeredis.FakeRedis(server=redis_server)
+    first = LeaderElection(client, "task", lease_ms=10000)
+    second = LeaderElection(fakeredis.FakeRedis(server=redis_server), "task", lease_ms=10000)
+    assert first.is_leader()
+    client.delete(first.key)  # As if the lease had expired.
+    assert second.is_leader()
+    assert not first.is_leader()
+    # The old leader's release must not remove the new leader's lease.
+    first.release()
+    assert second.is_leader()
+    assert not first.is_leader()
+
+
+def test_report_hunter_does_nothing_unless_leader(redis_server):
+    LeaderElection(fakeredis.FakeRedis(server=redis_server), "report_hunter", lease_ms=30000).is_leader()
+    with mock.patch(
+        "notebooker.web.report_hunter.get_redis_client", return_value=fakeredis.FakeRedis(server=redis_server)
+    ), mock.patch("notebooker.web.report_hunter.initialize_serializer_from_config") as init_serializer:
+        _report_hunter(WebappConfig(), run_once=True)
+    assert not init_serializer.return_value.get_all_results.called
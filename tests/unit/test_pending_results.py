@@ -0,0 +1,84 @@
+import json
+
+import mock
+import pytest
+
+from notebooker.constants import JobStatus
+from notebooker.utils.job_events import JobEvents
+from notebooker.web.routes import pending_results
+
+
+def _parse(events):
+    parsed = []
+    for event in events:
+        fields = dict(line.split(": ", 1) for line in event.strip().split("\n"))
+        parsed.append((fields["event"], fields.get("id"), json.loads(fields["data"])))
+    return parsed
+
+
+@pytest.fixture
+def events():
+    job_events = JobEvents()
+    with mock.patch.object(pending_results, "job_events", job_events), mock.patch.object(
+        pending_results.gevent, "sleep"
+    ) as sleep:
+        yield job_events, sleep
+
+
+def test_status_stream_sends_each_line_once(events):
+    job_events, sleep = events
+    serializer = mock.Mock()
+    serializer.get_status_and_stdout.side_effect = [
+        (JobStatus.PENDING, ["a", "b"], 2),
+        (JobStatus.PENDING, ["c"], 3),
+        (JobStatus.DONE, [], 3),
+    ]
+    sleep.side_effect = lambda _: job_events.publish("job")
+
+    stream = pending_results._job_status_events(serializer, "job", "/results/report/job")
+
+    assert _parse(stream) == [
+        ("stdout", "2", {"lines": ["a", "b"]}),
+        ("status", None, {"status": JobStatus.PENDING.value}),
+        ("stdout", "3", {"lines": ["c"]}),
+        ("status", None, {"status": JobStatus.DONE.value, "results_url": "/results/report/job"}),
+        ("end", None, {}),
+    ]
+    offsets = [kwargs["stdout_offset"] for _, kwargs in serializer.get_status_and_stdout.call_args_list]
+    assert offsets == [0, 2, 3]
+
+
+def test_status_stream_only_reads_the_database_on_changes_or_polls(events):
+    job_events, sleep = events
+    serializer = mock.Mock()
+    serializer.get_status_and_stdout.side_effect = [(JobStatus.PENDING, [], 5), (JobStatus.ERROR, [], 5)]
+
+    with mock.patch.object(pending_results.time, "monotonic", side_effect=[100.0, 100.5, 101.0, 101.5]):
+        stream = pending_results._job_status_events(serializer, "job", "/results/report/job", stdout_offset=5)
+        parsed = _parse(stream)
+
+    assert [event for event, _, _ in parsed] == ["status", "status", "end"]
+    assert sleep.call_count == 3
+    assert serializer.get_status_and_stdout.call_count == 2
+    assert serializer.get_status_and_stdout.call_args[1]["stdout_offset"] == 5
+
+
+def test_status_stream_for_missing_job(events):
+    serializer = mock.Mock()
+    serializer.get_status_and_stdout.return_value = None
+
+    parsed = _parse(pending_results._job_status_events(serializer, "job", "/results/report/job"))
+
+    assert [event for event, _, _ in parsed] == ["status", "end"]
+    assert parsed[0][2]["status"].startswith("Job not found")
+
+
+def test_job_events_forgets_the_oldest_jobs():
+    job_events = JobEvents(max_jobs=2)
+    job_events.publish("a")
+    job_events.publish("b")
+    job_events.publish("a")
+    job_events.publish("c")
+    assert job_events.version("a") == 2
+    assert job_events.version("b") is None
+    assert job_events.version("c") == 1
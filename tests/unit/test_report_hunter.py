@@ -0,0 +1,78 @@
+import datetime
+
+import mock
+import pytest
+from pymongo.errors import OperationFailure
+
+from notebooker.constants import JobStatus, NotebookResultPending
+from notebooker.settings import WebappConfig
+from notebooker.web.report_hunter import ReportHunter
+
+
+@pytest.fixture
+def report_cache():
+    cache = {}
+    with mock.patch(
+        "notebooker.web.report_hunter.get_report_cache", side_effect=lambda name, job_id, **kw: cache.get(job_id)
+    ), mock.patch(
+        "notebooker.web.report_hunter.set_report_cache",
+        side_effect=lambda name, job_id, result, **kw: cache.__setitem__(job_id, result),
+    ):
+        yield cache
+
+
+def _hunter(serializer):
+    return ReportHunter(WebappConfig(), serializer, cache_timeout=120, refresh_period_seconds=0)
+
+
+def test_follow_changes_falls_back_to_polling_without_change_streams():
+    serializer = mock.MagicMock()
+    serializer.watch_results.side_effect = OperationFailure("The $changeStream stage is only supported on replica sets")
+    assert _hunter(serializer).follow_changes(lambda: False) is False
+
+
+def test_follow_changes_caches_changed_results(report_cache):
+    now = datetime.datetime.now()
+    result = NotebookResultPending(job_id="job", report_name="report", job_start_time=now, status=JobStatus.PENDING)
+    serializer = mock.MagicMock()
+    stream = serializer.watch_results.return_value
+    stream.try_next.side_effect = [{"fullDocument": {"job_id": "job"}}, None]
+    serializer.result_from_change.return_value = result
+    hunter = _hunter(serializer)
+
+    assert hunter.follow_changes(mock.Mock(side_effect=[False, True])) is True
+    assert report_cache == {"job": result}
+    assert hunter.resume_token == stream.resume_token
+    serializer.result_from_change.assert_called_once_with({"fullDocument": {"job_id": "job"}})
+
+
+def test_follow_changes_starts_a_new_stream_if_it_cannot_resume(report_cache):
+    serializer = mock.MagicMock()
+    serializer.watch_results.side_effect = [OperationFailure("resume token not found"), mock.MagicMock()]
+    hunter = _hunter(serializer)
+    hunter.resume_token = {"_data": "old"}
+
+    assert hunter.follow_changes(lambda: True) is True
+    assert serializer.watch_results.call_args_list[1][1]["resume_after"] is None
+
+
+def test_hunter_queries_only_metadata(report_cache):
+    serializer = mock.MagicMock()
+    hunter = _hunter(serializer)
+    hunter.time_out_stale_jobs()
+    hunter.poll_updates()
+    pending_call, poll_call = serializer.get_all_results.call_args_list
+    assert pending_call[1]["load_payload"] is False
+    assert pending_call[1]["mongo_filter"]["status"] == {"$in": [JobStatus.SUBMITTED.value, JobStatus.PENDING.value]}
+    assert poll_call == mock.call(since=None, load_stdout=False)
+
+
+def test_hunter_does_not_time_out_jobs_waiting_in_a_job_queue(report_cache):
+    serializer = mock.MagicMock()
+    with mock.patch("notebooker.web.report_hunter.datetime") as dt:
+        dt.datetime.now.return_value = datetime.datetime(2026, 1, 1, 12, 0)
+        dt.timedelta = datetime.timedelta
+        _hunter(serializer).time_out_stale_jobs()
+    mongo_filter = serializer.get_all_results.call_args[1]["mongo_filter"]
+    # A job is only excluded while some process's queue has recorded it as waiting within the submission timeout.
+    assert mongo_filter["queue.heartbeat"] == {"$not": {"$gte": datetime.datetime(2026, 1, 1, 11, 57)}}
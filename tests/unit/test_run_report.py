@@ -27,13 +27,11 @@ This is going to stderr a bit later
         stderr_output = _monitor_stderr(p, "abc123", DEFAULT_SERIALIZER, {})
     assert stderr_output == expected_output
 
-    serializer().update_stdout.assert_has_calls(
-        [
-            mock.call("abc123", new_lines=["This is going to stderr\n"]),
-            mock.call("abc123", new_lines=["This is going to stderr a bit later\n"]),
-            mock.call("abc123", ["This is going to stderr\n", "This is going to stderr a bit later\n"], replace=True),
-        ]
-    )
+    # The first line is flushed by the buffer's timer while the process sleeps, and the second when it exits.
+    assert serializer().update_stdout.call_args_list == [
+        mock.call("abc123", new_lines=["This is going to stderr\n"]),
+        mock.call("abc123", new_lines=["This is going to stderr a bit later\n"]),
+    ]
 
 
 def test_validate_run_params():
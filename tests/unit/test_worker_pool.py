@@ -0,0 +1,133 @@
+import datetime
+
+import mock
+import pytest
+
+from notebooker import worker_pool
+from notebooker.constants import DEFAULT_SERIALIZER, NotebookResultComplete, NotebookResultError
+from notebooker.execute_notebook import run_report_in_subprocess
+from notebooker.settings import BaseConfig
+
+
+@pytest.fixture
+def kernel_state(monkeypatch):
+    kernels = []
+
+    def _start_kernel():
+        km = mock.MagicMock(name="km{}".format(len(kernels)))
+        kernels.append(km)
+        return km
+
+    monkeypatch.setattr(worker_pool, "_start_kernel", _start_kernel)
+    monkeypatch.setattr(worker_pool, "_reset_kernel_namespace", mock.MagicMock())
+    monkeypatch.setattr(worker_pool, "_kernel_manager", None)
+    monkeypatch.setattr(worker_pool, "_kernel_runs", 0)
+    monkeypatch.setattr(worker_pool, "_max_runs_per_kernel", 2)
+    return kernels
+
+
+def test_kernel_reused_until_max_runs(kernel_state):
+    km = worker_pool._checkout_kernel()
+    worker_pool._checkin_kernel(failed=False)
+    assert worker_pool._checkout_kernel() is km
+    worker_pool._reset_kernel_namespace.assert_called_once_with(km)
+
+    worker_pool._checkin_kernel(failed=False)
+    km.shutdown_kernel.assert_called_once_with(now=True)
+    assert worker_pool._checkout_kernel() is kernel_state[1]
+
+
+def test_kernel_recycled_on_failure(kernel_state):
+    km = worker_pool._checkout_kernel()
+    worker_pool._checkin_kernel(failed=True)
+    km.shutdown_kernel.assert_called_once_with(now=True)
+    assert worker_pool._checkout_kernel() is kernel_state[1]
+    assert not worker_pool._reset_kernel_namespace.called
+
+
+def test_dead_kernel_replaced_on_checkout(kernel_state):
+    km = worker_pool._checkout_kernel()
+    km.is_alive.return_value = False
+    assert worker_pool._checkout_kernel() is kernel_state[1]
+
+
+def test_run_report_in_subprocess_uses_worker_pool():
+    config = BaseConfig(SERIALIZER_CLS=DEFAULT_SERIALIZER, SERIALIZER_CONFIG={})
+    pool = mock.MagicMock()
+    with mock.patch("notebooker.execute_notebook.get_worker_pool", return_value=pool), mock.patch(
+        "notebooker.execute_notebook.initialize_serializer_from_config"
+    ), mock.patch("notebooker.execute_notebook.subprocess.Popen") as popen:
+        job_id = run_report_in_subprocess(
+            config, "report", "title", "", "", {"a": 1}, run_synchronously=True, n_retries=0
+        )
+    assert not popen.called
+    args, kwargs = pool.submit.call_args
+    assert args[0] is config
+    assert args[1] == job_id
+    assert isinstance(args[2], datetime.datetime)
+    assert args[3] == "report"
+    assert kwargs["overrides"] == {"a": 1}
+    assert kwargs["n_retries"] == 0
+    pool.submit.return_value.result.assert_called_once_with()
+
+
+def test_execute_job_defers_pdf_and_email(kernel_state):
+    config = BaseConfig(SERIALIZER_CLS=DEFAULT_SERIALIZER, SERIALIZER_CONFIG={}, OUTPUT_DIR="out", TEMPLATE_DIR="tmpl")
+    now = datetime.datetime.now()
+    result = NotebookResultComplete(
+        job_id="job",
+        job_start_time=now,
+        job_finish_time=now,
+        report_name="report",
+        report_title="title",
+        hide_code=True,
+    )
+    with mock.patch("notebooker.execute_notebook.run_report", return_value=result) as run_report, mock.patch(
+        "notebooker.serialization.serialization.initialize_serializer_from_config"
+    ), mock.patch(
+        "notebooker.utils.filesystem.initialise_base_dirs", return_value=("out", "tmpl", None)
+    ), mock.patch(
+        "notebooker.utils.notebook_execution.send_result_email"
+    ) as send_email:
+        pdf_job = worker_pool._execute_job(config, "job", datetime.datetime.now(), "report", 1, defer_pdf=True)
+    assert run_report.call_args[1]["defer_pdf"] is True
+    assert not send_email.called
+    assert pdf_job == worker_pool.PdfJob("job", "out/report/job/report.ipynb", "title", True)
+
+
+def test_render_pdf_attaches_pdf_then_sends_email(tmp_path):
+    config = BaseConfig(SERIALIZER_CLS=DEFAULT_SERIALIZER, SERIALIZER_CONFIG={})
+    ipynb_path = tmp_path / "report.ipynb"
+    ipynb_path.write_text("{}")
+    serializer = mock.MagicMock()
+    with mock.patch(
+        "notebooker.serialization.serialization.initialize_serializer_from_config", return_value=serializer
+    ), mock.patch("notebooker.utils.conversion.ipython_to_pdf", return_value=b"pdf") as to_pdf, mock.patch(
+        "notebooker.utils.notebook_execution.send_result_email"
+    ) as send_email:
+        worker_pool._render_pdf(config, worker_pool.PdfJob("job", str(ipynb_path), "title", False))
+    to_pdf.assert_called_once_with("{}", "title", hide_code=False)
+    serializer.attach_pdf.assert_called_once_with("job", b"pdf")
+    send_email.assert_called_once_with(serializer.get_check_result.return_value, config.DEFAULT_MAILFROM)
+
+
+def test_execute_job_recycles_the_kernel_when_its_attempt_fails_even_if_a_retry_succeeds(kernel_state):
+    config = BaseConfig(SERIALIZER_CLS=DEFAULT_SERIALIZER, SERIALIZER_CONFIG={}, OUTPUT_DIR="out", TEMPLATE_DIR="tmpl")
+    now = datetime.datetime.now()
+    error = NotebookResultError(job_id="job", job_start_time=now, report_name="report")
+    result = NotebookResultComplete(job_id="job", job_start_time=now, job_finish_time=now, report_name="report")
+    with mock.patch("notebooker.execute_notebook.run_report", side_effect=[error, result]) as run_report, mock.patch(
+        "notebooker.serialization.serialization.initialize_serializer_from_config"
+    ), mock.patch(
+        "notebooker.utils.filesystem.initialise_base_dirs", return_value=("out", "tmpl", None)
+    ), mock.patch(
+        "notebooker.utils.notebook_execution.send_result_email"
+    ):
+        worker_pool._execute_job(config, "job", now, "report", 3)
+    (_, first), (_, retry) = run_report.call_args_list
+    assert first["kernel_manager"] is kernel_state[0]
+    assert first["attempts_remaining"] == 0
+    assert "kernel_manager" not in retry
+    assert retry["attempts_remaining"] == 1
+    kernel_state[0].shutdown_kernel.assert_called_once_with(now=True)
+    assert not worker_pool._reset_kernel_namespace.called
@@ -0,0 +1,133 @@
+import mock
+import pytest
+from cachelib.redis import RedisCache
+
+from notebooker.constants import LazyPayload, LazyPayloadDict, NotebookResultComplete
+from notebooker.utils import caching
+
+
+@pytest.fixture
+def two_level_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(caching, "cache", None)
+    monkeypatch.setattr(caching, "memory_cache", caching.MemoryCache(10 * 1024))
+    return str(tmp_path)
+
+
+def test_memory_cache_evicts_least_recently_used_by_size():
+    cache = caching.MemoryCache(2500)
+    cache.set("a", b"a" * 1000, 10)
+    cache.set("b", b"b" * 1000, 10)
+    assert cache.get("a") == b"a" * 1000
+    cache.set("c", b"c" * 1000, 10)
+    assert cache.get("b") is caching._NOT_CACHED
+    assert cache.get("a") == b"a" * 1000
+    assert cache.get("c") == b"c" * 1000
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["bytes"] <= 2500
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (3, 1, 1)
+
+
+def test_memory_cache_skips_values_larger_than_the_cache():
+    cache = caching.MemoryCache(100)
+    cache.set("a", b"a" * 1000, 10)
+    assert cache.get("a") is caching._NOT_CACHED
+    assert cache.stats()["bytes"] == 0
+
+
+def test_memory_cache_entries_expire():
+    cache = caching.MemoryCache(1024)
+    with mock.patch("notebooker.utils.caching.time.time", return_value=1000):
+        cache.set("a", "value", 15)
+    with mock.patch("notebooker.utils.caching.time.time", return_value=1014):
+        assert cache.get("a") == "value"
+    with mock.patch("notebooker.utils.caching.time.time", return_value=1016):
+        assert cache.get("a") is caching._NOT_CACHED
+    assert cache.stats()["bytes"] == 0
+
+
+def test_get_cache_is_served_from_memory_after_set(two_level_cache):
+    caching.set_cache("key", {"a": 1}, cache_dir=two_level_cache)
+    with mock.patch.object(caching.cache, "get") as file_get:
+        assert caching.get_cache("key", cache_dir=two_level_cache) == {"a": 1}
+    assert not file_get.called
+
+
+def test_get_cache_fills_memory_from_file_cache(two_level_cache):
+    caching.set_cache("key", [1, 2], cache_dir=two_level_cache)
+    caching.memory_cache.clear()
+    assert caching.get_cache("key", cache_dir=two_level_cache) == [1, 2]
+    with mock.patch.object(caching.cache, "get") as file_get:
+        assert caching.get_cache("key", cache_dir=two_level_cache) == [1, 2]
+    assert not file_get.called
+
+
+def test_get_cache_remembers_misses_until_set(two_level_cache):
+    assert caching.get_cache("missing", cache_dir=two_level_cache) is None
+    with mock.patch.object(caching.cache, "get") as file_get:
+        assert caching.get_cache("missing", cache_dir=two_level_cache) is None
+    assert not file_get.called
+    caching.set_cache("missing", "now here", cache_dir=two_level_cache)
+    assert caching.get_cache("missing", cache_dir=two_level_cache) == "now here"
+
+
+def test_memory_cache_serves_values_without_unpickling(two_level_cache):
+    value = {"a": [1, 2]}
+    caching.set_cache("key", value, cache_dir=two_level_cache)
+    with mock.patch("notebooker.utils.caching.pickle") as pickle:
+        assert caching.get_cache("key", cache_dir=two_level_cache) is value
+    assert not pickle.loads.called
+
+
+class _FakePayload(LazyPayload):
+    def load(self):
+        return "x" * 1000
+
+
+def test_loading_the_payload_of_a_cached_result_does_not_change_it(two_level_cache):
+    result = NotebookResultComplete(
+        job_id="job",
+        job_start_time=None,
+        job_finish_time=None,
+        report_name="report",
+        raw_html=_FakePayload(),
+        raw_html_resources=LazyPayloadDict({"outputs": LazyPayloadDict({"a.png": _FakePayload()})}),
+    )
+    caching.set_cache("key", result, cache_dir=two_level_cache)
+    size = caching.memory_cache.stats()["bytes"]
+    assert result.raw_html == "x" * 1000
+
+    served = caching.get_cache("key", cache_dir=two_level_cache)
+    assert served.raw_html == "x" * 1000
+    assert served.raw_html_resources["outputs"]["a.png"] == "x" * 1000
+
+    cached = caching.get_cache("key", cache_dir=two_level_cache)
+    assert not cached.is_loaded("raw_html")
+    assert isinstance(cached.raw_html_resources["outputs"]._data["a.png"], LazyPayload)
+    assert caching.memory_cache.stats()["bytes"] == size
+
+
+def test_redis_backend_is_shared_between_replicas(monkeypatch, tmp_path):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(caching.redis.Redis, "from_url", lambda url: fakeredis.FakeRedis(server=server))
+    monkeypatch.setattr(caching, "cache", None)
+    monkeypatch.setattr(caching, "memory_cache", None)
+    monkeypatch.setattr(caching, "redis_client", None)
+
+    caching.configure_cache("redis", 1, redis_url="redis://localhost:6379/0")
+    caching.set_cache("key", {"a": 1})
+    other_replica = RedisCache(host=fakeredis.FakeRedis(server=server), key_prefix=caching.REDIS_KEY_PREFIX)
+    assert other_replica.get("key") == {"a": 1}
+    other_replica.set("other", 2)
+    assert caching.get_cache("other") == 2
+    assert caching.get_redis_client() is not None
+
+    caching.configure_cache("filesystem", 1)
+    assert caching.get_redis_client() is None
+
+
+def test_redis_backend_requires_url(monkeypatch):
+    monkeypatch.setattr(caching, "memory_cache", None)
+    with pytest.raises(ValueError, match="requires a Redis URL"):
+        caching.configure_cache("redis", 1)
@@ -0,0 +1,29 @@
+import mock
+
+from notebooker.utils import cleanup
+
+
+def test_delete_old_reports_deletes_in_batches():
+    serializer = mock.Mock()
+    serializer.get_job_ids_older_than.return_value = [f"job{i}" for i in range(5)]
+    serializer.delete_results.side_effect = lambda ids, dry_run: {"deleted_job_ids": ids, "gridfs_filenames": []}
+    config = mock.Mock(SERIALIZER_CONFIG={})
+
+    with mock.patch.object(cleanup, "get_serializer_from_cls", return_value=serializer):
+        cleanup.delete_old_reports(config, days_cutoff=30, report_name=None, dry_run=False, batch_size=2, workers=2)
+
+    batches = sorted(c[0][0] for c in serializer.delete_results.call_args_list)
+    assert batches == [["job0", "job1"], ["job2", "job3"], ["job4"]]
+    assert not serializer.delete_result.called
+
+
+def test_delete_old_reports_carries_on_after_a_failed_batch():
+    serializer = mock.Mock()
+    serializer.get_job_ids_older_than.return_value = ["job0", "job1"]
+    serializer.delete_results.side_effect = [Exception("boom"), {"deleted_job_ids": ["job1"], "gridfs_filenames": []}]
+    config = mock.Mock(SERIALIZER_CONFIG={})
+
+    with mock.patch.object(cleanup, "get_serializer_from_cls", return_value=serializer):
+        cleanup.delete_old_reports(config, days_cutoff=30, report_name=None, dry_run=False, batch_size=1, workers=1)
+
+    assert serializer.delete_results.call_count == 2
@@ -1,3 +1,4 @@
+import base64
 import json
 import os
 import shutil
@@ -6,6 +7,7 @@ import uuid
 
 import pytest
 import mock
+import nbformat
 from click.testing import CliRunner
 
 from notebooker import convert_to_py
@@ -63,3 +65,56 @@ def test_generate_py_from_ipynb():
     finally:
         shutil.rmtree(ipynb_dir)
         shutil.rmtree(py_dir)
+
+
+def _executed_notebook():
+    png = base64.b64encode(b"\x89PNG\r\n\x1a\n" + b"0" * 32).decode()
+    return nbformat.v4.new_notebook(
+        cells=[
+            nbformat.v4.new_code_cell(
+                "print('hi')",
+                execution_count=1,
+                outputs=[nbformat.v4.new_output("stream", name="stdout", text="hi\n")],
+            ),
+            nbformat.v4.new_code_cell(
+                "plot()",
+                execution_count=2,
+                outputs=[nbformat.v4.new_output("display_data", data={"image/png": png, "text/plain": "<Figure>"})],
+            ),
+        ]
+    )
+
+
+@pytest.mark.parametrize("hide_code", [True, False])
+def test_ipython_to_html_variants_matches_separate_renders(tmp_path, hide_code):
+    ipynb_path = str(tmp_path / "executed.ipynb")
+    nbformat.write(_executed_notebook(), ipynb_path)
+    with open(ipynb_path, "r") as f:
+        raw_executed_ipynb = f.read()
+
+    html, resources = conversion.ipython_to_html(ipynb_path, "job_id")
+    email_html, _ = conversion.ipython_to_html(ipynb_path, "job_id", hide_code=hide_code)
+    with mock.patch.object(conversion, "get_exporter", wraps=conversion.get_exporter) as get_exporter:
+        actual_html, actual_email_html, actual_resources = conversion.ipython_to_html_variants(
+            raw_executed_ipynb, "job_id", hide_code=hide_code
+        )
+
+    assert actual_html == html
+    assert actual_email_html == email_html
+    assert actual_resources["outputs"] == resources["outputs"] == {"job_id/resources/output_1_0.png": mock.ANY}
+    assert actual_resources.keys() == resources.keys()
+    assert get_exporter.call_count == (2 if hide_code else 1)
+
+
+def test_exporters_are_reused_without_leaking_resources_between_notebooks(tmp_path):
+    ipynb_path = str(tmp_path / "executed.ipynb")
+    nbformat.write(_executed_notebook(), ipynb_path)
+
+    _, first_resources = conversion.ipython_to_html(ipynb_path, "first_job")
+    with mock.patch.object(conversion, "HTMLExporter") as exporter:
+        _, second_resources = conversion.ipython_to_html(ipynb_path, "second_job")
+    assert not exporter.called
+    assert list(first_resources["outputs"]) == ["first_job/resources/output_1_0.png"]
+    assert list(second_resources["outputs"]) == ["second_job/resources/output_1_0.png"]
+    assert conversion.get_exporter("html", hide_code=True) is conversion.get_exporter("html", hide_code=True)
+    assert conversion.get_exporter("html", hide_code=True) is not conversion.get_exporter("html")
@@ -0,0 +1,33 @@
+import time
+
+import mock
+
+from notebooker.utils.stdout_buffer import StdoutBuffer
+
+
+def test_stdout_is_written_in_batches_of_max_lines():
+    serializer = mock.Mock()
+    on_flush = mock.Mock()
+    with StdoutBuffer(serializer, "job", flush_interval=60, max_lines=3, on_flush=on_flush) as buffer:
+        for i in range(7):
+            buffer.append(f"line {i}\n")
+        assert serializer.update_stdout.call_count == 2
+    assert serializer.update_stdout.call_args_list == [
+        mock.call("job", new_lines=["line 0\n", "line 1\n", "line 2\n"]),
+        mock.call("job", new_lines=["line 3\n", "line 4\n", "line 5\n"]),
+        mock.call("job", new_lines=["line 6\n"]),
+    ]
+    assert on_flush.call_count == 3
+
+
+def test_stdout_is_written_periodically():
+    serializer = mock.Mock()
+    buffer = StdoutBuffer(serializer, "job", flush_interval=0.01, max_lines=500)
+    buffer.append("line\n")
+    deadline = time.time() + 5
+    while not serializer.update_stdout.called and time.time() < deadline:
+        time.sleep(0.01)
+    serializer.update_stdout.assert_called_once_with("job", new_lines=["line\n"])
+
+    buffer.close()
+    assert serializer.update_stdout.call_count == 1